@@ -0,0 +1,202 @@
+import logging
+import os
+import zlib
+from typing import Optional, Set
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Tipos que ya viajan comprimidos (exportaciones, imágenes): no se recomprimen
+_SKIP_MEDIA_TYPES = (
+    "application/gzip",
+    "application/zip",
+    "application/vnd.apache.parquet",
+    "application/vnd.apache.arrow.stream",
+    "image/",
+)
+
+# Calidad de brotli: compromiso entre CPU y tamaño para respuestas dinámicas
+_BROTLI_QUALITY = 4
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él se usa solo gzip
+    brotli = None
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Codificaciones aceptadas según Accept-Encoding (ignora las de q=0)"""
+    accepted = set()
+    for token in accept_encoding.split(","):
+        name, *params = [part.strip() for part in token.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+class _Compressor:
+    """Compresor incremental con la misma interfaz para gzip y brotli"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            output = self._brotli.process(data)
+            return output + (self._brotli.finish() if final else self._brotli.flush())
+        output = self._zlib.compress(data)
+        # Sync flush por chunk: el streaming (NDJSON, columnar) no se retiene
+        return output + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    Compresión de respuestas HTTP (brotli si está disponible y el cliente lo
+    acepta, si no gzip) a partir de un tamaño mínimo.
+
+    No toca respuestas que ya tienen Content-Encoding, rangos parciales (206),
+    respuestas sin cuerpo ni tipos ya comprimidos como las exportaciones gzip.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        level: int = 6,
+        prefer_brotli: bool = True,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.prefer_brotli = prefer_brotli and brotli is not None
+
+    def _select_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = accepted_encodings(accept_encoding)
+        if self.prefer_brotli and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._select_encoding(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.level, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor: Optional[_Compressor] = None
+
+    def _should_skip(self, message: Message) -> bool:
+        if message["status"] in (204, 206, 304) or message["status"] < 200:
+            return True
+        headers = Headers(raw=message["headers"])
+        if "content-encoding" in headers or "content-range" in headers:
+            return True
+        media_type = headers.get("content-type", "")
+        return media_type.startswith(_SKIP_MEDIA_TYPES)
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Retener el inicio hasta conocer el primer chunk del cuerpo
+            self.initial_message = message
+            self.passthrough = self._should_skip(message)
+            return
+        if message_type != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            if self.passthrough or (len(body) < self.minimum_size and not more_body):
+                self.passthrough = True
+                await self._send(self.initial_message)
+                await self._send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding, self.level)
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            compressed = self.compressor.compress(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+            await self._send(self.initial_message)
+            await self._send(
+                {"type": "http.response.body", "body": compressed, "more_body": more_body}
+            )
+            return
+
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        await self._send(
+            {
+                "type": "http.response.body",
+                "body": self.compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            }
+        )
+
+
+def add_compression(app) -> None:
+    """
+    Registrar la compresión según el entorno:
+
+    - API_COMPRESSION: off, gzip o br (brotli con gzip como respaldo; brotli
+      requiere el paquete opcional `brotli`)
+    - API_COMPRESSION_MIN_SIZE: bytes mínimos para comprimir
+    - API_COMPRESSION_LEVEL: nivel de gzip (1-9)
+    """
+    mode = os.getenv("API_COMPRESSION", "br").lower()
+    if mode in ("off", "none", "false", "0"):
+        logger.info("Compresión de respuestas desactivada")
+        return
+
+    if mode == "br" and brotli is None:
+        logger.info("brotli no instalado, se usará solo gzip")
+
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("API_COMPRESSION_MIN_SIZE", "1024")),
+        level=int(os.getenv("API_COMPRESSION_LEVEL", "6")),
+        prefer_brotli=mode == "br",
+    )
@@ -1,22 +1,56 @@
+import asyncio
 import logging
-from datetime import datetime
+import os
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Query
+import yaml
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
 
+from app.api.compression import accepted_encodings
+from app.api.responses import (
+    conditional_json_response,
+    etag_matches,
+    json_response,
+    not_modified,
+)
 from app.api.schemas import (
     CurrentState,
+    ExportJobStatus,
+    ExportQuery,
     HealthResponse,
     HistoricalData,
     HistoricalQuery,
+    IncrementalHistoricalResponse,
     SensorInfo,
     StatisticsQuery,
     StatisticsResponse,
 )
 from app.mqtt.client import mqtt_client
+from app.services.cluster import cluster_coordinator
+from app.services.columnar_service import (
+    DEFAULT_PAGE_SIZE,
+    RawPage,
+    columnar_arrow,
+    columnar_json_stream,
+)
 from app.services.data_service import data_service
-from app.utils.config_loader import get_all_sensors, load_sensors_config
+from app.services.export_jobs import export_job_manager, iter_file, parse_range
+from app.services.export_service import (
+    EXPORT_FORMATS,
+    check_format,
+    export_filename,
+    export_stream,
+    iter_export_rows,
+)
+from app.services.heatmap_service import heatmap_service
+from app.services.history_tail import history_tail
+from app.services.memo import interpolation_memo
+from app.utils.config_loader import get_all_sensors
 from app.utils.influxdb import influxdb_client
+from app.utils.query_cache import query_cache
+from app.utils.sensor_registry import sensor_registry
 from app.websocket.manager import websocket_manager
 
 router = APIRouter()
@@ -24,8 +58,11 @@ logger = logging.getLogger(__name__)
 
 
 @router.get("/sensores", response_model=List[SensorInfo])
-async def get_sensors():
-    """Obtener lista de todos los sensores configurados"""
+async def get_sensors(request: Request):
+    """
+    Obtener lista de todos los sensores configurados. El ETag depende del
+    contenido, así que mientras la configuración no cambie se responde 304.
+    """
     sensors = get_all_sensors()
     result = []
 
@@ -38,23 +75,137 @@ async def get_sensors():
                 longitude=sensor_info["longitude"],
                 location_name=sensor_info["location_name"],
                 micro_name=sensor_info["micro_name"],
-            )
+            ).model_dump()
         )
 
-    return result
+    return conditional_json_response(request, result)
 
 
 @router.get("/ultimos", response_model=CurrentState)
-async def get_last_data():
-    """Obtener los últimos datos en tiempo real"""
-    state = data_service.get_current_state()
-    return CurrentState(**state)
+async def get_last_data(request: Request):
+    """
+    Obtener los últimos datos en tiempo real. Se sirven los bytes ya
+    serializados de la instantánea actual (gzip precalculado si el cliente lo
+    acepta); si no llegaron datos nuevos se responde 304 sin cuerpo.
+    """
+    snapshot = data_service.get_snapshot()
+    if etag_matches(request, snapshot.etag):
+        return not_modified(snapshot.etag)
+
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if "gzip" in accepted_encodings(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        body = snapshot.gzip_bytes
+    else:
+        body = snapshot.json_bytes
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def _heatmap_response(
+    request: Request,
+    view,
+    width: int,
+    height: int,
+    format: str,
+    palette: str,
+    vmin: Optional[float],
+    vmax: Optional[float],
+    opacity: float,
+    clip: bool,
+) -> Response:
+    """Servir una vista del mapa de calor (304 si el cliente ya la tiene)"""
+    try:
+        heatmap_service.validate(format, palette)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    idw_data = data_service.current_idw_data
+    version = data_service.idw_version
+    if not idw_data:
+        raise HTTPException(status_code=404, detail="No hay interpolación disponible")
+
+    key, etag = heatmap_service.prepare(
+        version, idw_data, view, width, height, format, palette, vmin, vmax,
+        opacity, clip,
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    image = await heatmap_service.render(key, etag, idw_data)
+    return Response(
+        image.body,
+        media_type=image.media_type,
+        headers={
+            "ETag": image.etag,
+            "Cache-Control": "no-cache",
+            "X-Heatmap-Min-Db": f"{image.vmin:.2f}",
+            "X-Heatmap-Max-Db": f"{image.vmax:.2f}",
+        },
+    )
+
+
+@router.get("/heatmap")
+async def get_heatmap(
+    request: Request,
+    width: int = Query(512, ge=16),
+    format: str = "png",
+    palette: str = "viridis",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    opacity: float = Query(1.0, ge=0.0, le=1.0),
+    clip: bool = True,
+):
+    """
+    Mapa de calor del plano completo renderizado en el servidor (PNG o WebP).
+    La escala en dB es la de toda la grilla salvo que se fije con vmin/vmax,
+    y se informa en los headers X-Heatmap-Min-Db / X-Heatmap-Max-Db.
+    """
+    view, width, height = heatmap_service.full_view(width)
+    return await _heatmap_response(
+        request, view, width, height, format, palette, vmin, vmax, opacity, clip
+    )
+
+
+@router.get("/heatmap/tiles/{z}/{x}/{y}")
+async def get_heatmap_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    format: str = "png",
+    palette: str = "viridis",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    opacity: float = Query(1.0, ge=0.0, le=1.0),
+    clip: bool = True,
+):
+    """Tile z/x/y del mapa de calor (HEATMAP_TILE_SIZE píxeles por lado)"""
+    try:
+        view = heatmap_service.tile_view(z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    size = heatmap_service.tile_size
+    return await _heatmap_response(
+        request, view, size, size, format, palette, vmin, vmax, opacity, clip
+    )
 
 
 @router.post("/historicos", response_model=List[HistoricalData])
 async def get_historical_data(query: HistoricalQuery):
-    """Obtener datos históricos desde InfluxDB"""
+    """
+    Obtener datos históricos desde InfluxDB. La ventana usada (puede ser más
+    ancha que la pedida con INFLUXDB_MAX_POINTS) va en X-Aggregation-Window.
+    """
     try:
+        window = influxdb_client.effective_window(
+            query.start_time,
+            query.end_time or datetime.now(),
+            query.aggregation_window,
+        )
         data = influxdb_client.query_historical_data(
             start_time=query.start_time,
             end_time=query.end_time,
@@ -67,15 +218,67 @@ async def get_historical_data(query: HistoricalQuery):
                 status_code=404, detail="No se encontraron datos históricos"
             )
 
-        return [HistoricalData(**item) for item in data]
+        # Filas generadas por el servidor: se serializan sin re-validar
+        return json_response(data, headers={"X-Aggregation-Window": window})
 
     except Exception as e:
         logger.error(f"Error obteniendo datos históricos: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
+@router.post("/historicos/stream")
+async def stream_historical_data(query: HistoricalQuery):
+    """
+    Obtener datos históricos como NDJSON en orden temporal, ejecutando la
+    consulta en paralelo por grupos de micros y tramos de tiempo.
+    Pensado para reportes grandes con muchos sensores.
+
+    Un error antes de la primera fila responde 502; si falla un tramo a mitad
+    del stream, la última línea es {"error": "..."} y el stream se corta.
+    """
+    import json
+
+    from fastapi.responses import StreamingResponse
+    from starlette.concurrency import run_in_threadpool
+
+    end_time = query.end_time if query.end_time else datetime.now()
+    window = influxdb_client.effective_window(
+        query.start_time, end_time, query.aggregation_window
+    )
+    rows = influxdb_client.iter_historical_data(
+        start_time=query.start_time,
+        end_time=end_time,
+        micro_ids=query.micro_ids,
+        aggregation_window=query.aggregation_window,
+    )
+    try:
+        first = await run_in_threadpool(next, rows, None)
+    except Exception as e:
+        logger.error(f"Error en stream histórico: {e}")
+        raise HTTPException(status_code=502, detail=f"Error consultando InfluxDB: {e}")
+
+    def generate_rows():
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        try:
+            for row in rows:
+                yield json.dumps(row) + "\n"
+        except Exception as e:
+            logger.error(f"Error en stream histórico: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(
+        generate_rows(),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no", "X-Aggregation-Window": window},
+    )
+
+
 @router.get("/historicos/recientes", response_model=List[HistoricalData])
-async def get_recent_historical_data(hours: int = Query(5, ge=1, le=2160)):
+async def get_recent_historical_data(
+    request: Request, hours: int = Query(5, ge=1, le=2160)
+):
     """Obtener datos históricos recientes (últimas N horas)"""
     try:
         data = influxdb_client.get_recent_data(hours=hours)
@@ -85,13 +288,71 @@ async def get_recent_historical_data(hours: int = Query(5, ge=1, le=2160)):
                 status_code=404, detail="No se encontraron datos recientes"
             )
 
-        return [HistoricalData(**item) for item in data]
+        return conditional_json_response(request, data)
 
     except Exception as e:
         logger.error(f"Error obteniendo datos recientes: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
+@router.get("/historicos/incremental", response_model=IncrementalHistoricalResponse)
+async def get_incremental_historical_data(
+    since: Optional[datetime] = Query(
+        None, description="Cursor devuelto por la consulta anterior (ISO 8601)"
+    ),
+    hours: int = Query(5, ge=1, le=2160),
+    micro_ids: Optional[List[str]] = Query(None),
+):
+    """
+    Obtener solo los buckets nuevos desde `since` más la revisión del bucket
+    abierto. Sin `since` devuelve las últimas N horas. Se responde desde la cola
+    en memoria cuando la cubre; si no, desde InfluxDB.
+    """
+    if since is None:
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    elif since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    if history_tail.covers(since):
+        return {**history_tail.since(since, micro_ids), "source": "memory"}
+
+    try:
+        data = influxdb_client.query_historical_data(
+            start_time=since,
+            micro_ids=micro_ids,
+            aggregation_window=history_tail.window,
+        )
+    except Exception as e:
+        logger.error(f"Error obteniendo datos incrementales: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    # InfluxDB sella la fila parcial del último bucket con el fin de la
+    # consulta (≈ ahora, sin alinear): esa fila es la revisión del bucket
+    # abierto, con su fin alineado. El cursor solo avanza a fines alineados
+    # de buckets cerrados.
+    now_ts = datetime.now(timezone.utc).timestamp()
+    buckets = []
+    open_buckets = []
+    cursor = since
+    for item in sorted(data, key=lambda r: r["time"]):
+        item_time = datetime.fromisoformat(item["time"])
+        stop = item_time.timestamp()
+        if not history_tail.is_closed_stop(stop, now_ts):
+            aligned = datetime.fromtimestamp(history_tail.aligned_stop(stop), timezone.utc)
+            open_buckets.append({**item, "time": aligned.isoformat()})
+        elif item_time > since:
+            buckets.append(item)
+            cursor = max(cursor, item_time)
+
+    return {
+        "window": history_tail.window,
+        "cursor": cursor.isoformat(),
+        "buckets": buckets,
+        "open_buckets": open_buckets,
+        "source": "influxdb",
+    }
+
+
 @router.get("/estadisticas/{micro_id}", response_model=StatisticsResponse)
 async def get_sensor_statistics_get(
     micro_id: str,
@@ -217,105 +478,138 @@ async def get_sensor_statistics_post(
 async def get_sensor_raw_data(
     micro_id: str,
     query: StatisticsQuery,
+    format: str = Query("json", description="json (columnar) o arrow"),
+    cursor: Optional[str] = Query(
+        None, description="Cursor de continuación devuelto por la página anterior"
+    ),
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=500000),
 ):
     """
-    Obtener datos RAW (sin agregación) para un micro específico.
-    Útil para exportar datos crudos para análisis.
+    Obtener datos RAW (sin agregación) para un micro específico en formato
+    columnar: metadatos una sola vez y arreglos paralelos de tiempos (epoch ms),
+    samples y valores, emitidos en streaming.
 
-    Limitado a máximo 50000 registros para evitar sobrecarga.
+    Las páginas se encadenan con `next_cursor`. Con format=arrow se devuelve un
+    Arrow IPC stream y el cursor viaja en la cabecera X-Next-Cursor.
     """
-    try:
-        start_time = query.start_time
-        end_time = query.end_time if query.end_time else datetime.now()
+    from fastapi.responses import StreamingResponse
 
-        logger.info(
-            f"Raw data request: micro_id={micro_id}, start={start_time}, end={end_time}"
-        )
+    end_time = query.end_time if query.end_time else datetime.now()
 
-        raw_data = influxdb_client.query_raw_data(
-            start_time=start_time,
-            end_time=end_time,
-            micro_ids=[micro_id],
-            limit=50000,
+    logger.info(
+        f"Raw data request: micro_id={micro_id}, start={query.start_time}, "
+        f"end={end_time}, cursor={cursor}, format={format}"
+    )
+
+    try:
+        page = RawPage(micro_id, query.start_time, end_time, page_size, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    if format == "arrow":
+        try:
+            body, info = await asyncio.to_thread(columnar_arrow, page)
+        except Exception as e:
+            logger.error(f"Error obteniendo datos raw: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        headers = {"X-Record-Count": str(info["count"])}
+        if info["next_cursor"]:
+            headers["X-Next-Cursor"] = info["next_cursor"]
+        return Response(
+            body, media_type="application/vnd.apache.arrow.stream", headers=headers
         )
 
-        logger.info(f"Raw data returned: {len(raw_data)} registros")
-
-        return {
-            "micro_id": micro_id,
-            "count": len(raw_data),
-            "start_time": start_time.isoformat()
-            if hasattr(start_time, "isoformat")
-            else str(start_time),
-            "end_time": end_time.isoformat()
-            if hasattr(end_time, "isoformat")
-            else str(end_time),
-            "data": raw_data,
-        }
-    except Exception as e:
-        logger.error(f"Error obteniendo datos raw: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format}")
 
+    return StreamingResponse(
+        columnar_json_stream(page),
+        media_type="application/json",
+        headers={"X-Accel-Buffering": "no"},
+    )
 
-@router.get("/export/csv/{micro_id}")
-async def export_sensor_csv(
-    micro_id: str,
-    hours: int = Query(24, ge=1, le=8760),
+
+async def _export_response(
+    export_format: str,
+    start_time: datetime,
+    end_time: datetime,
+    micro_ids: Optional[List[str]],
+    aggregation_window: Optional[str] = None,
+    gzip: bool = False,
+    require_data: bool = False,
 ):
     """
-    Exportar datos de un sensor como CSV.
-    Útil para descargar directamente desde el navegador.
+    Construir la respuesta en streaming de una exportación. Con
+    require_data se lee la primera fila antes de responder y, si no hay
+    datos, se responde 404 en lugar de un archivo vacío.
     """
-    import csv
-    import io
+    from itertools import chain
 
     from fastapi.responses import StreamingResponse
+    from starlette.concurrency import run_in_threadpool
 
     try:
-        stats = influxdb_client.get_sensor_statistics(micro_id=micro_id, hours=hours)
-
-        if not stats or not stats.get("data_points"):
+        check_format(export_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows = None
+    if require_data:
+        rows = iter_export_rows(start_time, end_time, micro_ids, aggregation_window)
+        try:
+            first = await run_in_threadpool(next, rows, None)
+        except Exception as e:
+            logger.error(f"Error exportando: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if first is None:
             raise HTTPException(status_code=404, detail="No hay datos para exportar")
+        rows = chain([first], rows)
 
-        # Generar CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Header
-        writer.writerow(
-            ["Timestamp", "Micro ID", "Ubicacion", "Nivel (dB)", "Latitud", "Longitud"]
-        )
-
-        # Datos
-        for point in stats["data_points"]:
-            writer.writerow(
-                [
-                    point.get("time", ""),
-                    point.get("micro_id", ""),
-                    point.get("location_name", ""),
-                    point.get("value", 0),
-                    point.get("latitude", 0),
-                    point.get("longitude", 0),
-                ]
-            )
-
-        output.seek(0)
+    filename = export_filename(export_format, micro_ids, start_time, end_time, gzip)
+    media_type = (
+        "application/gzip" if gzip else EXPORT_FORMATS[export_format]["media_type"]
+    )
 
-        filename = (
-            f"sensor_{micro_id}_{hours}h_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        )
+    return StreamingResponse(
+        export_stream(
+            export_format,
+            start_time=start_time,
+            end_time=end_time,
+            micro_ids=micro_ids,
+            aggregation_window=aggregation_window,
+            gzip=gzip,
+            rows=rows,
+        ),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        },
+    )
 
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"},
-        )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error exportando CSV: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+@router.get("/export/csv/{micro_id}")
+async def export_sensor_csv(
+    micro_id: str,
+    hours: int = Query(24, ge=1, le=8760),
+):
+    """
+    Exportar datos de un sensor como CSV (agregados por minuto).
+    Útil para descargar directamente desde el navegador.
+    """
+    end_time = datetime.now()
+    start_time = end_time - timedelta(hours=hours)
+
+    logger.info(f"CSV export request: micro_id={micro_id}, hours={hours}")
+
+    return await _export_response(
+        "csv",
+        start_time,
+        end_time,
+        [micro_id],
+        aggregation_window="1m",
+        require_data=True,
+    )
 
 
 @router.post("/export/csv/{micro_id}")
@@ -324,103 +618,121 @@ async def export_sensor_csv_range(
     query: StatisticsQuery,
 ):
     """
-    Exportar datos de un sensor como CSV usando streaming.
+    Exportar datos RAW de un sensor como CSV usando streaming.
     Soporta volúmenes grandes de datos sin límite.
     """
-    import csv
-    import io
+    end_time = query.end_time if query.end_time else datetime.now()
 
-    from fastapi.responses import StreamingResponse
+    logger.info(
+        f"CSV export request (streaming): micro_id={micro_id}, start={query.start_time}, end={end_time}"
+    )
+
+    return await _export_response("csv", query.start_time, end_time, [micro_id])
+
+
+@router.post("/export")
+async def export_data(query: ExportQuery):
+    """
+    Exportar datos de uno o varios micros en streaming (CSV, NDJSON, Parquet o
+    Arrow IPC), opcionalmente comprimidos con gzip. La memoria usada es
+    constante independientemente del volumen exportado.
+    """
+    end_time = query.end_time if query.end_time else datetime.now()
+
+    logger.info(
+        f"Export request: format={query.format}, micro_ids={query.micro_ids}, "
+        f"start={query.start_time}, end={end_time}, gzip={query.gzip}"
+    )
 
+    return await _export_response(
+        query.format,
+        query.start_time,
+        end_time,
+        query.micro_ids,
+        aggregation_window=query.aggregation_window,
+        gzip=query.gzip,
+    )
+
+
+@router.post("/export/jobs", response_model=ExportJobStatus)
+async def create_export_job(query: ExportQuery):
+    """
+    Crear una exportación en segundo plano. El archivo se genera comprimido en
+    disco y se descarga después con soporte de reanudación (HTTP Range).
+    Trabajos con parámetros idénticos se deduplican.
+    """
+    params = {
+        "format": query.format,
+        "start_time": query.start_time.isoformat(),
+        "end_time": query.end_time.isoformat() if query.end_time else None,
+        "micro_ids": query.micro_ids,
+        "aggregation_window": query.aggregation_window,
+    }
     try:
-        start_time = query.start_time
-        end_time = query.end_time if query.end_time else datetime.now()
+        job = export_job_manager.submit(params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
 
-        logger.info(
-            f"CSV export request (streaming): micro_id={micro_id}, start={start_time}, end={end_time}"
-        )
 
-        def generate_csv():
-            """Generator que va leyendo datos y enviándolos en chunks"""
-            output = io.StringIO()
-            writer = csv.writer(output)
-
-            # Header
-            writer.writerow(
-                [
-                    "Timestamp",
-                    "Micro ID",
-                    "Ubicacion",
-                    "Nivel (dB)",
-                    "Latitud",
-                    "Longitud",
-                ]
-            )
-            yield output.getvalue()
-            output.seek(0)
-            output.truncate(0)
-
-            # Streaming de datos - leer en batches de 10000
-            batch_size = 10000
-            offset = 0
-
-            while True:
-                batch_data = influxdb_client.query_raw_data_paged(
-                    start_time=start_time,
-                    end_time=end_time,
-                    micro_ids=[micro_id],
-                    limit=batch_size,
-                    offset=offset,
-                )
-
-                if not batch_data:
-                    break
-
-                for point in batch_data:
-                    writer.writerow(
-                        [
-                            point.get("time", ""),
-                            point.get("micro_id", ""),
-                            point.get("location_name", ""),
-                            point.get("value", 0),
-                            point.get("latitude", 0),
-                            point.get("longitude", 0),
-                        ]
-                    )
-
-                yield output.getvalue()
-                output.seek(0)
-                output.truncate(0)
-                offset += batch_size
-
-                logger.info(f"CSV streaming: enviado batch offset={offset}")
-
-            logger.info(f"CSV streaming completado")
-
-        start_str = (
-            start_time.strftime("%Y%m%d")
-            if hasattr(start_time, "strftime")
-            else str(start_time)[:10]
-        )
-        end_str = (
-            end_time.strftime("%Y%m%d")
-            if hasattr(end_time, "strftime")
-            else str(end_time)[:10]
+@router.get("/export/jobs/{job_id}", response_model=ExportJobStatus)
+async def get_export_job(job_id: str):
+    """Consultar el estado de una exportación en segundo plano"""
+    job = export_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return job.to_dict()
+
+
+@router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, request: Request):
+    """Descargar el archivo de una exportación completada (admite Range)"""
+    from fastapi.responses import StreamingResponse
+
+    job = export_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    if job.status != "completed":
+        raise HTTPException(
+            status_code=409, detail=f"Exportación no disponible (estado: {job.status})"
         )
-        filename = f"sensor_{micro_id}_{start_str}_to_{end_str}.csv"
-
-        return StreamingResponse(
-            generate_csv(),
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "X-Accel-Buffering": "no",  # Disable nginx buffering
-            },
+
+    size = os.path.getsize(job.path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": job.etag,
+        "Content-Disposition": f"attachment; filename={job.filename}",
+    }
+
+    # If-Range: si el archivo cambió, se envía completo
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != job.etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            detail="Rango no satisfacible",
+            headers={"Content-Range": f"bytes */{size}"},
         )
 
-    except Exception as e:
-        logger.error(f"Error exportando CSV: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        iter_file(job.path, start, end),
+        status_code=status_code,
+        media_type="application/gzip",
+        headers=headers,
+    )
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -431,31 +743,57 @@ async def health_check():
         timestamp=datetime.now().isoformat(),
         mqtt_connected=mqtt_client.connected,
         websocket_clients=len(websocket_manager.active_connections),
-        sensor_count=len(data_service.sensor_data),
+        sensor_count=len(data_service.sensors),
     )
 
 
-@router.post("/config/reload")
-async def reload_config():
-    """Recargar configuración de sensores desde disco"""
-    try:
-        from app.utils.config_loader import _config_cache, _config_last_loaded
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Métricas de los caches (consultas, memo de interpolaciones, mapa de calor)"""
+    return {
+        **query_cache.stats(),
+        "interpolation_memo": interpolation_memo.stats(),
+        "heatmap": heatmap_service.stats(),
+    }
+
 
-        _config_cache = None
-        _config_last_loaded = 0
+@router.get("/cluster")
+async def get_cluster_status():
+    """Rol de esta réplica (líder/seguidora) y métricas de replicación"""
+    return cluster_coordinator.stats()
 
-        config = load_sensors_config()
 
-        return {
-            "status": "success",
-            "message": "Configuración recargada correctamente",
-            "timestamp": datetime.now().isoformat(),
-            "sensor_count": len(
-                config.get("sensores", config.get("microcontrollers", {}))
-            ),
-        }
+@router.post("/config/reload")
+async def reload_config():
+    """
+    Recargar la configuración de sensores desde disco. El archivo se valida
+    completo antes de instalarlo: si no es válido se responde 422 y se
+    conserva la configuración vigente. Al instalarlo se invalidan en un solo
+    paso los caches que dependen de ella y se espera el recálculo.
+    """
+    try:
+        candidate = await asyncio.to_thread(sensor_registry.read_candidate, True)
+    except (ValueError, yaml.YAMLError) as e:
+        raise HTTPException(status_code=422, detail=f"Configuración inválida: {e}")
     except Exception as e:
-        logger.error(f"Error recargando configuración: {e}")
+        logger.error(f"Error leyendo configuración: {e}")
         raise HTTPException(
             status_code=500, detail=f"Error recargando configuración: {str(e)}"
         )
+    if candidate is None:
+        raise HTTPException(
+            status_code=404, detail="No se encontró el archivo de configuración"
+        )
+
+    snapshot = sensor_registry.install(candidate)
+    if data_service.reload_task is not None:
+        await data_service.reload_task
+
+    return {
+        "status": "success",
+        "message": "Configuración recargada correctamente",
+        "timestamp": datetime.now().isoformat(),
+        "sensor_count": len(snapshot),
+        "version": snapshot.version,
+        "layout_version": data_service.sensors.layout_version,
+    }
@@ -0,0 +1,88 @@
+import hashlib
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def json_response(
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Serializar directamente con orjson datos generados por el servidor.
+
+    Evita construir un modelo Pydantic por fila y la segunda validación del
+    response_model; el esquema sigue documentado en el decorador de la ruta.
+    """
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def make_etag(value: Any) -> str:
+    """ETag débil a partir de una versión, clave de cache o contenido"""
+    if isinstance(value, bytes):
+        digest = hashlib.blake2b(value, digest_size=12).hexdigest()
+    else:
+        digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparación débil de If-None-Match con el ETag actual"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    current = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == current:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+
+def conditional_json_response(
+    request: Request,
+    content: Any,
+    etag: Optional[str] = None,
+) -> Response:
+    """
+    Respuesta JSON con ETag y soporte de GET condicional.
+
+    Si no se indica `etag` (derivado de una versión o clave de cache), se
+    calcula a partir del cuerpo serializado. Cuando el cliente ya tiene esa
+    versión (If-None-Match) se responde 304 sin cuerpo. `content` puede ser
+    una función para no construir el contenido si la respuesta es 304.
+    """
+    if etag is not None and etag_matches(request, etag):
+        return not_modified(etag)
+
+    if callable(content):
+        content = content()
+    body = orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    if etag is None:
+        etag = make_etag(body)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
@@ -26,6 +26,7 @@ class SensorValue(BaseModel):
     longitude: float
     location_name: str
     last_update: str
+    stale: bool = Field(False, description="Sin lecturas dentro del TTL")
 
 
 class HistoricalQuery(BaseModel):
@@ -57,6 +58,20 @@ class HistoricalData(BaseModel):
     longitude: float
 
 
+class IncrementalHistoricalResponse(BaseModel):
+    """Datos históricos incrementales desde un cursor"""
+
+    window: str
+    cursor: str = Field(..., description="Cursor para la siguiente consulta (since)")
+    buckets: List[HistoricalData] = Field(
+        ..., description="Buckets cerrados posteriores al cursor"
+    )
+    open_buckets: List[HistoricalData] = Field(
+        ..., description="Revisión actual del bucket abierto de cada micro"
+    )
+    source: str = Field(..., description="memory o influxdb")
+
+
 class IDWData(BaseModel):
     """Datos de interpolación IDW"""
 
@@ -70,6 +85,17 @@ class IDWData(BaseModel):
     calculated_at: str
 
 
+class SoundSource(BaseModel):
+    """Fuente sonora estimada (modo de fuentes múltiples)"""
+
+    id: int = Field(..., description="Id estable entre ciclos")
+    latitude: float
+    longitude: float
+    level: float = Field(..., description="dB estimados a 1 baldosa de la fuente")
+    zone_type: str = "circle"
+    zone_radius: Optional[float] = None  # baldosas, región del 95%
+
+
 class EpicenterData(BaseModel):
     """Datos de epicentro"""
 
@@ -88,6 +114,10 @@ class EpicenterData(BaseModel):
     zone_center_latitude: Optional[float] = None
     zone_center_longitude: Optional[float] = None
     zone_vertices: Optional[List[List[float]]] = None  # [[lat, lon], ...]
+    # Localización por modelo de atenuación
+    confidence_radius: Optional[float] = None  # baldosas, región del 95%
+    source_level: Optional[float] = None  # dB estimados a 1 baldosa de la fuente
+    sources: Optional[List[SoundSource]] = None  # fuentes simultáneas
 
 
 class CurrentState(BaseModel):
@@ -115,6 +145,37 @@ class StatisticsQuery(BaseModel):
     )
 
 
+class ExportQuery(BaseModel):
+    """Parámetros para exportación de datos"""
+
+    start_time: datetime = Field(..., description="Tiempo de inicio (ISO 8601)")
+    end_time: Optional[datetime] = Field(
+        None, description="Tiempo de fin (ISO 8601), default ahora"
+    )
+    micro_ids: Optional[List[str]] = Field(
+        None, description="Lista de micro IDs a exportar (default: todos)"
+    )
+    format: str = Field("csv", description="csv, ndjson, parquet o arrow")
+    aggregation_window: Optional[str] = Field(
+        None, description="Ventana de agregación (None = datos crudos)"
+    )
+    gzip: bool = Field(False, description="Comprimir la salida con gzip")
+
+
+class ExportJobStatus(BaseModel):
+    """Estado de una exportación en segundo plano"""
+
+    job_id: str
+    status: str  # pending, running, completed, failed
+    params: Dict[str, Any]
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    bytes_written: int
+    filename: str
+    error: Optional[str] = None
+
+
 class StatisticsResponse(BaseModel):
     """Estadísticas de un sensor"""
 
@@ -129,6 +190,7 @@ class StatisticsResponse(BaseModel):
     start_time: Optional[str] = None
     end_time: Optional[str] = None
     aggregation_window: Optional[str] = None
+    preview_window: Optional[str] = None  # ventana de data_points
 
 
 class HealthResponse(BaseModel):
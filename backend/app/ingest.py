@@ -0,0 +1,81 @@
+"""
+Workers de ingesta MQTT en procesos separados.
+
+Cada proceso se suscribe con una suscripción compartida
+(`$share/MQTT_SHARED_GROUP/tópico`, grupo "ingest" por defecto), parsea y
+promedia los mensajes que el broker le asigna y publica las lecturas por
+Redis. El backend con INGEST_SOURCE=redis las aplica en la etapa de cálculo.
+
+Uso (desde backend/):
+    python -m app.ingest --processes 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("app.ingest")
+
+
+async def run_worker():
+    from app.mqtt.client import MQTTClient
+    from app.mqtt.relay import readings_relay
+
+    client = MQTTClient(handler=readings_relay.forward)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await client.connect()
+    logger.info(f"Worker de ingesta {os.getpid()} en marcha")
+    await stop.wait()
+    await client.disconnect()
+    await readings_relay.close()
+    logger.info(
+        f"Worker de ingesta {os.getpid()} detenido: {client.metrics}, "
+        f"{readings_relay.metrics}"
+    )
+
+
+def worker_main():
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # Sin grupo compartido cada proceso recibiría todos los mensajes
+    os.environ.setdefault("MQTT_SHARED_GROUP", "ingest")
+    asyncio.run(run_worker())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        worker_main()
+        return
+
+    processes = [
+        multiprocessing.Process(target=worker_main, name=f"ingest-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
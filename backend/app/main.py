@@ -25,6 +25,16 @@ app = FastAPI(
 
 # Tarea para broadcast periódico
 periodic_broadcast_task = None
+# Tarea de revisión de sensores vencidos
+expiry_task = None
+# Tarea que vigila cambios en sensores.yaml
+config_watch_task = None
+# Tarea que aplica lecturas de los workers de ingesta (INGEST_SOURCE=redis)
+relay_task = None
+
+# Origen de las lecturas: "mqtt" (este proceso consume el broker) o "redis"
+# (workers `python -m app.ingest` publican las lecturas ya parseadas)
+INGEST_SOURCE = os.getenv("INGEST_SOURCE", "mqtt").lower()
 
 # Configurar CORS
 app.add_middleware(
@@ -33,29 +43,92 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Ventana efectiva de /historicos, legible desde el navegador
+    expose_headers=["X-Aggregation-Window"],
 )
 
+# Comprimir respuestas grandes (históricos, grillas IDW)
+from app.api.compression import add_compression
+
+add_compression(app)
+
 # Importar routers y manejadores
 from app.api.endpoints import router as api_router
 from app.mqtt.client import mqtt_client
+from app.mqtt.relay import readings_relay
+from app.services.cluster import cluster_coordinator
+from app.services.data_service import data_service
+from app.services.history_tail import history_tail
+from app.utils.influxdb import influxdb_client
+from app.utils.sensor_registry import sensor_registry
 from app.websocket.manager import websocket_manager
 
 # Incluir router de API
 app.include_router(api_router, prefix="/api")
 
 
+async def start_ingest():
+    """Ingesta y cálculo: MQTT, cola histórica y vencimiento de sensores"""
+    if INGEST_SOURCE == "redis":
+        global relay_task
+        relay_task = asyncio.create_task(readings_relay.consume())
+    else:
+        # Conectar a MQTT
+        try:
+            await mqtt_client.connect()
+            logger.info("Conectado a broker MQTT")
+        except Exception as e:
+            logger.error(f"Error conectando a MQTT: {e}")
+
+    # Precargar la cola histórica en memoria (una consulta a InfluxDB)
+    asyncio.create_task(asyncio.to_thread(history_tail.seed_from_influx))
+
+    # Marcar sensores sin lecturas dentro del TTL como offline
+    global expiry_task
+    expiry_task = asyncio.create_task(data_service.run_expiry_checks())
+
+
+async def stop_ingest():
+    """Detener la ingesta (al dejar de ser líder en modo cluster)"""
+    global expiry_task
+    if expiry_task:
+        expiry_task.cancel()
+        expiry_task = None
+
+    global relay_task
+    if relay_task:
+        relay_task.cancel()
+        relay_task = None
+
+    try:
+        await mqtt_client.disconnect()
+    except Exception as e:
+        logger.error(f"Error desconectando de MQTT: {e}")
+
+    # La cola ya no recibe lecturas: las consultas vuelven a InfluxDB
+    history_tail.clear()
+
+
 # Eventos de inicio y apagado
 @app.on_event("startup")
 async def startup_event():
     """Inicializar servicios al arrancar la aplicación"""
     logger.info("Iniciando servicios...")
 
-    # Conectar a MQTT
+    # Preparar rollups de InfluxDB (buckets + tareas), si están habilitados
     try:
-        await mqtt_client.connect()
-        logger.info("Conectado a broker MQTT")
+        await asyncio.to_thread(influxdb_client.ensure_rollups)
     except Exception as e:
-        logger.error(f"Error conectando a MQTT: {e}")
+        logger.error(f"Error preparando rollups de InfluxDB: {e}")
+
+    if cluster_coordinator.enabled:
+        # Solo el líder elegido consume MQTT y calcula; el resto sirve las
+        # instantáneas que publica
+        cluster_coordinator.on_promote(start_ingest)
+        cluster_coordinator.on_demote(stop_ingest)
+        await cluster_coordinator.start()
+    else:
+        await start_ingest()
 
     # Iniciar broadcast periódico
     global periodic_broadcast_task
@@ -64,6 +137,10 @@ async def startup_event():
     )
     logger.info("Broadcast periódico iniciado (cada 5 segundos)")
 
+    # Recargar sensores.yaml solo cuando cambie en disco
+    global config_watch_task
+    config_watch_task = asyncio.create_task(sensor_registry.watch())
+
     # Iniciar tareas en segundo plano si es necesario
     # ...
 
@@ -83,6 +160,22 @@ async def shutdown_event():
             pass
         logger.info("Broadcast periódico cancelado")
 
+    global expiry_task
+    if expiry_task:
+        expiry_task.cancel()
+
+    global config_watch_task
+    if config_watch_task:
+        config_watch_task.cancel()
+
+    global relay_task
+    if relay_task:
+        relay_task.cancel()
+
+    # Liberar el liderazgo para que otra réplica lo tome sin esperar el lease
+    if cluster_coordinator.enabled:
+        await cluster_coordinator.stop()
+
     # Desconectar de MQTT
     try:
         await mqtt_client.disconnect()
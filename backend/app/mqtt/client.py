@@ -1,7 +1,8 @@
 import asyncio
 import json
 import logging
-from typing import Optional
+import zlib
+from typing import Awaitable, Callable, List, Optional
 import os
 from aiomqtt import Client, MqttError
 
@@ -10,17 +11,62 @@ from app.mqtt.handler import handle_mqtt_message
 logger = logging.getLogger(__name__)
 
 class MQTTClient:
-    """Cliente MQTT para suscribirse a EMQX"""
-    
-    def __init__(self):
+    """
+    Cliente MQTT para suscribirse a EMQX.
+
+    MQTT_TOPIC acepta varios tópicos separados por coma (con comodines, ej.
+    `sensores/+/ruido` para un tópico por gateway o edificio). Con
+    MQTT_SHARED_GROUP la suscripción es compartida (`$share/grupo/tópico`):
+    el broker reparte los mensajes entre todos los procesos del grupo.
+    Dentro del proceso, con MQTT_INGEST_WORKERS > 1 los mensajes se reparten
+    en colas por partición (el nivel MQTT_PARTITION_LEVEL del tópico, o el
+    tópico completo), así cada gateway conserva su orden y uno lento no
+    frena a los demás.
+    """
+
+    def __init__(
+        self,
+        handler: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ):
         self.broker = os.getenv("MQTT_BROKER", "localhost")
         self.port = int(os.getenv("MQTT_PORT", "1883"))
-        self.topic = os.getenv("MQTT_TOPIC", "sensores/ruido")
+        self.topics = [
+            topic.strip()
+            for topic in os.getenv("MQTT_TOPIC", "sensores/ruido").split(",")
+            if topic.strip()
+        ]
+        self.topic = self.topics[0]
+        self.shared_group = os.getenv("MQTT_SHARED_GROUP") or None
+        self.workers = max(1, int(os.getenv("MQTT_INGEST_WORKERS", "1")))
+        level = os.getenv("MQTT_PARTITION_LEVEL")
+        self.partition_level = int(level) if level else None
+        self.queue_size = int(os.getenv("MQTT_QUEUE_SIZE", "1000"))
+        self.handler = handler or handle_mqtt_message
         self.client: Optional[Client] = None
         self.connected = False
-        
+        # False tras disconnect(): no reconectar (p. ej. al dejar de ser líder)
+        self.running = False
+        self._queues: List[asyncio.Queue] = []
+        self._worker_tasks: List[asyncio.Task] = []
+        self.metrics = {"received": 0, "processed": 0, "errors": 0}
+
+    def subscriptions(self) -> List[str]:
+        """Filtros de suscripción (compartidos si hay MQTT_SHARED_GROUP)"""
+        if self.shared_group:
+            return [f"$share/{self.shared_group}/{topic}" for topic in self.topics]
+        return list(self.topics)
+
+    def partition_for(self, topic: str) -> int:
+        """Cola de un tópico (estable entre procesos: crc32 de la clave)"""
+        key = topic
+        if self.partition_level is not None:
+            levels = topic.split("/")
+            if -len(levels) <= self.partition_level < len(levels):
+                key = levels[self.partition_level]
+        return zlib.crc32(key.encode("utf-8")) % self.workers
+
     async def connect(self):
-        """Conectar al broker MQTT y suscribirse al tópico"""
+        """Conectar al broker MQTT y suscribirse a los tópicos"""
         try:
             self.client = Client(
                 hostname=self.broker,
@@ -29,67 +75,113 @@ class MQTTClient:
                 # username=os.getenv("MQTT_USERNAME"),
                 # password=os.getenv("MQTT_PASSWORD"),
             )
-            
+
             await self.client.__aenter__()
-            await self.client.subscribe(self.topic)
+            for subscription in self.subscriptions():
+                await self.client.subscribe(subscription)
             self.connected = True
-            
-            logger.info(f"Conectado a MQTT broker {self.broker}:{self.port}, suscrito a {self.topic}")
-            
+            self.running = True
+
+            logger.info(f"Conectado a MQTT broker {self.broker}:{self.port}, suscrito a {', '.join(self.subscriptions())}")
+
+            self._start_workers()
             # Iniciar loop de recepción de mensajes
             asyncio.create_task(self._message_loop())
-            
+
         except Exception as e:
             logger.error(f"Error conectando a MQTT: {e}")
             raise
-    
+
     async def disconnect(self):
         """Desconectar del broker MQTT"""
+        self.running = False
+        await self._stop_workers()
         if self.client:
             try:
                 await self.client.__aexit__(None, None, None)
+                self.client = None
                 self.connected = False
                 logger.info("Desconectado de MQTT broker")
             except Exception as e:
                 logger.error(f"Error desconectando de MQTT: {e}")
-    
+
+    def _start_workers(self):
+        if self.workers == 1 or self._worker_tasks:
+            return
+        self._queues = [asyncio.Queue(self.queue_size) for _ in range(self.workers)]
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(queue)) for queue in self._queues
+        ]
+        logger.info(f"{self.workers} workers de ingesta MQTT por partición")
+
+    async def _stop_workers(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queues = []
+
+    async def _process(self, topic: str, payload: str):
+        try:
+            await self.handler(topic, payload)
+            self.metrics["processed"] += 1
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"Error procesando mensaje MQTT: {e}")
+
+    async def _worker(self, queue: asyncio.Queue):
+        """Procesar en orden los mensajes de una partición"""
+        while True:
+            topic, payload = await queue.get()
+            try:
+                await self._process(topic, payload)
+            finally:
+                queue.task_done()
+
     async def _message_loop(self):
         """Loop principal para recibir mensajes MQTT"""
         if not self.client:
             return
-        
+
         try:
             async for message in self.client.messages:
                 try:
                     payload = message.payload.decode("utf-8")
-                    topic = message.topic
-                    
+                    topic = message.topic.value
+                    self.metrics["received"] += 1
+
                     logger.debug(f"Mensaje MQTT recibido en {topic}: {payload[:100]}...")
-                    
-                    # Procesar mensaje
-                    await handle_mqtt_message(topic, payload)
-                    
+
+                    if self._queues:
+                        # Esperar si la partición está llena (contrapresión)
+                        await self._queues[self.partition_for(topic)].put(
+                            (topic, payload)
+                        )
+                    else:
+                        # Procesar mensaje
+                        await self._process(topic, payload)
+
                 except UnicodeDecodeError:
                     logger.error("Error decodificando payload MQTT (no UTF-8)")
                 except json.JSONDecodeError as e:
                     logger.error(f"Error parseando JSON del payload: {e}")
                 except Exception as e:
                     logger.error(f"Error procesando mensaje MQTT: {e}")
-                    
+
         except MqttError as e:
             logger.error(f"Error en conexión MQTT: {e}")
             self.connected = False
             # Intentar reconectar después de un tiempo
             await asyncio.sleep(5)
-            if not self.connected:
+            if self.running and not self.connected:
                 logger.info("Intentando reconectar a MQTT...")
                 asyncio.create_task(self._reconnect())
-    
+
     async def _reconnect(self):
         """Intentar reconexión al broker MQTT"""
         max_retries = 10
         retry_delay = 5
-        
+
         for attempt in range(max_retries):
             try:
                 await self.connect()
@@ -98,8 +190,8 @@ class MQTTClient:
             except Exception as e:
                 logger.warning(f"Intento de reconexión {attempt + 1}/{max_retries} fallido: {e}")
                 await asyncio.sleep(retry_delay)
-        
+
         logger.error(f"No se pudo reconectar después de {max_retries} intentos")
 
 # Instancia global del cliente MQTT
-mqtt_client = MQTTClient()
\ No newline at end of file
+mqtt_client = MQTTClient()
@@ -1,17 +1,18 @@
 import json
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 from app.services.data_service import data_service
 from app.websocket.manager import websocket_manager
 
 logger = logging.getLogger(__name__)
 
-async def handle_mqtt_message(topic: str, payload: str):
+def parse_mqtt_payload(payload: str) -> Optional[Tuple[str, Optional[int], Dict[str, float]]]:
     """
-    Procesar mensaje MQTT recibido.
-    
+    Parsear un mensaje MQTT y promediar sus samples por micro (sin estado,
+    se puede hacer en cualquier worker de ingesta).
+
     Formato esperado del payload:
     {
         "message_id": "esp32_000033",
@@ -22,60 +23,75 @@ async def handle_mqtt_message(topic: str, payload: str):
             ...
         ]
     }
+
+    Returns:
+        Tupla (message_id, timestamp, {micro_id: promedio}) o None si el
+        mensaje no tiene sensores
+    """
+    data = json.loads(payload)
+
+    # Validar estructura básica
+    if "sensors" not in data:
+        logger.warning(f"Mensaje MQTT sin campo 'sensors': {data}")
+        return None
+
+    message_id = data.get("message_id", "unknown")
+    timestamp = data.get("timestamp")
+
+    logger.info(f"Procesando mensaje {message_id} con {len(data['sensors'])} sensores")
+
+    # Agrupar valores por micro_id (ignorar sample)
+    micro_values = {}
+    micro_counts = {}
+
+    for sensor in data["sensors"]:
+        micro_id = sensor.get("micro_id")
+        value = sensor.get("value")
+        sample = sensor.get("sample")  # Ignorado pero validado
+
+        if micro_id is None or value is None or sample is None:
+            logger.warning(f"Sensor con campos faltantes: {sensor}")
+            continue
+
+        # Acumular para promedio
+        if micro_id not in micro_values:
+            micro_values[micro_id] = 0.0
+            micro_counts[micro_id] = 0
+
+        micro_values[micro_id] += float(value)
+        micro_counts[micro_id] += 1
+
+    readings = {
+        micro_id: total / micro_counts[micro_id]
+        for micro_id, total in micro_values.items()
+    }
+    for micro_id, avg_value in readings.items():
+        logger.debug(f"Micro {micro_id}: {micro_counts[micro_id]} samples, promedio {avg_value:.2f} dB")
+    return message_id, timestamp, readings
+
+async def apply_readings(readings: Dict[str, float], timestamp: Optional[int] = None):
     """
+    Etapa de cálculo: aplicar las lecturas promediadas de un mensaje (o de
+    un lote de un worker de ingesta) con una sola revisión de recálculo.
+    """
+    if not readings:
+        return
+    await data_service.update_sensor_values(readings, timestamp)
+
+    # Notificar a clientes WebSocket sobre la actualización
+    # (el servicio de datos manejará cuándo enviar actualizaciones completas)
+    await websocket_manager.broadcast_update()
+
+async def handle_mqtt_message(topic: str, payload: str):
+    """Procesar mensaje MQTT recibido (parseo + aplicación en este proceso)"""
     try:
-        data = json.loads(payload)
-        
-        # Validar estructura básica
-        if "sensors" not in data:
-            logger.warning(f"Mensaje MQTT sin campo 'sensors': {data}")
+        parsed = parse_mqtt_payload(payload)
+        if parsed is None:
             return
-        
-        message_id = data.get("message_id", "unknown")
-        timestamp = data.get("timestamp")
-        
-        logger.info(f"Procesando mensaje {message_id} con {len(data['sensors'])} sensores")
-        
-        # Agrupar valores por micro_id (ignorar sample)
-        micro_values = {}
-        micro_counts = {}
-        
-        for sensor in data["sensors"]:
-            micro_id = sensor.get("micro_id")
-            value = sensor.get("value")
-            sample = sensor.get("sample")  # Ignorado pero validado
-            
-            if micro_id is None or value is None or sample is None:
-                logger.warning(f"Sensor con campos faltantes: {sensor}")
-                continue
-            
-            # Acumular para promedio
-            if micro_id not in micro_values:
-                micro_values[micro_id] = 0.0
-                micro_counts[micro_id] = 0
-            
-            micro_values[micro_id] += float(value)
-            micro_counts[micro_id] += 1
-        
-        # Actualizar cada micro con el valor promedio
-        for micro_id, total in micro_values.items():
-            count = micro_counts[micro_id]
-            avg_value = total / count
-            
-            # Actualizar en servicio de datos (ignora sample)
-            await data_service.update_sensor_value(
-                micro_id=micro_id,
-                value=avg_value,
-                timestamp=timestamp
-            )
-            
-            logger.debug(f"Micro {micro_id}: {count} samples, promedio {avg_value:.2f} dB")
-        
-        # Notificar a clientes WebSocket sobre la actualización
-        # (el servicio de datos manejará cuándo enviar actualizaciones completas)
-        await websocket_manager.broadcast_update()
-        
+        _, timestamp, readings = parsed
+        await apply_readings(readings, timestamp)
+
     except json.JSONDecodeError as e:
         logger.error(f"Error decodificando JSON: {e}, payload: {payload[:100]}")
     except Exception as e:
-        logger.error(f"Error procesando mensaje MQTT: {e}")
\ No newline at end of file
+        logger.error(f"Error procesando mensaje MQTT: {e}")
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from app.mqtt.handler import apply_readings, parse_mqtt_payload
+
+logger = logging.getLogger(__name__)
+
+
+class ReadingsRelay:
+    """
+    Puente por Redis pub/sub entre los workers de ingesta (`python -m
+    app.ingest`) y la etapa de cálculo.
+
+    Cada worker parsea y promedia sus mensajes MQTT (suscripción compartida
+    o tópicos de su edificio) y publica solo las lecturas por micro; el
+    proceso que calcula (el líder en modo cluster) las aplica en orden de
+    llegada. Así el parseo escala con procesos y el estado se combina en un
+    único lugar.
+
+    Los workers acumulan los mensajes y los publican en un pipeline cuando
+    se juntan INGEST_RELAY_BATCH o pasan INGEST_RELAY_FLUSH_MS desde el
+    primero pendiente (un viaje a Redis por lote en vez de por mensaje).
+    """
+
+    def __init__(self):
+        self.redis_url = os.getenv(
+            "INGEST_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379")
+        )
+        self.channel = f"{os.getenv('CLUSTER_KEY_PREFIX', 'ruido')}:readings"
+        self.batch_size = int(os.getenv("INGEST_RELAY_BATCH", "100"))
+        self.flush_interval = float(os.getenv("INGEST_RELAY_FLUSH_MS", "20")) / 1000
+        self._redis = None
+        self._pending: List[bytes] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Los lotes se publican de a uno para conservar el orden de llegada
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.metrics = {"forwarded": 0, "applied": 0, "batches": 0, "errors": 0}
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.Redis.from_url(
+                self.redis_url, socket_timeout=2.0, socket_connect_timeout=2.0
+            )
+        return self._redis
+
+    async def forward(self, topic: str, payload: str):
+        """Handler MQTT de los workers: parsear y encolar las lecturas"""
+        parsed = parse_mqtt_payload(payload)
+        if parsed is None:
+            return
+        message_id, timestamp, readings = parsed
+        if not readings:
+            return
+        self._pending.append(
+            orjson.dumps(
+                {
+                    "topic": topic,
+                    "message_id": message_id,
+                    "timestamp": timestamp,
+                    "readings": readings,
+                }
+            )
+        )
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Publicar los mensajes pendientes en un solo pipeline"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                pipe = self._client().pipeline(transaction=False)
+                for message in batch:
+                    pipe.publish(self.channel, message)
+                await pipe.execute()
+                self.metrics["forwarded"] += len(batch)
+                self.metrics["batches"] += 1
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logger.error(f"Error publicando {len(batch)} lecturas de ingesta: {e}")
+
+    async def _apply(self, data: Dict[str, Any]):
+        await apply_readings(data["readings"], data.get("timestamp"))
+        self.metrics["applied"] += 1
+
+    async def consume(self):
+        """Aplicar en este proceso las lecturas publicadas por los workers"""
+        logger.info(f"Recibiendo lecturas de workers de ingesta por {self.channel}")
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._client().pubsub()
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await self._apply(orjson.loads(message["data"]))
+                    except Exception as e:
+                        self.metrics["errors"] += 1
+                        logger.error(f"Error aplicando lecturas de ingesta: {e}")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logger.warning(f"Suscripción a lecturas interrumpida: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    async def close(self):
+        # Publicar lo pendiente antes de cancelar el temporizador, para no
+        # cortar un pipeline en curso
+        await self.flush()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._redis is not None:
+            try:
+                await self._redis.close()
+            except Exception:
+                pass
+            self._redis = None
+
+
+# Instancia global del puente de lecturas
+readings_relay = ReadingsRelay()
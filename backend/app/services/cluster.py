@@ -0,0 +1,447 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from app.services.data_service import data_service
+from app.services.state_snapshot import StateSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Renovar el lease solo si sigue siendo nuestro (atómico en Redis)
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Liberar el lease solo si sigue siendo nuestro
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Tomar el lease si está libre y abrir una época nueva (token de fencing)
+_ACQUIRE_SCRIPT = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('incr', KEYS[2])
+end
+return 0
+"""
+
+# Guardar y publicar el estado solo si el lease sigue siendo nuestro; sin
+# payload solo se renueva el TTL de la última instantánea guardada
+_PUBLISH_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('pexpire', KEYS[2], ARGV[2])
+else
+    redis.call('set', KEYS[2], ARGV[3], 'PX', ARGV[2])
+    redis.call('publish', ARGV[4], ARGV[3])
+end
+return 1
+"""
+
+
+class ClusterCoordinator:
+    """
+    Escalado horizontal con varias réplicas del backend (CLUSTER_MODE=cluster).
+
+    Una sola réplica es líder: tiene el lease en Redis (SET NX PX, renovado
+    cada tercio del lease), consume MQTT, calcula IDW/epicentro y publica
+    cada versión nueva del estado por pub/sub (cuerpo gzip de la
+    instantánea). Las demás réplicas son seguidoras sin estado propio:
+    instalan las instantáneas recibidas y las sirven por HTTP y WebSocket.
+
+    Si el líder cae o pierde Redis, deja de renovar y su lease expira; otra
+    réplica lo toma, adopta la última instantánea publicada y sigue
+    numerando versiones a partir de ella. Cada renovación está acotada por
+    lo que queda del lease menos CLUSTER_LEASE_MARGIN_MS, y el líder se
+    degrada por su cuenta al llegar a ese límite.
+
+    Nunca hay dos líderes publicando: la publicación es un script que
+    comprueba en Redis que el lease sigue siendo del nodo, y cada instantánea
+    lleva la época del líder (INCR al tomar el lease). Las réplicas descartan
+    instantáneas de épocas anteriores a la ya instalada. Un líder viejo puede
+    seguir consumiendo MQTT hasta degradarse, pero lo que calcula no se
+    publica.
+    """
+
+    def __init__(self):
+        self.mode = os.getenv("CLUSTER_MODE", "standalone").lower()
+        self.enabled = self.mode == "cluster"
+        self.redis_url = os.getenv(
+            "CLUSTER_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379")
+        )
+        self.prefix = os.getenv("CLUSTER_KEY_PREFIX", "ruido")
+        self.lease_ms = int(os.getenv("CLUSTER_LEASE_MS", "6000"))
+        # Margen antes del vencimiento del lease en que el líder se degrada
+        self.lease_margin_ms = int(
+            os.getenv("CLUSTER_LEASE_MARGIN_MS", str(self.lease_ms // 5))
+        )
+        self.publish_interval = float(os.getenv("CLUSTER_PUBLISH_INTERVAL", "0.5"))
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self.leader_key = f"{self.prefix}:leader"
+        self.epoch_key = f"{self.prefix}:epoch"
+        self.state_key = f"{self.prefix}:state"
+        self.state_channel = f"{self.prefix}:state"
+        self.events_channel = f"{self.prefix}:events"
+
+        self.is_leader = False
+        # Época del liderazgo actual (token de fencing)
+        self.epoch: Optional[int] = None
+        self._redis = None
+        self._tasks: List[asyncio.Task] = []
+        # Instante (monotónico) en que vence el lease según la última renovación
+        self._lease_deadline = 0.0
+        self._published_version: Optional[int] = None
+        # (época, versión) de la última instantánea instalada
+        self._installed: Optional[Tuple[int, int]] = None
+        self._promote_listeners: List[Callable[[], Awaitable[None]]] = []
+        self._demote_listeners: List[Callable[[], Awaitable[None]]] = []
+        self.metrics = {
+            "elections_won": 0,
+            "demotions": 0,
+            "published": 0,
+            "installed": 0,
+            "redis_errors": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def on_promote(self, callback: Callable[[], Awaitable[None]]):
+        """Registrar un callback async al asumir el liderazgo (iniciar ingesta)"""
+        self._promote_listeners.append(callback)
+
+    def on_demote(self, callback: Callable[[], Awaitable[None]]):
+        """Registrar un callback async al perder el liderazgo (detener ingesta)"""
+        self._demote_listeners.append(callback)
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.Redis.from_url(
+                self.redis_url, socket_timeout=2.0, socket_connect_timeout=2.0
+            )
+        return self._redis
+
+    async def start(self):
+        """Iniciar elección, publicación y suscripción"""
+        logger.info(f"Modo cluster: nodo {self.node_id}, Redis {self.redis_url}")
+        data_service.replica = True
+        await self._bootstrap()
+        self._tasks = [
+            asyncio.create_task(self._election_loop()),
+            asyncio.create_task(self._publish_loop()),
+            asyncio.create_task(self._subscribe_loop()),
+        ]
+        data_service.on_sensor_status(self._publish_status)
+
+    async def stop(self):
+        """Detener las tareas y liberar el lease para un failover inmediato"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.is_leader:
+            try:
+                await self._client().eval(
+                    _RELEASE_SCRIPT, 1, self.leader_key, self.node_id
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo liberar el liderazgo: {e}")
+            await self._demote()
+        if self._redis is not None:
+            try:
+                await self._redis.close()
+            except Exception:
+                pass
+            self._redis = None
+
+    # ------------------------------------------------------------------
+    # Elección de líder
+    # ------------------------------------------------------------------
+
+    def _lease_remaining(self) -> float:
+        """Segundos hasta el límite de degradación (vencimiento menos margen)"""
+        return self._lease_deadline - time.monotonic() - self.lease_margin_ms / 1000
+
+    async def _election_loop(self):
+        interval = self.lease_ms / 3000
+        while True:
+            try:
+                await self._election_step()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error en la elección de líder: {e}")
+            delay = interval
+            if self.is_leader:
+                # Despertar a tiempo para degradarse antes de que venza el lease
+                delay = max(min(interval, self._lease_remaining()), 0.01)
+            await asyncio.sleep(delay)
+
+    async def _election_step(self):
+        client = self._client()
+        if self.is_leader:
+            remaining = self._lease_remaining()
+            if remaining <= 0:
+                logger.error("Lease sin renovar a tiempo: dejando el liderazgo")
+                await self._demote()
+                return
+            sent_at = time.monotonic()
+            try:
+                renewed = await asyncio.wait_for(
+                    client.eval(
+                        _RENEW_SCRIPT, 1, self.leader_key, self.node_id, self.lease_ms
+                    ),
+                    timeout=remaining,
+                )
+            except asyncio.TimeoutError:
+                self.metrics["redis_errors"] += 1
+                logger.error("Renovación del lease sin respuesta: dejando el liderazgo")
+                await self._demote()
+                return
+            except Exception as e:
+                # Se reintenta; el bucle se despierta antes del límite
+                self.metrics["redis_errors"] += 1
+                logger.warning(f"Error en Redis renovando el liderazgo: {e}")
+                return
+            if renewed:
+                # El lease pudo renovarse en cualquier momento tras el envío
+                self._lease_deadline = sent_at + self.lease_ms / 1000
+            else:
+                logger.warning("Liderazgo perdido: el lease pertenece a otro nodo")
+                await self._demote()
+            return
+
+        sent_at = time.monotonic()
+        try:
+            epoch = await client.eval(
+                _ACQUIRE_SCRIPT,
+                2,
+                self.leader_key,
+                self.epoch_key,
+                self.node_id,
+                self.lease_ms,
+            )
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.warning(f"Error en Redis durante la elección: {e}")
+            return
+
+        if epoch:
+            self.epoch = int(epoch)
+            self._lease_deadline = sent_at + self.lease_ms / 1000
+            await self._promote()
+
+    async def _promote(self):
+        logger.info(f"Nodo {self.node_id} asume el liderazgo (época {self.epoch})")
+        self.is_leader = True
+        data_service.replica = False
+        self._published_version = None
+        self.metrics["elections_won"] += 1
+        # Continuar desde la última instantánea publicada por el líder anterior
+        latest = await self._fetch_latest()
+        if latest is not None:
+            data_service.adopt_state(latest)
+        for callback in self._promote_listeners:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Error iniciando el rol de líder: {e}")
+
+    async def _demote(self):
+        if not self.is_leader:
+            return
+        logger.info(f"Nodo {self.node_id} deja el liderazgo")
+        self.is_leader = False
+        data_service.replica = True
+        self.metrics["demotions"] += 1
+        for callback in self._demote_listeners:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Error deteniendo el rol de líder: {e}")
+
+    # ------------------------------------------------------------------
+    # Publicación (líder)
+    # ------------------------------------------------------------------
+
+    def _encode(self, snapshot: StateSnapshot) -> bytes:
+        header = orjson.dumps(
+            {
+                "version": snapshot.version,
+                "idw_version": data_service.idw_version,
+                "leader": self.node_id,
+                "epoch": self.epoch,
+            }
+        )
+        return header + b"\n" + snapshot.gzip_bytes
+
+    async def _publish_loop(self):
+        """
+        Publicar cada versión nueva del estado (como máximo una por
+        intervalo). En cada intervalo sin cambios se renueva el TTL de la
+        instantánea guardada, para que no expire mientras el líder vive.
+        """
+        while True:
+            try:
+                await asyncio.sleep(self.publish_interval)
+                if not self.is_leader or self._lease_remaining() <= 0:
+                    continue
+                snapshot = data_service.get_snapshot()
+                payload = b""
+                if snapshot.version != self._published_version:
+                    # gzip de la grilla fuera del loop
+                    payload = await asyncio.to_thread(self._encode, snapshot)
+                # La última versión queda guardada para réplicas que arrancan
+                published = await self._client().eval(
+                    _PUBLISH_SCRIPT,
+                    2,
+                    self.leader_key,
+                    self.state_key,
+                    self.node_id,
+                    self.lease_ms * 10,
+                    payload,
+                    self.state_channel,
+                )
+                if not published:
+                    logger.warning("Liderazgo perdido al publicar: el lease es de otro nodo")
+                    await self._demote()
+                    continue
+                if payload:
+                    self._published_version = snapshot.version
+                    self.metrics["published"] += 1
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.error(f"Error publicando el estado: {e}")
+
+    async def _publish_status(self, event: Dict[str, Any]):
+        """Reenviar los eventos online/offline del líder a las réplicas"""
+        if not self.is_leader or self._lease_remaining() <= 0:
+            return
+        try:
+            await self._client().publish(
+                self.events_channel,
+                orjson.dumps(
+                    {"leader": self.node_id, "epoch": self.epoch, "event": event}
+                ),
+            )
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.warning(f"Error publicando evento de sensor: {e}")
+
+    # ------------------------------------------------------------------
+    # Suscripción (seguidores)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _decode(payload: bytes):
+        header, body = payload.split(b"\n", 1)
+        meta = orjson.loads(header)
+        return meta, StateSnapshot.from_gzip(meta["version"], body)
+
+    async def _fetch_latest(self) -> Optional[StateSnapshot]:
+        try:
+            payload = await self._client().get(self.state_key)
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.warning(f"No se pudo leer la última instantánea: {e}")
+            return None
+        if payload is None:
+            return None
+        return (await asyncio.to_thread(self._decode, payload))[1]
+
+    async def _bootstrap(self):
+        """Instalar la última instantánea publicada (al arrancar o reconectar)"""
+        try:
+            payload = await self._client().get(self.state_key)
+            if payload is not None:
+                await self._install(payload)
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.warning(f"No se pudo leer el estado publicado: {e}")
+
+    async def _install(self, payload: bytes):
+        if self.is_leader:
+            return
+        meta, snapshot = await asyncio.to_thread(self._decode, payload)
+        if self.is_leader or meta["leader"] == self.node_id:
+            return
+        # Épocas anteriores (un líder viejo) y versiones atrasadas o repetidas
+        # (mensajes reordenados)
+        position = (meta.get("epoch") or 0, snapshot.version)
+        if self._installed is not None and position <= self._installed:
+            return
+        data_service.install_remote(snapshot, meta["idw_version"])
+        self._installed = position
+        self.metrics["installed"] += 1
+
+    async def _subscribe_loop(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._client().pubsub()
+                await pubsub.subscribe(self.state_channel, self.events_channel)
+                # Lo publicado mientras no había suscripción
+                await self._bootstrap()
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    if channel == self.state_channel:
+                        await self._install(message["data"])
+                    elif not self.is_leader:
+                        data = orjson.loads(message["data"])
+                        stale = self._installed is not None and (
+                            (data.get("epoch") or 0) < self._installed[0]
+                        )
+                        if data.get("leader") != self.node_id and not stale:
+                            await data_service.emit_status_event(data["event"])
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.warning(f"Suscripción al estado interrumpida: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "mode": self.mode,
+            "node_id": self.node_id,
+            "role": "leader" if self.is_leader else "follower",
+            "epoch": self.epoch if self.is_leader else (
+                self._installed[0] if self._installed else None
+            ),
+            "state_version": data_service.state_version,
+        }
+
+
+# Instancia global del coordinador del cluster
+cluster_coordinator = ClusterCoordinator()
@@ -0,0 +1,182 @@
+import json
+import logging
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.utils.config_loader import get_sensor_coordinates
+from app.utils.influxdb import influxdb_client
+
+logger = logging.getLogger(__name__)
+
+# Registros por página cuando el cliente no indica page_size
+DEFAULT_PAGE_SIZE = 50000
+
+# Valores de tiempo por chunk emitido en el JSON en streaming
+_TIME_CHUNK = 5000
+
+
+def encode_cursor(time_us: int, skip: int) -> str:
+    """Cursor de continuación: microsegundo del último registro y cuántos
+    registros con ese mismo instante ya se entregaron"""
+    return f"{time_us}:{skip}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Interpretar un cursor de continuación (ValueError si es inválido)"""
+    time_us, _, skip = cursor.partition(":")
+    return int(time_us), int(skip or 0)
+
+
+def _to_us(ts: datetime) -> int:
+    return int(ts.timestamp()) * 1_000_000 + ts.microsecond
+
+
+class RawPage:
+    """
+    Página de datos RAW de un micro leída del cursor de InfluxDB.
+
+    Recorre los registros ordenados por (tiempo, sample) desde el cursor y va
+    calculando el cursor de la página siguiente.
+    """
+
+    def __init__(
+        self,
+        micro_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        page_size: int,
+        cursor: Optional[str] = None,
+    ):
+        self.micro_id = micro_id
+        self.end_time = end_time
+        self.page_size = page_size
+        self.skip = 0
+        self.start_time = start_time
+        self._cursor_us: Optional[int] = None
+        if cursor:
+            self._cursor_us, self.skip = decode_cursor(cursor)
+            self.start_time = datetime.fromtimestamp(
+                self._cursor_us // 1_000_000, timezone.utc
+            ) + timedelta(microseconds=self._cursor_us % 1_000_000)
+
+        self.count = 0
+        self.next_cursor: Optional[str] = None
+        self._last_us: Optional[int] = None
+        self._same_instant = 0
+
+    def header(self) -> Dict[str, Any]:
+        """Metadatos comunes a todas las filas (se envían una sola vez)"""
+        lat, lon, location_name = get_sensor_coordinates(self.micro_id)
+        return {
+            "micro_id": self.micro_id,
+            "location_name": location_name,
+            "latitude": lat,
+            "longitude": lon,
+            "measurement": "sonido",
+            "start_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat(),
+            "time_unit": "ms",
+        }
+
+    def rows(self) -> Iterator[Tuple[int, int, float]]:
+        """Recorrer (tiempo_us, sample, valor) de la página"""
+        skipped = 0
+        # Se pide un registro extra para saber si hay página siguiente
+        records = influxdb_client.stream_records(
+            self.start_time,
+            self.end_time,
+            [self.micro_id],
+            time_ordered=True,
+            limit=self.page_size + self.skip + 1,
+        )
+        for ts, _, sample, value in records:
+            time_us = _to_us(ts)
+            # Saltar los registros del instante del cursor ya entregados
+            if skipped < self.skip and time_us == self._cursor_us:
+                skipped += 1
+                continue
+
+            if self.count == self.page_size:
+                delivered = self._same_instant
+                if self._last_us == self._cursor_us:
+                    delivered += self.skip
+                self.next_cursor = encode_cursor(self._last_us, delivered)
+                break
+
+            if time_us == self._last_us:
+                self._same_instant += 1
+            else:
+                self._last_us = time_us
+                self._same_instant = 1
+            self.count += 1
+            yield time_us, sample, value
+
+
+def columnar_json_stream(page: RawPage) -> Iterator[bytes]:
+    """
+    Emitir la página como JSON columnar en streaming: cabecera de metadatos,
+    luego los arreglos paralelos de tiempos (epoch ms), samples y valores, y
+    al final el conteo y el cursor de continuación.
+    """
+    header = json.dumps(page.header())
+    yield (header[:-1] + ', "columns": {"time": [').encode("utf-8")
+
+    samples = array("i")
+    values = array("d")
+    pending = []
+    first = True
+    for time_us, sample, value in page.rows():
+        pending.append(str(time_us // 1000))
+        samples.append(sample)
+        values.append(value)
+        if len(pending) >= _TIME_CHUNK:
+            yield (("" if first else ",") + ",".join(pending)).encode("utf-8")
+            first = False
+            pending = []
+    if pending:
+        yield (("" if first else ",") + ",".join(pending)).encode("utf-8")
+
+    yield b'], "sample": ' + json.dumps(samples.tolist()).encode("utf-8")
+    yield b', "value": ' + json.dumps(values.tolist()).encode("utf-8")
+    footer = {"count": page.count, "next_cursor": page.next_cursor}
+    yield b"}, " + json.dumps(footer)[1:].encode("utf-8")
+
+    logger.info(
+        f"Raw columnar {page.micro_id}: {page.count} registros, "
+        f"siguiente cursor={page.next_cursor}"
+    )
+
+
+def columnar_arrow(page: RawPage) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Construir la página como Arrow IPC stream. Los metadatos van en el
+    esquema; el conteo y el cursor se devuelven para enviarlos en cabeceras.
+    """
+    import pyarrow as pa
+
+    times = array("q")
+    samples = array("i")
+    values = array("d")
+    for time_us, sample, value in page.rows():
+        times.append(time_us)
+        samples.append(sample)
+        values.append(value)
+
+    metadata = {key: str(value) for key, value in page.header().items()}
+    metadata["time_unit"] = "us"
+    table = pa.table(
+        {
+            "time": pa.array(times, type=pa.int64()).cast(pa.timestamp("us", tz="UTC")),
+            "sample": pa.array(samples, type=pa.int32()),
+            "value": pa.array(values, type=pa.float64()),
+        }
+    ).replace_schema_metadata(metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes(), {
+        "count": page.count,
+        "next_cursor": page.next_cursor,
+    }
@@ -1,182 +1,396 @@
 import asyncio
 import logging
+import os
 import time
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 
-from app.services.epicentro_service import calculate_epicenter
+from app.services.epicentro_service import calculate_epicenter, retrack_epicenter
+from app.services.history_tail import history_tail
 from app.services.idw_service import calculate_idw
+from app.services.memo import interpolation_memo
+from app.services.sensor_table import SensorTable
+from app.services.state_snapshot import StateSnapshot, public_state
 from app.utils.config_loader import get_sensor_coordinates
+from app.utils.sensor_registry import RegistrySnapshot, sensor_registry
 
 logger = logging.getLogger(__name__)
 
 
+def _interpolation_size(value) -> int:
+    """Tamaño aproximado en memoria de un resultado (IDW como listas Python)"""
+    idw_data, epicenter = value
+    cells = len(idw_data["zi"]) * len(idw_data["zi"][0]) if idw_data else 0
+    sources = len(epicenter.get("sources") or []) if epicenter else 0
+    # ~32 bytes por float en listas (objeto + puntero) x 3 grillas
+    return cells * 3 * 32 + 2048 + sources * 512
+
+
 class DataService:
     """Servicio para gestionar el estado de los datos de sensores"""
 
     def __init__(self):
-        self.sensor_data: Dict[str, Dict[str, Any]] = {}  # clave: "micro_id"
+        # Lecturas guardadas por sensor (60 = ~5 minutos si llega cada 5s)
+        self.history_capacity = int(os.getenv("SENSOR_HISTORY_CAPACITY", "60"))
+        # Segundos sin lecturas tras los que un sensor pasa a offline
+        self.sensor_ttl = float(os.getenv("SENSOR_TTL_SECONDS", "60"))
+        self.sensors = SensorTable(self.history_capacity, self.sensor_ttl)
+        # Callbacks async para eventos online/offline de sensores
+        self._status_listeners: List[Callable[[Dict[str, Any]], Awaitable[None]]] = []
         self.last_calculation_time = 0
         self.calculation_interval = 2  # segundos entre cálculos de IDW/epicentro
         self.current_idw_data: Optional[Dict[str, Any]] = None
         self.current_epicenter: Optional[Dict[str, Any]] = None
+        # Versión del estado (ETag de /ultimos). Parte del instante de arranque
+        # en ms para no repetir versiones de un proceso anterior
+        self.state_version = int(time.time() * 1000)
+        self._snapshot: Optional[StateSnapshot] = None
+        # Clave de memo del último cálculo publicado
+        self._interpolation_key = None
+        # Versión del estado en que se publicó la grilla IDW actual (caches
+        # que solo dependen de la grilla, como las imágenes del mapa de calor)
+        self.idw_version = self.state_version
+        # Sin arranque en caliente en el próximo cálculo (tras una recarga)
+        self._cold_start = False
+        # Recálculo programado por la última recarga de configuración
+        self.reload_task: Optional[asyncio.Task] = None
+        # Réplica de un cluster: sirve lo instalado desde el líder y no
+        # numera ni reconstruye el estado por su cuenta
+        self.replica = False
 
     async def update_sensor_value(
         self, micro_id: str, value: float, timestamp: Optional[int] = None
     ):
         """Actualizar valor de un sensor (ignora sample)"""
-        sensor_key = micro_id  # Usar solo micro_id como clave
+        await self._apply_reading(micro_id, value, timestamp)
+        await self._maybe_recalculate()
+
+    async def update_sensor_values(
+        self, readings: Dict[str, float], timestamp: Optional[int] = None
+    ):
+        """
+        Actualizar varios sensores (un mensaje o un lote de un worker de
+        ingesta) y revisar el recálculo una sola vez al final.
+        """
+        for micro_id, value in readings.items():
+            await self._apply_reading(micro_id, value, timestamp)
+        await self._maybe_recalculate()
 
+    async def _apply_reading(
+        self, micro_id: str, value: float, timestamp: Optional[int] = None
+    ):
         # Obtener coordenadas (ignorar sample)
         lat, lon, location_name = get_sensor_coordinates(micro_id)
 
-        # Actualizar o crear entrada
-        if sensor_key not in self.sensor_data:
-            self.sensor_data[sensor_key] = {
-                "micro_id": micro_id,
-                "sample": 0,  # Sample fijo 0
-                "latitude": lat,
-                "longitude": lon,
-                "location_name": location_name,
-                "last_value": value,
-                "last_update": datetime.now().isoformat(),
-                "history": [],  # mantener últimos N valores para cálculos
-            }
-
-        self.sensor_data[sensor_key]["last_value"] = value
-        self.sensor_data[sensor_key]["last_update"] = datetime.now().isoformat()
-
-        # Agregar a historial (mantener últimos 60 valores ~5 minutos si llega cada 5s)
-        self.sensor_data[sensor_key]["history"].append(
-            {
-                "value": value,
-                "timestamp": timestamp or int(time.time()),
-                "received_at": datetime.now().isoformat(),
-            }
+        # Actualizar columnas y buffer circular del sensor
+        index, came_online = self.sensors.update(
+            micro_id, value, lat, lon, location_name, timestamp
         )
+        self.state_version += 1
+        if came_online:
+            await self._emit_status(index, "online")
 
-        # Mantener solo últimos 60 valores
-        if len(self.sensor_data[sensor_key]["history"]) > 60:
-            self.sensor_data[sensor_key]["history"] = self.sensor_data[sensor_key][
-                "history"
-            ][-60:]
+        # Acumular en la cola de buckets para consultas incrementales
+        history_tail.add(micro_id, value, lat, lon, location_name)
 
-        logger.debug(f"Sensor {sensor_key} actualizado: {value} dB")
+        logger.debug(f"Sensor {micro_id} actualizado: {value} dB")
 
+    async def _maybe_recalculate(self):
         # Verificar si es tiempo de recalcular IDW/epicentro
         current_time = time.time()
         if current_time - self.last_calculation_time >= self.calculation_interval:
             await self.recalculate_interpolations()
 
+    def on_sensor_status(self, callback: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """Registrar un callback para los eventos online/offline de sensores"""
+        self._status_listeners.append(callback)
+
+    async def _emit_status(self, index: int, status: str):
+        table = self.sensors
+        event = {
+            "micro_id": table.ids[index],
+            "status": status,
+            "last_update": datetime.fromtimestamp(
+                int(table.last_update_ns[index]) / 1e9
+            ).isoformat(),
+        }
+        logger.info(f"Sensor {event['micro_id']} {status}")
+        await self.emit_status_event(event)
+
+    async def emit_status_event(self, event: Dict[str, Any]):
+        """Entregar un evento online/offline a los callbacks registrados"""
+        for callback in self._status_listeners:
+            try:
+                await callback(event)
+            except Exception as e:
+                logger.error(f"Error notificando estado de sensor: {e}")
+
+    async def check_expired(self):
+        """Marcar sensores vencidos y recalcular sin ellos"""
+        if self.replica:
+            return
+        expired = self.sensors.expire()
+        if not expired:
+            return
+        self.state_version += 1
+        for index in expired:
+            await self._emit_status(index, "offline")
+        await self.recalculate_interpolations()
+
+    async def run_expiry_checks(self, interval: float = 1.0):
+        """Revisar vencimientos periódicamente (O(vencidos) por revisión)"""
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.check_expired()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error revisando vencimiento de sensores: {e}")
+
     async def recalculate_interpolations(self):
-        """Recalcular interpolaciones IDW y epicentro"""
-        if len(self.sensor_data) < 2:
+        """Recalcular interpolaciones IDW y epicentro con los sensores vigentes"""
+        table = self.sensors
+        fresh = table.fresh_mask()
+        fresh_count = int(fresh.sum())
+        if fresh_count < 2:
             logger.debug("No hay suficientes sensores para calcular interpolaciones")
+            if fresh_count < len(fresh) and (self.current_idw_data or self.current_epicenter):
+                # Sin sensores vigentes suficientes no se publica un mapa viejo
+                self.current_idw_data = None
+                self.current_epicenter = None
+                self._interpolation_key = None
+                self.state_version += 1
+                self.idw_version = self.state_version
             return
 
         try:
-            # Preparar datos para cálculos
-            x_vals = []
-            y_vals = []
-            z_vals = []
-            sensor_info = []
-
-            for sensor_key, data in self.sensor_data.items():
-                x_vals.append(data["longitude"])
-                y_vals.append(data["latitude"])
-                z_vals.append(data["last_value"])
-                sensor_info.append(
-                    {
-                        "sensor_key": sensor_key,
-                        "micro_id": data["micro_id"],
-                        "sample": data["sample"],
-                        "location_name": data["location_name"],
-                    }
-                )
+            if fresh_count == len(table):
+                # Todos vigentes: vistas de las columnas (sin copiar)
+                x_vals = table.lon
+                y_vals = table.lat
+                z_vals = table.last_value
+                sensor_info = table.info
+            else:
+                x_vals = table.lon[fresh]
+                y_vals = table.lat[fresh]
+                z_vals = table.last_value[fresh]
+                sensor_info = [table.info[i] for i in np.flatnonzero(fresh)]
 
-            # Calcular IDW
-            idw_result = calculate_idw(
-                x=np.array(x_vals), y=np.array(y_vals), z=np.array(z_vals), grid_size=50
+            # Misma geometría y niveles dentro de la resolución del memo:
+            # se reutiliza el resultado sin recalcular
+            key = interpolation_memo.make_key(
+                table.layout_version, z_vals, fresh.tobytes(), sensor_registry.version
             )
-
-            if idw_result:
-                self.current_idw_data = {
-                    "xi": idw_result["xi"].tolist(),
-                    "yi": idw_result["yi"].tolist(),
-                    "zi": idw_result["zi"].tolist(),
-                    "x_min": float(idw_result["x_min"]),
-                    "x_max": float(idw_result["x_max"]),
-                    "y_min": float(idw_result["y_min"]),
-                    "y_max": float(idw_result["y_max"]),
-                    "calculated_at": datetime.now().isoformat(),
-                }
-
-            # Calcular epicentro extendido
-            epicenter_result = calculate_epicenter(
-                x=np.array(x_vals),
-                y=np.array(y_vals),
-                z=np.array(z_vals),
-                sensor_info=sensor_info,
+            (idw_data, epicenter), hit = interpolation_memo.get_or_compute(
+                key,
+                lambda: self._compute_interpolations(
+                    x_vals, y_vals, z_vals, sensor_info
+                ),
+                size_of=_interpolation_size,
             )
-
-            if epicenter_result:
-                # Usar el resultado completo con todos los campos extendidos
-                self.current_epicenter = epicenter_result
-                # Asegurar que tenga calculated_at actualizado
-                self.current_epicenter["calculated_at"] = datetime.now().isoformat()
-
             self.last_calculation_time = time.time()
+            if key == self._interpolation_key:
+                # Lo publicado ya corresponde a estas lecturas
+                return
+            if hit and epicenter:
+                # Resultado de otro ciclo: ids de fuentes según el seguimiento
+                # actual (también deja las fuentes como arranque en caliente)
+                epicenter = retrack_epicenter(epicenter)
+
+            if idw_data:
+                self.current_idw_data = idw_data
+            if epicenter:
+                self.current_epicenter = epicenter
+            self._interpolation_key = key
+            self._cold_start = False
+            self.state_version += 1
+            self.idw_version = self.state_version
             logger.info(
-                f"Interpolaciones recalculadas: {len(self.sensor_data)} sensores"
+                f"Interpolaciones {'reutilizadas' if hit else 'recalculadas'}: "
+                f"{fresh_count} de {len(table)} sensores"
             )
 
         except Exception as e:
             logger.error(f"Error recalculando interpolaciones: {e}")
 
+    def _compute_interpolations(
+        self,
+        x_vals: np.ndarray,
+        y_vals: np.ndarray,
+        z_vals: np.ndarray,
+        sensor_info: List[Dict[str, Any]],
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Calcular IDW y epicentro (resultado memoizable, no se modifica luego)"""
+        idw_result = calculate_idw(x=x_vals, y=y_vals, z=z_vals, grid_size=50)
+
+        idw_data = None
+        if idw_result:
+            idw_data = {
+                "xi": idw_result["xi"].tolist(),
+                "yi": idw_result["yi"].tolist(),
+                "zi": idw_result["zi"].tolist(),
+                "x_min": float(idw_result["x_min"]),
+                "x_max": float(idw_result["x_max"]),
+                "y_min": float(idw_result["y_min"]),
+                "y_max": float(idw_result["y_max"]),
+                "calculated_at": datetime.now().isoformat(),
+            }
+
+        # Epicentro extendido (incluye calculated_at)
+        epicenter = calculate_epicenter(
+            x=x_vals,
+            y=y_vals,
+            z=z_vals,
+            sensor_info=sensor_info,
+            previous=None if self._cold_start else self.current_epicenter,
+            grid=(
+                (idw_result["xi"], idw_result["yi"], idw_result["zi"])
+                if idw_result
+                else None
+            ),
+        )
+        return idw_data, epicenter
+
+    def on_config_reloaded(self, snapshot: RegistrySnapshot):
+        """
+        Aplicar una configuración de sensores recién instalada: mover los
+        sensores conocidos (un solo cambio de layout), descartar el arranque
+        en caliente del epicentro y programar un único recálculo. Se llama en
+        el event loop, así que ningún ciclo ve una mezcla de configuraciones.
+
+        En una réplica solo se mueve la tabla (para un futuro liderazgo): la
+        versión y la instantánea siguen siendo las instaladas desde el líder,
+        cuyas versiones podrían coincidir con una numeración local.
+        """
+        table = self.sensors
+        coordinates = {}
+        for micro_id in table.ids:
+            entry = snapshot.get(micro_id)
+            if entry is None:
+                coordinates[micro_id] = (7.0, 2.5, f"Desconocido - {micro_id}")
+            else:
+                coordinates[micro_id] = (
+                    entry["latitude"],
+                    entry["longitude"],
+                    entry["location_name"],
+                )
+        moved = table.relocate(coordinates)
+        self._interpolation_key = None
+        self._cold_start = True
+        logger.info(
+            f"Configuración v{snapshot.version} aplicada: {moved} sensores movidos"
+        )
+        if self.replica:
+            return
+        self.state_version += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fuera del loop (scripts): se recalcula con la próxima lectura
+            return
+        self.reload_task = loop.create_task(self.recalculate_interpolations())
+
     def get_current_state(self) -> Dict[str, Any]:
         """Obtener estado actual para enviar a clientes"""
-        sensor_list = []
-        for sensor_key, data in self.sensor_data.items():
-            sensor_list.append(
-                {
-                    "sensor_key": sensor_key,
-                    "micro_id": data["micro_id"],
-                    "sample": data["sample"],
-                    "latitude": data["latitude"],
-                    "longitude": data["longitude"],
-                    "location_name": data["location_name"],
-                    "value": data["last_value"],
-                    "last_update": data["last_update"],
-                }
-            )
-
         return {
-            "sensors": sensor_list,
+            "sensors": self.sensors.rows(),
             "idw": self.current_idw_data,
             "epicenter": self.current_epicenter,
             "timestamp": datetime.now().isoformat(),
-            "sensor_count": len(self.sensor_data),
+            "sensor_count": len(self.sensors),
         }
 
+    def get_snapshot(self) -> StateSnapshot:
+        """
+        Obtener la instantánea inmutable del estado actual. Se reconstruye
+        solo cuando cambió la versión; mientras tanto todos los clientes
+        comparten el mismo objeto y sus bytes serializados.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self.state_version:
+            snapshot = StateSnapshot(
+                self.state_version, public_state(self.get_current_state())
+            )
+            self._snapshot = snapshot
+        return snapshot
+
+    def install_remote(self, snapshot: StateSnapshot, idw_version: int):
+        """
+        Instalar una instantánea publicada por el líder (modo cluster). Las
+        réplicas no calculan: sirven la instantánea tal como llegó.
+        """
+        state = snapshot.state
+        self._snapshot = snapshot
+        self.state_version = snapshot.version
+        self.current_idw_data = state.get("idw")
+        self.current_epicenter = state.get("epicenter")
+        self.idw_version = idw_version
+
+    def adopt_state(self, snapshot: StateSnapshot):
+        """
+        Cargar en la tabla los sensores de la última instantánea publicada
+        (al asumir el liderazgo), para no arrancar con la tabla vacía. Los
+        sensores conservan su última lectura e instante, así que vencen según
+        el TTL como si este proceso los hubiera recibido.
+        """
+        table = self.sensors
+        for row in snapshot.state.get("sensors") or []:
+            micro_id = row["micro_id"]
+            try:
+                updated_ns = int(
+                    datetime.fromisoformat(row["last_update"]).timestamp() * 1e9
+                )
+            except (KeyError, TypeError, ValueError):
+                updated_ns = time.time_ns()
+            index = table.index.get(micro_id)
+            if index is not None and table.last_update_ns[index] >= updated_ns:
+                continue
+            table.update(
+                micro_id,
+                float(row["value"]),
+                float(row["latitude"]),
+                float(row["longitude"]),
+                row.get("location_name", ""),
+                now_ns=updated_ns,
+            )
+        # Seguir numerando después de la última versión publicada
+        self.state_version = max(self.state_version, snapshot.version) + 1
+        self.idw_version = self.state_version
+        self._interpolation_key = None
+
     def get_sensor_history(
         self, sensor_key: str, limit: int = 60
     ) -> List[Dict[str, Any]]:
         """Obtener historial de un sensor"""
-        if sensor_key in self.sensor_data:
-            return self.sensor_data[sensor_key]["history"][-limit:]
-        return []
+        index = self.sensors.index.get(sensor_key)
+        if index is None:
+            return []
+        return self.sensors.history[index].to_records(limit)
+
+    def get_sensor_history_window(self, sensor_key: str, limit: int = 60):
+        """
+        Obtener (timestamps, valores) recientes de un sensor como arreglos
+        NumPy, sin copiar cuando es posible.
+        """
+        index = self.sensors.index.get(sensor_key)
+        if index is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.sensors.history[index].window(limit)
 
     def get_all_sensors_history(
         self, limit: int = 10
     ) -> Dict[str, List[Dict[str, Any]]]:
         """Obtener historial de todos los sensores"""
         result = {}
-        for sensor_key in self.sensor_data:
+        for sensor_key in self.sensors.ids:
             result[sensor_key] = self.get_sensor_history(sensor_key, limit)
         return result
 
 
 # Instancia global del servicio de datos
 data_service = DataService()
+sensor_registry.subscribe(data_service.on_config_reloaded)
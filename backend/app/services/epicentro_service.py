@@ -1,28 +1,160 @@
 import logging
+import os
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
-from app.utils.epicentro import calcular_epicentro
+from app.utils.epicentro import (
+    DEFAULT_ALPHA,
+    buscar_maximos_locales,
+    localizar_fuente,
+    localizar_fuentes,
+)
+from app.utils.sensor_registry import sensor_registry
 
 logger = logging.getLogger(__name__)
 
+# Absorción adicional del recinto (dB por baldosa) del modelo de atenuación
+EPICENTER_ALPHA = float(os.getenv("EPICENTER_ALPHA", str(DEFAULT_ALPHA)))
+
+# Fuentes simultáneas a estimar (1 = solo el epicentro principal)
+EPICENTER_MAX_SOURCES = int(os.getenv("EPICENTER_MAX_SOURCES", "3"))
+
+
+class SourceTracker:
+    """
+    Seguimiento de fuentes entre ciclos: conserva un id estable para cada
+    fuente (asociando por cercanía) y ofrece las posiciones anteriores como
+    arranque en caliente del ajuste.
+    """
+
+    def __init__(self, gate: float = 8.0):
+        self.gate = gate  # baldosas máximas entre ciclos para la misma fuente
+        self.tracks: List[Dict[str, Any]] = []
+        self._next_id = 1
+
+    def update(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Asignar ids a las fuentes nuevas (de mayor a menor nivel)"""
+        available = list(self.tracks)
+        for source in sources:
+            nearest = None
+            nearest_dist = self.gate
+            for track in available:
+                dist = np.hypot(source["x"] - track["x"], source["y"] - track["y"])
+                if dist <= nearest_dist:
+                    nearest, nearest_dist = track, dist
+            if nearest is not None:
+                available.remove(nearest)
+                source["id"] = nearest["id"]
+            else:
+                source["id"] = self._next_id
+                self._next_id += 1
+        self.tracks = sources
+        return sources
+
+    def reset(self):
+        self.tracks = []
+
+
+# Instancia global del seguimiento de fuentes
+source_tracker = SourceTracker()
+# Las fuentes de la configuración anterior no sirven como arranque en caliente
+sensor_registry.subscribe(lambda snapshot: source_tracker.reset())
+
+
+def calculate_sources(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    grid: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    main_source: Optional[Dict[str, Any]] = None,
+    max_sources: int = EPICENTER_MAX_SOURCES,
+) -> List[Dict[str, Any]]:
+    """
+    Estimar hasta `max_sources` fuentes simultáneas. Las semillas son el
+    epicentro principal (primera semilla), las fuentes del ciclo anterior y
+    los máximos locales de la grilla IDW.
+
+    Returns:
+        Lista de fuentes {id, latitude, longitude, level, zone_type, zone_radius}
+    """
+    seeds = []
+    if grid is not None and len(grid) == 3:
+        seeds = buscar_maximos_locales(grid[0], grid[1], grid[2], 2 * max_sources)
+
+    sources = localizar_fuentes(
+        x,
+        y,
+        z,
+        seeds,
+        max_sources=max_sources,
+        alpha=EPICENTER_ALPHA,
+        previous=source_tracker.tracks,
+        main=main_source,
+    )
+    return [
+        {
+            "id": source["id"],
+            "latitude": source["y"],
+            "longitude": source["x"],
+            "level": source["level"],
+            "zone_type": "circle",
+            "zone_radius": source["confidence_radius"],
+        }
+        for source in source_tracker.update(sources)
+    ]
+
+
+def retrack_epicenter(epicenter: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reasignar los ids de las fuentes de un epicentro reutilizado del memo
+    (calculado en otro ciclo) según el seguimiento actual, para que no
+    salten ids entre ciclos. Devuelve una copia: el valor del memo no se
+    modifica.
+    """
+    if not epicenter.get("sources"):
+        return epicenter
+    tracked = source_tracker.update(
+        [
+            {
+                "x": source["longitude"],
+                "y": source["latitude"],
+                "level": source["level"],
+                "confidence_radius": source["zone_radius"],
+            }
+            for source in epicenter["sources"]
+        ]
+    )
+    sources = [
+        {**source, "id": track["id"]}
+        for source, track in zip(epicenter["sources"], tracked)
+    ]
+    return {**epicenter, "sources": sources}
+
 
 def calculate_epicenter(
     x: np.ndarray,
     y: np.ndarray,
     z: np.ndarray,
     sensor_info: Optional[List[Dict[str, Any]]] = None,
+    previous: Optional[Dict[str, Any]] = None,
+    grid: Optional[Tuple[np.ndarray, ...]] = None,
 ) -> Optional[Dict[str, Any]]:
     """
-    Calcular epicentro extendido basado en los 3 sensores con mayor ruido.
+    Calcular epicentro extendido. La posición se estima con el motor de
+    localización usando todos los sensores recibidos (los vigentes); los 3
+    sensores con mayor ruido definen la zona mostrada. Con
+    EPICENTER_MAX_SOURCES > 1 también se estiman fuentes simultáneas.
 
     Args:
         x: Array de coordenadas X (longitudes)
         y: Array de coordenadas Y (latitudes)
         z: Array de valores (niveles de ruido)
         sensor_info: Lista opcional de información de sensores con micro_id
+        previous: Epicentro anterior, usado como punto de partida del optimizador
+        grid: Grilla (xi, yi, zi) de la interpolación IDW para la búsqueda
+            inicial y las semillas de fuentes múltiples
 
     Returns:
         Diccionario con datos de epicentro extendido, o None en caso de error
@@ -46,16 +178,46 @@ def calculate_epicenter(
         top_y = y[top_indices]
         top_z = z[top_indices]
 
-        # Calcular epicentro tradicional usando solo los sensores top
+        # Localizar la fuente con todos los sensores
+        confidence_radius = None
+        source_level = None
+        source = None
         try:
-            epicentro_x, epicentro_y = calcular_epicentro(top_x, top_y, top_z)
-        except Exception as e:
-            logger.warning(
-                f"Error en cálculo de epicentro tradicional, usando fallback: {e}"
+            initial_guess = None
+            if previous and not previous.get("fallback"):
+                initial_guess = (previous["longitude"], previous["latitude"])
+            source = localizar_fuente(
+                x,
+                y,
+                z,
+                grid=grid[:2] if grid is not None else None,
+                alpha=EPICENTER_ALPHA,
+                initial_guess=initial_guess,
             )
+            epicentro_x, epicentro_y = source["x"], source["y"]
+            confidence_radius = source["confidence_radius"]
+            source_level = source["level"]
+        except Exception as e:
+            logger.warning(f"Error localizando la fuente, usando fallback: {e}")
             max_idx_top = np.argmax(top_z)
             epicentro_x, epicentro_y = top_x[max_idx_top], top_y[max_idx_top]
 
+        # Fuentes simultáneas
+        sources = None
+        if EPICENTER_MAX_SOURCES > 1:
+            try:
+                sources = calculate_sources(x, y, z, grid=grid, main_source=source)
+                if len(sources) > 1 or source is None:
+                    # Con varias fuentes el epicentro principal es la más
+                    # fuerte de la mezcla; con una sola se conserva el
+                    # resultado de localizar_fuente (búsqueda global en grilla)
+                    epicentro_x = sources[0]["longitude"]
+                    epicentro_y = sources[0]["latitude"]
+                    source_level = sources[0]["level"]
+                    confidence_radius = sources[0]["zone_radius"]
+            except Exception as e:
+                logger.warning(f"Error estimando fuentes múltiples: {e}")
+
         # Calcular sensor con valor máximo (global)
         max_idx = np.argmax(z)
         max_sensor_x = x[max_idx]
@@ -138,12 +300,15 @@ def calculate_epicenter(
             "zone_center_longitude": zone_center_x,
             "zone_vertices": zone_vertices,
             "zone_radius": None,  # No aplica para triángulo
+            "confidence_radius": confidence_radius,
+            "source_level": source_level,
+            "sources": sources,
         }
 
         logger.info(
-            f"Epicentro extendido calculado: top_sensors={len(top_sensors) if top_sensors else 0}, zone_type={result['zone_type']}, zone_radius={result['zone_radius']}, zone_center=({result['zone_center_latitude']}, {result['zone_center_longitude']})"
+            f"Epicentro extendido calculado: top_sensors={len(top_sensors) if top_sensors else 0}, fuentes={len(sources) if sources else 0}, confidence_radius={confidence_radius}, zone_center=({result['zone_center_latitude']}, {result['zone_center_longitude']})"
         )
-        logger.info(f"Resultado completo: {result}")
+        logger.debug(f"Resultado completo: {result}")
         return result
 
     except Exception as e:
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.services.export_service import EXPORT_FORMATS, check_format, export_stream
+
+logger = logging.getLogger(__name__)
+
+
+class ExportJob:
+    """Trabajo de exportación que escribe un archivo comprimido en disco"""
+
+    def __init__(self, job_id: str, params: Dict[str, Any], path: str):
+        self.job_id = job_id
+        self.params = params
+        self.path = path
+        self.status = "pending"  # pending, running, completed, failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.bytes_written = 0
+        self.error: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        extension = EXPORT_FORMATS[self.params["format"]]["extension"]
+        return f"export_{self.job_id[:12]}.{extension}.gz"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.job_id[:16]}-{self.bytes_written}"'
+
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "params": self.params,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "bytes_written": self.bytes_written,
+            "filename": self.filename,
+            "error": self.error,
+        }
+
+
+class ExportJobManager:
+    """
+    Gestor de exportaciones en segundo plano.
+
+    Cada trabajo escribe la exportación comprimida (gzip) en EXPORT_DIR por
+    chunks y se renombra de forma atómica al terminar. Los trabajos con los
+    mismos parámetros se deduplican, y los completados sobreviven a reinicios
+    gracias a un archivo de metadatos junto al export.
+    """
+
+    def __init__(self):
+        self.export_dir = os.getenv("EXPORT_DIR", "/tmp/exports")
+        self.max_running = int(os.getenv("EXPORT_MAX_JOBS", "2"))
+        self.retention_seconds = int(os.getenv("EXPORT_JOB_TTL_HOURS", "24")) * 3600
+        # Rango abierto (sin end_time): solo se reutiliza durante este tiempo
+        self.open_range_reuse_seconds = int(os.getenv("EXPORT_OPEN_RANGE_REUSE", "300"))
+
+        self.jobs: Dict[str, ExportJob] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loaded = False
+
+    @staticmethod
+    def job_key(params: Dict[str, Any]) -> str:
+        """Clave de deduplicación a partir de los parámetros normalizados"""
+        canonical = dict(params)
+        if canonical.get("micro_ids"):
+            canonical["micro_ids"] = sorted(canonical["micro_ids"])
+        payload = json.dumps(canonical, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_existing(self):
+        """Recuperar trabajos completados de ejecuciones anteriores"""
+        self._loaded = True
+        if not os.path.isdir(self.export_dir):
+            return
+        for name in os.listdir(self.export_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.export_dir, name)) as file:
+                    meta = json.load(file)
+                job = ExportJob(meta["job_id"], meta["params"], meta["path"])
+                job.status = "completed"
+                job.created_at = meta["created_at"]
+                job.finished_at = meta["finished_at"]
+                job.bytes_written = meta["bytes_written"]
+                if os.path.exists(job.path):
+                    self.jobs[job.job_id] = job
+            except Exception as e:
+                logger.warning(f"Metadatos de exportación inválidos {name}: {e}")
+
+    def _is_reusable(self, job: ExportJob) -> bool:
+        if job.status == "failed":
+            return False
+        if job.status == "completed" and not os.path.exists(job.path):
+            return False
+        if job.params.get("end_time") is None:
+            return time.time() - job.created_at < self.open_range_reuse_seconds
+        return True
+
+    def cleanup(self):
+        """Eliminar trabajos terminados que superaron la retención"""
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.status in ("pending", "running"):
+                continue
+            if now - (job.finished_at or job.created_at) < self.retention_seconds:
+                continue
+            for path in (job.path, f"{job.path}.json"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del self.jobs[job_id]
+
+    def submit(self, params: Dict[str, Any]) -> ExportJob:
+        """
+        Encolar una exportación; si ya existe un trabajo reutilizable con los
+        mismos parámetros, se devuelve ese.
+        """
+        check_format(params["format"])
+        if not self._loaded:
+            self._load_existing()
+        self.cleanup()
+
+        key = self.job_key(params)
+        for job in self.jobs.values():
+            if job.job_id.startswith(key) and self._is_reusable(job):
+                logger.info(f"Exportación deduplicada: {job.job_id}")
+                return job
+
+        os.makedirs(self.export_dir, exist_ok=True)
+        # La clave va como prefijo para deduplicar; el sufijo distingue reintentos
+        job_id = f"{key}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.export_dir, f"{job_id}.gz")
+        job = ExportJob(job_id, params, path)
+        self.jobs[job_id] = job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        if not self._loaded:
+            self._load_existing()
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: ExportJob):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.max_running))
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                await asyncio.to_thread(self._write, job)
+                job.status = "completed"
+                logger.info(
+                    f"Exportación {job.job_id} completada: {job.bytes_written} bytes"
+                )
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"Error en exportación {job.job_id}: {e}")
+            finally:
+                job.finished_at = time.time()
+
+    def _write(self, job: ExportJob):
+        """Escribir la exportación por chunks y publicarla con un rename atómico"""
+        params = job.params
+        start_time = datetime.fromisoformat(params["start_time"])
+        end_time = (
+            datetime.fromisoformat(params["end_time"])
+            if params.get("end_time")
+            else datetime.now()
+        )
+        partial_path = f"{job.path}.part"
+
+        try:
+            with open(partial_path, "wb") as file:
+                for chunk in export_stream(
+                    params["format"],
+                    start_time=start_time,
+                    end_time=end_time,
+                    micro_ids=params.get("micro_ids"),
+                    aggregation_window=params.get("aggregation_window"),
+                    gzip=True,
+                ):
+                    file.write(chunk)
+                    job.bytes_written += len(chunk)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(partial_path, job.path)
+        except BaseException:
+            # No dejar archivos parciales huérfanos en EXPORT_DIR
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            raise
+
+        with open(f"{job.path}.json", "w") as file:
+            json.dump(
+                {
+                    "job_id": job.job_id,
+                    "params": job.params,
+                    "path": job.path,
+                    "created_at": job.created_at,
+                    "finished_at": time.time(),
+                    "bytes_written": job.bytes_written,
+                },
+                file,
+            )
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpretar una cabecera Range de un solo rango ("bytes=a-b", "bytes=a-",
+    "bytes=-n").
+
+    Returns:
+        Tupla (inicio, fin) inclusiva, o None si no hay cabecera
+
+    Raises:
+        ValueError: Si el rango es inválido o no satisfacible
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError("Rango no soportado")
+
+    first, _, last = spec.strip().partition("-")
+    if first == "":
+        length = int(last)
+        if length <= 0:
+            raise ValueError("Rango inválido")
+        start, end = max(size - length, 0), size - 1
+    else:
+        start = int(first)
+        end = int(last) if last else size - 1
+        end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Rango no satisfacible")
+    return start, end
+
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = 1024 * 1024):
+    """Leer un archivo entre dos offsets (inclusive) por chunks"""
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+# Instancia global del gestor de exportaciones
+export_job_manager = ExportJobManager()
@@ -0,0 +1,258 @@
+import csv
+import io
+import json
+import logging
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.utils.config_loader import get_sensor_coordinates
+from app.utils.influxdb import influxdb_client
+
+logger = logging.getLogger(__name__)
+
+# Filas por lote antes de emitir un chunk
+EXPORT_BATCH_ROWS = 5000
+
+# Cabecera CSV (compatible con las exportaciones anteriores)
+CSV_HEADER = ["Timestamp", "Micro ID", "Ubicacion", "Nivel (dB)", "Latitud", "Longitud"]
+
+EXPORT_FORMATS = {
+    "csv": {"media_type": "text/csv", "extension": "csv"},
+    "ndjson": {"media_type": "application/x-ndjson", "extension": "ndjson"},
+    "parquet": {"media_type": "application/vnd.apache.parquet", "extension": "parquet"},
+    "arrow": {
+        "media_type": "application/vnd.apache.arrow.stream",
+        "extension": "arrows",
+    },
+}
+
+# (time, micro_id, sample, value, location_name, latitude, longitude)
+ExportRow = Tuple[datetime, str, int, float, str, float, float]
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escritura que acumula bytes para emitirlos como chunks"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export_rows(
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    micro_ids: Optional[List[str]] = None,
+    aggregation_window: Optional[str] = None,
+) -> Iterator[ExportRow]:
+    """Recorrer filas de exportación enriquecidas con la ubicación de cada micro"""
+    locations: Dict[str, Tuple[float, float, str]] = {}
+    for ts, micro_id, sample, value in influxdb_client.stream_records(
+        start_time, end_time, micro_ids, aggregation_window
+    ):
+        location = locations.get(micro_id)
+        if location is None:
+            location = get_sensor_coordinates(micro_id)
+            locations[micro_id] = location
+        lat, lon, location_name = location
+        yield ts, micro_id, sample, value, location_name, lat, lon
+
+
+def _batches(rows: Iterator[ExportRow]) -> Iterator[List[ExportRow]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _encode_csv(rows: Iterator[ExportRow]) -> Iterator[bytes]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
+    for batch in _batches(rows):
+        for ts, micro_id, _, value, location_name, lat, lon in batch:
+            writer.writerow([ts.isoformat(), micro_id, location_name, value, lat, lon])
+        yield output.getvalue().encode("utf-8")
+        output.seek(0)
+        output.truncate(0)
+    # Cabecera aunque no haya filas
+    if output.tell():
+        yield output.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(rows: Iterator[ExportRow]) -> Iterator[bytes]:
+    for batch in _batches(rows):
+        lines = [
+            json.dumps(
+                {
+                    "time": ts.isoformat(),
+                    "micro_id": micro_id,
+                    "sample": sample,
+                    "value": value,
+                    "location_name": location_name,
+                    "latitude": lat,
+                    "longitude": lon,
+                }
+            )
+            for ts, micro_id, sample, value, location_name, lat, lon in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _arrow_batches(rows: Iterator[ExportRow]):
+    """Convertir lotes de filas en RecordBatch de Arrow"""
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [
+            ("time", pa.timestamp("us", tz="UTC")),
+            ("micro_id", pa.string()),
+            ("sample", pa.int32()),
+            ("value", pa.float64()),
+            ("location_name", pa.string()),
+            ("latitude", pa.float64()),
+            ("longitude", pa.float64()),
+        ]
+    )
+
+    def generate():
+        for batch in _batches(rows):
+            columns = list(zip(*batch))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            )
+
+    return schema, generate()
+
+
+def _encode_arrow(rows: Iterator[ExportRow]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema, batches = _arrow_batches(rows)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for record_batch in batches:
+            writer.write_batch(record_batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _encode_parquet(rows: Iterator[ExportRow]) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    schema, batches = _arrow_batches(rows)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for record_batch in batches:
+            # Cada lote se escribe como un row group independiente
+            writer.write_batch(record_batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+_ENCODERS = {
+    "csv": _encode_csv,
+    "ndjson": _encode_ndjson,
+    "parquet": _encode_parquet,
+    "arrow": _encode_arrow,
+}
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def check_format(export_format: str):
+    """Validar el formato y la disponibilidad de sus dependencias opcionales"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Formato no soportado: {export_format} "
+            f"(disponibles: {', '.join(EXPORT_FORMATS)})"
+        )
+    if export_format in ("parquet", "arrow"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError(f"El formato {export_format} requiere pyarrow")
+
+
+def export_stream(
+    export_format: str,
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    micro_ids: Optional[List[str]] = None,
+    aggregation_window: Optional[str] = None,
+    gzip: bool = False,
+    rows: Optional[Iterator[ExportRow]] = None,
+) -> Iterator[bytes]:
+    """
+    Generar la exportación como una secuencia de chunks de bytes, leyendo filas
+    del cursor de InfluxDB a medida que se escriben (memoria constante).
+
+    Args:
+        export_format: csv, ndjson, parquet o arrow (IPC stream)
+        start_time: Tiempo de inicio
+        end_time: Tiempo de fin (default: ahora)
+        micro_ids: Lista de micro IDs (default: todos)
+        aggregation_window: Ventana de agregación (None = datos crudos)
+        gzip: Comprimir la salida con gzip
+        rows: Filas ya abiertas (p. ej. tras comprobar que hay datos); por
+            defecto se leen con iter_export_rows
+    """
+    check_format(export_format)
+    if rows is None:
+        rows = iter_export_rows(start_time, end_time, micro_ids, aggregation_window)
+    chunks = _ENCODERS[export_format](rows)
+    if gzip:
+        chunks = _gzip(chunks)
+
+    started = time.perf_counter()
+    total_bytes = 0
+    for chunk in chunks:
+        if chunk:
+            total_bytes += len(chunk)
+            yield chunk
+
+    logger.info(
+        f"Exportación {export_format} completada: {total_bytes} bytes en "
+        f"{time.perf_counter() - started:.1f} s"
+    )
+
+
+def export_filename(
+    export_format: str,
+    micro_ids: Optional[List[str]],
+    start_time: datetime,
+    end_time: datetime,
+    gzip: bool = False,
+) -> str:
+    """Nombre de archivo sugerido para una exportación"""
+    label = "_".join(micro_ids) if micro_ids and len(micro_ids) <= 3 else "multi"
+    extension = EXPORT_FORMATS[export_format]["extension"]
+    filename = (
+        f"sensor_{label}_{start_time.strftime('%Y%m%d')}_to_"
+        f"{end_time.strftime('%Y%m%d')}.{extension}"
+    )
+    return filename + ".gz" if gzip else filename
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.utils.floor_plan import (
+    FLOOR_X_MAX,
+    FLOOR_X_MIN,
+    FLOOR_Y_MAX,
+    FLOOR_Y_MIN,
+    floor_mask,
+)
+from app.utils.heatmap import (
+    PALETTES,
+    colorize,
+    encode_png,
+    encode_webp,
+    sample_grid,
+    webp_available,
+)
+from app.utils.sensor_registry import sensor_registry
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+class HeatmapImage:
+    """Imagen renderizada con su escala en dB"""
+
+    def __init__(
+        self, body: bytes, media_type: str, etag: str, vmin: float, vmax: float
+    ):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag
+        self.vmin = vmin
+        self.vmax = vmax
+
+
+class HeatmapService:
+    """
+    Renderizado del mapa de calor en el servidor.
+
+    Las imágenes se cachean por versión de la grilla IDW y parámetros
+    (tamaño, tile, paleta, escala), así que todos los clientes que piden la
+    misma vista comparten un único render. Al publicarse una grilla nueva se
+    descartan las imágenes de la anterior. Los renders concurrentes de la
+    misma clave esperan al primero en lugar de repetirlo.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("HEATMAP_CACHE_ENTRIES", "256"))
+        self.max_size = int(os.getenv("HEATMAP_MAX_SIZE", "2048"))
+        self.tile_size = int(os.getenv("HEATMAP_TILE_SIZE", "256"))
+        self.max_zoom = int(os.getenv("HEATMAP_MAX_ZOOM", "6"))
+
+        self._version: Optional[int] = None
+        self._grid: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[Tuple, HeatmapImage]" = OrderedDict()
+        self._pending: Dict[Tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "renders": 0}
+
+    def validate(self, fmt: str, palette: str):
+        """Validar formato y paleta (ValueError si no son válidos)"""
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        if fmt == "webp" and not webp_available():
+            raise ValueError("WebP requiere el paquete Pillow")
+        if palette not in PALETTES:
+            raise ValueError(f"Paleta desconocida: {palette}")
+
+    def full_view(self, width: int) -> Tuple[Tuple[float, ...], int, int]:
+        """Vista del plano completo con el alto según su proporción"""
+        width = min(max(width, 1), self.max_size)
+        aspect = (FLOOR_Y_MAX - FLOOR_Y_MIN) / (FLOOR_X_MAX - FLOOR_X_MIN)
+        height = min(max(int(round(width * aspect)), 1), self.max_size)
+        return (FLOOR_X_MIN, FLOOR_X_MAX, FLOOR_Y_MIN, FLOOR_Y_MAX), width, height
+
+    def tile_view(self, zoom: int, tile_x: int, tile_y: int) -> Tuple[float, ...]:
+        """
+        Vista de un tile z/x/y. Los tiles son cuadrados sobre el lado mayor
+        del plano (2^z por eje, x desde la izquierda e y desde arriba); lo que
+        cae fuera del plano queda transparente.
+        """
+        if not 0 <= zoom <= self.max_zoom:
+            raise ValueError(f"Zoom fuera de rango (0-{self.max_zoom})")
+        count = 2**zoom
+        if not (0 <= tile_x < count and 0 <= tile_y < count):
+            raise ValueError("Tile fuera de rango")
+        side = max(FLOOR_X_MAX - FLOOR_X_MIN, FLOOR_Y_MAX - FLOOR_Y_MIN) / count
+        x0 = FLOOR_X_MIN + tile_x * side
+        y1 = FLOOR_Y_MAX - tile_y * side
+        return (x0, x0 + side, y1 - side, y1)
+
+    def _sync_version(self, version: int, idw_data: Dict[str, Any]):
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._grid = np.asarray(idw_data["zi"], dtype=np.float64)
+                self._entries.clear()
+
+    def prepare(
+        self,
+        version: int,
+        idw_data: Dict[str, Any],
+        view: Tuple[float, ...],
+        width: int,
+        height: int,
+        fmt: str = "png",
+        palette: str = "viridis",
+        vmin: Optional[float] = None,
+        vmax: Optional[float] = None,
+        opacity: float = 1.0,
+        clip: bool = True,
+    ) -> Tuple[Tuple, str]:
+        """
+        Resolver la escala y armar la clave de cache de una vista.
+
+        Returns:
+            Tupla (clave, etag); el ETag permite responder 304 sin renderizar
+        """
+        self._sync_version(version, idw_data)
+        # Escala automática sobre toda la grilla: los tiles vecinos coinciden
+        if vmin is None:
+            vmin = float(np.nanmin(self._grid))
+        if vmax is None:
+            vmax = float(np.nanmax(self._grid))
+        key = (version, fmt, palette, view, width, height, vmin, vmax, opacity, clip)
+        digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).hexdigest()
+        return key, f'W/"heatmap-{version}-{digest}"'
+
+    async def render(
+        self, key: Tuple, etag: str, idw_data: Dict[str, Any]
+    ) -> HeatmapImage:
+        """Obtener la imagen de una vista preparada (del cache o renderizándola)"""
+        image = self._entries.get(key)
+        if image is not None:
+            self.metrics["hits"] += 1
+            return image
+
+        # Otro cliente ya está renderizando esta vista: esperar su resultado
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.metrics["hits"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            bounds = (
+                float(idw_data["x_min"]),
+                float(idw_data["x_max"]),
+                float(idw_data["y_min"]),
+                float(idw_data["y_max"]),
+            )
+            grid = self._grid
+            if key[0] != self._version:
+                grid = np.asarray(idw_data["zi"], dtype=np.float64)
+            image = await asyncio.to_thread(self._render, grid, bounds, key, etag)
+            self.metrics["renders"] += 1
+            with self._lock:
+                if key[0] == self._version:
+                    self._entries[key] = image
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            future.set_result(image)
+            return image
+        except Exception as e:
+            future.set_exception(e)
+            # Marcar la excepción como recuperada si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(key, None)
+
+    @staticmethod
+    def _render(grid, bounds, key: Tuple, etag: str) -> HeatmapImage:
+        _, fmt, palette, view, width, height, vmin, vmax, opacity, clip = key
+        values, px, py = sample_grid(grid, bounds, view, width, height)
+        mask = floor_mask(px, py) if clip else None
+        rgba = colorize(values, vmin, vmax, palette, opacity, mask)
+        body = encode_webp(rgba) if fmt == "webp" else encode_png(rgba)
+        return HeatmapImage(body, MEDIA_TYPES[fmt], etag, vmin, vmax)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "entries": len(self._entries),
+            "version": self._version,
+            "bytes": sum(len(image.body) for image in self._entries.values()),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._grid = None
+            self._entries.clear()
+
+
+# Instancia global del renderizador
+heatmap_service = HeatmapService()
+# El recorte del plano puede cambiar con la configuración
+sensor_registry.subscribe(lambda snapshot: heatmap_service.clear())
@@ -0,0 +1,277 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from app.utils.durations import parse_duration
+from app.utils.sensor_registry import sensor_registry
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryTail:
+    """
+    Cola en memoria de buckets agregados por micro para consultas incrementales.
+
+    Cada lectura en tiempo real se acumula (suma/conteo) en el bucket de su
+    ventana. Los buckets usan la misma convención que aggregateWindow en
+    InfluxDB: el tiempo publicado es el fin de la ventana. Así los gráficos de
+    tendencia pueden pedir solo lo nuevo desde su último cursor sin consultar
+    InfluxDB.
+    """
+
+    def __init__(self):
+        self.window = os.getenv("HISTORY_TAIL_WINDOW", "1m")
+        self.window_seconds = parse_duration(self.window) or 60
+        self.hours = int(os.getenv("HISTORY_TAIL_HOURS", "24"))
+        self.max_buckets = max(1, self.hours * 3600 // self.window_seconds)
+
+        # micro_id -> deque de [inicio_bucket, suma, conteo]
+        self._tails: Dict[str, Deque[List[float]]] = {}
+        # micro_id -> metadatos de ubicación para construir las filas
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        # Primer instante cubierto por la cola (None = sin datos)
+        self.covered_since: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _bucket_start(self, ts: float) -> int:
+        return int(ts) // self.window_seconds * self.window_seconds
+
+    def is_closed_stop(self, stop: float, now: Optional[float] = None) -> bool:
+        """
+        Indicar si `stop` es el fin alineado de un bucket ya cerrado. La fila
+        parcial que InfluxDB sella con el fin de la consulta (≈ ahora, no
+        alineado) corresponde al bucket abierto.
+        """
+        current_bucket = self._bucket_start(now if now is not None else time.time())
+        return (
+            float(stop).is_integer()
+            and int(stop) % self.window_seconds == 0
+            and stop <= current_bucket
+        )
+
+    def aligned_stop(self, ts: float) -> float:
+        """Fin (alineado hacia arriba) del bucket que termina en o después de `ts`"""
+        return float(-(-int(ts) // self.window_seconds) * self.window_seconds)
+
+    def add(
+        self,
+        micro_id: str,
+        value: float,
+        latitude: float,
+        longitude: float,
+        location_name: str,
+        ts: Optional[float] = None,
+    ):
+        """Acumular una lectura en el bucket de su ventana"""
+        ts = ts if ts is not None else time.time()
+        bucket = self._bucket_start(ts)
+
+        with self._lock:
+            self._meta[micro_id] = {
+                "latitude": latitude,
+                "longitude": longitude,
+                "location_name": location_name,
+            }
+            tail = self._tails.get(micro_id)
+            if tail is None:
+                tail = deque(maxlen=self.max_buckets)
+                self._tails[micro_id] = tail
+            if self.covered_since is None:
+                self.covered_since = float(bucket)
+
+            if tail and tail[-1][0] == bucket:
+                tail[-1][1] += value
+                tail[-1][2] += 1
+            elif not tail or tail[-1][0] < bucket:
+                evicts = len(tail) == tail.maxlen
+                tail.append([bucket, value, 1])
+                if evicts:
+                    self._evicted(tail)
+            else:
+                # Lectura tardía: buscar su bucket desde el final
+                for entry in reversed(tail):
+                    if entry[0] == bucket:
+                        entry[1] += value
+                        entry[2] += 1
+                        break
+
+    def _evicted(self, tail: Deque[List[float]]):
+        """
+        Un deque lleno descartó su bucket más viejo: la cola solo cubre desde
+        el bucket más antiguo que conserva (llamar con el lock tomado)
+        """
+        oldest = float(tail[0][0])
+        if self.covered_since is None or self.covered_since < oldest:
+            self.covered_since = oldest
+
+    def relocate(self, coordinates: Dict[str, Any]):
+        """
+        Actualizar la ubicación de los micros conocidos tras recargar la
+        configuración {micro_id: (latitud, longitud, ubicación)}, para que
+        las filas nuevas no mezclen coordenadas viejas y nuevas.
+        """
+        with self._lock:
+            for micro_id, meta in self._meta.items():
+                location = coordinates.get(micro_id)
+                if location is not None:
+                    latitude, longitude, location_name = location
+                    meta.update(
+                        latitude=latitude,
+                        longitude=longitude,
+                        location_name=location_name,
+                    )
+
+    def clear(self):
+        """Vaciar la cola (deja de cubrir cualquier rango)"""
+        with self._lock:
+            self._tails.clear()
+            self._meta.clear()
+            self.covered_since = None
+
+    def seed(self, rows: List[Dict[str, Any]], start_time: datetime):
+        """
+        Precargar la cola con datos históricos agregados (filas de
+        query_historical_data con la misma ventana). Solo se cargan buckets ya
+        cerrados (fin alineado y no posterior al bucket actual) y anteriores a
+        los datos en vivo existentes; la fila parcial del bucket abierto se
+        descarta, ese bucket lo completan las lecturas en vivo. Llamar solo con
+        el resultado de una consulta exitosa: a partir de aquí la cola se
+        declara completa desde `start_time`.
+        """
+        now = time.time()
+        seeded: Dict[str, List[List[float]]] = {}
+        meta: Dict[str, Dict[str, Any]] = {}
+
+        for row in rows:
+            stop = datetime.fromisoformat(row["time"]).timestamp()
+            if not self.is_closed_stop(stop, now):
+                continue
+            bucket = int(stop) - self.window_seconds
+            seeded.setdefault(row["micro_id"], []).append([bucket, row["value"], 1])
+            meta.setdefault(
+                row["micro_id"],
+                {
+                    "latitude": row["latitude"],
+                    "longitude": row["longitude"],
+                    "location_name": row["location_name"],
+                },
+            )
+
+        with self._lock:
+            self.covered_since = float(self._bucket_start(start_time.timestamp()))
+            for micro_id, entries in seeded.items():
+                live = self._tails.get(micro_id) or deque(maxlen=self.max_buckets)
+                first_live = live[0][0] if live else float("inf")
+                entries = sorted(e for e in entries if e[0] < first_live)
+                merged = deque(entries, maxlen=self.max_buckets)
+                merged.extend(live)
+                self._tails[micro_id] = merged
+                self._meta.setdefault(micro_id, meta[micro_id])
+            # Una cola llena puede haber descartado buckets (al mezclar o antes)
+            for tail in self._tails.values():
+                if len(tail) == tail.maxlen:
+                    self._evicted(tail)
+
+        logger.info(
+            f"Cola histórica precargada: {sum(len(v) for v in seeded.values())} buckets "
+            f"de {len(seeded)} micros"
+        )
+
+    def seed_from_influx(self):
+        """Precargar la cola desde InfluxDB (una sola consulta al arrancar)"""
+        from app.utils.influxdb import influxdb_client
+
+        start_time = datetime.now(timezone.utc) - timedelta(hours=self.hours)
+        try:
+            rows = influxdb_client.query_historical_data(
+                start_time=start_time,
+                aggregation_window=self.window,
+                raise_errors=True,
+            )
+        except Exception as e:
+            # Sin precarga la cola solo cubre desde la primera lectura en vivo
+            logger.warning(f"No se pudo precargar la cola histórica: {e}")
+            return
+        self.seed(rows, start_time)
+
+    def covers(self, since: datetime) -> bool:
+        """Indicar si la cola contiene todos los buckets posteriores a `since`"""
+        return (
+            self.covered_since is not None
+            and since.timestamp() >= self.covered_since
+        )
+
+    def since(
+        self, since: datetime, micro_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Obtener los buckets cerrados posteriores al cursor `since` y la revisión
+        actual del bucket abierto de cada micro.
+
+        Returns:
+            Diccionario con buckets (cerrados), open_buckets y el nuevo cursor
+        """
+        since_ts = since.timestamp()
+        current_bucket = self._bucket_start(time.time())
+        closed = []
+        open_buckets = []
+        cursor_ts = since_ts
+
+        with self._lock:
+            selected = micro_ids if micro_ids else list(self._tails.keys())
+            for micro_id in selected:
+                tail = self._tails.get(micro_id)
+                if not tail:
+                    continue
+                meta = self._meta[micro_id]
+
+                # Recorrer desde el final hasta alcanzar el cursor
+                for bucket, total, count in reversed(tail):
+                    stop = bucket + self.window_seconds
+                    if stop <= since_ts:
+                        break
+                    row = self._row(micro_id, meta, stop, total / count)
+                    if bucket >= current_bucket:
+                        open_buckets.append(row)
+                    else:
+                        closed.append(row)
+                        cursor_ts = max(cursor_ts, stop)
+
+        closed.sort(key=lambda r: r["time"])
+        return {
+            "window": self.window,
+            "cursor": datetime.fromtimestamp(cursor_ts, timezone.utc).isoformat(),
+            "buckets": closed,
+            "open_buckets": open_buckets,
+        }
+
+    def _row(
+        self, micro_id: str, meta: Dict[str, Any], stop: float, value: float
+    ) -> Dict[str, Any]:
+        return {
+            "time": datetime.fromtimestamp(stop, timezone.utc).isoformat(),
+            "micro_id": micro_id,
+            "sensor_id": micro_id,
+            "sample": 0,
+            "measurement": "sonido",
+            "value": value,
+            "location_name": meta["location_name"],
+            "latitude": meta["latitude"],
+            "longitude": meta["longitude"],
+        }
+
+
+# Instancia global de la cola histórica
+history_tail = HistoryTail()
+sensor_registry.subscribe(
+    lambda snapshot: history_tail.relocate(
+        {
+            micro_id: (entry["latitude"], entry["longitude"], entry["location_name"])
+            for micro_id, entry in snapshot.by_micro_id.items()
+        }
+    )
+)
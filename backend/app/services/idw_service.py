@@ -2,7 +2,8 @@ import numpy as np
 from typing import Dict, Any, Optional
 import logging
 
-from app.utils.distribucion_idw import generar_distribucion_idw
+from app.services.interpolation import INTERPOLATION_METHOD, get_interpolator
+from app.utils.floor_plan import FLOOR_X_MAX, FLOOR_X_MIN, FLOOR_Y_MAX, FLOOR_Y_MIN
 
 logger = logging.getLogger(__name__)
 
@@ -11,19 +12,20 @@ def calculate_idw(
     y: np.ndarray,
     z: np.ndarray,
     grid_size: int = 60,
-    power: float = 2.0,
-    margin_percent: float = 0.0
+    margin_percent: float = 0.0,
+    method: Optional[str] = None,
 ) -> Optional[Dict[str, Any]]:
     """
-    Calcular interpolación IDW para un conjunto de puntos.
+    Calcular la grilla interpolada (IDW por defecto) para un conjunto de puntos.
     
     Args:
         x: Array de coordenadas X (longitudes)
         y: Array de coordenadas Y (latitudes)
         z: Array de valores (niveles de ruido)
         grid_size: Número de puntos en la grilla (grid_size x grid_size)
-        power: Potencia para IDW (default 2)
         margin_percent: Porcentaje de margen alrededor de los puntos
+        method: Interpolador (idw, knn, rbf, kriging); INTERPOLATION_METHOD
+            por defecto. La potencia de IDW se configura con INTERPOLATION_POWER
     
     Returns:
         Diccionario con xi, yi, zi y límites, o None en caso de error
@@ -35,18 +37,23 @@ def calculate_idw(
     try:
         # Usar el plano completo de baldosas (0-57 en X, 0-66 en Y)
         # para que el mapa de calor cubra toda el área
-        x_min = 0.0
-        x_max = 57.0
-        y_min = 0.0
-        y_max = 66.0
+        x_min = FLOOR_X_MIN
+        x_max = FLOOR_X_MAX
+        y_min = FLOOR_Y_MIN
+        y_max = FLOOR_Y_MAX
         
-        # Generar distribución IDW
-        xi, yi, zi = generar_distribucion_idw(
-            x, y, z,
-            x_min, x_max, y_min, y_max,
-            power=int(power)
+        xi, yi = np.meshgrid(
+            np.linspace(x_min, x_max, grid_size), np.linspace(y_min, y_max, grid_size)
         )
-        
+        interpolator = get_interpolator(method)
+        zi = interpolator.interpolate(x, y, z, xi, yi)
+        if not np.all(np.isfinite(zi)):
+            # Sistema singular (p. ej. sensores alineados en RBF/kriging)
+            logger.warning(
+                f"Interpolación {method or INTERPOLATION_METHOD} inválida, usando IDW"
+            )
+            zi = get_interpolator("idw").interpolate(x, y, z, xi, yi)
+
         return {
             "xi": xi,
             "yi": yi,
@@ -56,7 +63,9 @@ def calculate_idw(
             "y_min": y_min,
             "y_max": y_max,
             "grid_size": grid_size,
-            "power": power
+            # Potencia efectiva (INTERPOLATION_POWER; None si el método no la usa)
+            "power": getattr(interpolator, "power", None),
+            "method": method or INTERPOLATION_METHOD,
         }
         
     except Exception as e:
@@ -0,0 +1,269 @@
+"""
+Interpoladores intercambiables para la grilla del mapa de calor.
+
+Todos reciben los sensores (x, y, z) y la grilla (xi, yi) y devuelven zi con
+la forma de la grilla. Lo que depende solo de la geometría (árbol KD, pesos,
+sistemas factorizados) se cachea por posiciones de sensores y grilla, así
+que los ciclos con el mismo layout solo pagan la parte que depende de z.
+Se guardan las últimas INTERPOLATION_LAYOUT_CACHE geometrías: un sensor que
+entra y sale de línea alterna entre subconjuntos ya preparados. El método se
+elige con INTERPOLATION_METHOD.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+from scipy.spatial import cKDTree
+
+from app.utils.distribucion_idw import (
+    generar_distribucion_idw,
+    generar_distribucion_idw_geodesica,
+    reset_geodesic_weights,
+)
+from app.utils.floor_plan import get_floor_plan
+from app.utils.sensor_registry import sensor_registry
+
+logger = logging.getLogger(__name__)
+
+INTERPOLATION_METHOD = os.getenv("INTERPOLATION_METHOD", "idw").lower()
+
+# Geometrías preparadas por interpolador (una por subconjunto de sensores)
+INTERPOLATION_LAYOUT_CACHE = max(1, int(os.getenv("INTERPOLATION_LAYOUT_CACHE", "4")))
+
+
+def _layout_key(x: np.ndarray, y: np.ndarray, xi: np.ndarray, yi: np.ndarray):
+    grid = (xi.shape, xi[0, 0], xi[0, -1], yi[0, 0], yi[-1, 0])
+    return (x.tobytes(), y.tobytes(), grid)
+
+
+class Interpolator:
+    """Interfaz común: interpolate(x, y, z, xi, yi) -> zi"""
+
+    name = "base"
+
+    def __init__(self):
+        self._prepared: "OrderedDict[Any, Any]" = OrderedDict()
+
+    def _prepare(self, x, y, xi, yi) -> Any:
+        """Precalcular lo que depende solo de la geometría"""
+
+    def _evaluate(self, prepared: Any, z: np.ndarray, xi: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def interpolate(self, x, y, z, xi, yi) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        key = _layout_key(x, y, xi, yi)
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            prepared = self._prepare(x, y, xi, yi)
+            self._prepared[key] = prepared
+            while len(self._prepared) > INTERPOLATION_LAYOUT_CACHE:
+                self._prepared.popitem(last=False)
+        else:
+            self._prepared.move_to_end(key)
+        return self._evaluate(prepared, np.asarray(z, dtype=np.float64), xi)
+
+
+class IDWInterpolator(Interpolator):
+    """
+    IDW global (todos los sensores en cada celda). Con floor_plan en
+    sensores.yaml usa distancias geodésicas que no atraviesan muros.
+    """
+
+    name = "idw"
+
+    def __init__(self, power: float = 2.0):
+        super().__init__()
+        self.power = power
+
+    def interpolate(self, x, y, z, xi, yi) -> np.ndarray:
+        # Las funciones de distribucion_idw generan grillas cuadradas
+        bounds = (xi[0, 0], xi[0, -1], yi[0, 0], yi[-1, 0])
+        power = float(self.power)
+        plan = get_floor_plan()
+        if plan is not None and plan.has_barriers:
+            _, _, zi = generar_distribucion_idw_geodesica(
+                x, y, z, plan, *bounds, power=power, grid_size=xi.shape[0]
+            )
+        else:
+            _, _, zi = generar_distribucion_idw(
+                x, y, z, *bounds, power=power, grid_size=xi.shape[0]
+            )
+        return zi
+
+
+class NearestIDWInterpolator(Interpolator):
+    """
+    IDW con los k sensores más cercanos a cada celda. El árbol KD y la
+    consulta de vecinos de la grilla se hacen una vez por layout; cada ciclo
+    es una suma ponderada de k valores por celda.
+    """
+
+    name = "knn"
+
+    def __init__(self, k: int = 8, power: float = 2.0):
+        super().__init__()
+        self.k = k
+        self.power = power
+
+    def _prepare(self, x, y, xi, yi):
+        k = min(self.k, len(x))
+        tree = cKDTree(np.column_stack([x, y]))
+        dist, idx = tree.query(np.column_stack([xi.ravel(), yi.ravel()]), k=k)
+        if k == 1:
+            dist, idx = dist[:, None], idx[:, None]
+        weights = 1.0 / np.maximum(dist, 0.01) ** self.power
+        return idx, weights / weights.sum(axis=1, keepdims=True)
+
+    def _evaluate(self, prepared, z, xi):
+        neighbors, weights = prepared
+        return np.einsum("ij,ij->i", weights, z[neighbors]).reshape(xi.shape)
+
+
+class RBFInterpolator(Interpolator):
+    """
+    Funciones de base radial thin-plate spline con término lineal. El
+    sistema (n+3)x(n+3) se factoriza con LU una vez por layout junto con la
+    matriz de evaluación en la grilla; cada ciclo es un lu_solve y un
+    producto matriz-vector.
+    """
+
+    name = "rbf"
+
+    def __init__(self, smoothing: float = 0.0):
+        super().__init__()
+        self.smoothing = smoothing
+
+    def interpolate(self, x, y, z, xi, yi) -> np.ndarray:
+        # El término lineal necesita al menos 3 sensores
+        if len(x) < 3:
+            return get_interpolator("idw").interpolate(x, y, z, xi, yi)
+        return super().interpolate(x, y, z, xi, yi)
+
+    @staticmethod
+    def _kernel(r: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(r > 0, r * r * np.log(r), 0.0)
+
+    def _prepare(self, x, y, xi, yi):
+        n = len(x)
+        # Coordenadas centradas y escaladas para un sistema bien condicionado
+        center = np.array([x.mean(), y.mean()])
+        scale = max(np.ptp(x), np.ptp(y), 1e-9)
+        px = (x - center[0]) / scale
+        py = (y - center[1]) / scale
+        gx = (xi.ravel() - center[0]) / scale
+        gy = (yi.ravel() - center[1]) / scale
+
+        system = np.zeros((n + 3, n + 3))
+        system[:n, :n] = self._kernel(np.hypot(px[:, None] - px, py[:, None] - py))
+        system[:n, :n] += self.smoothing * np.eye(n)
+        poly = np.column_stack([np.ones(n), px, py])
+        system[:n, n:] = poly
+        system[n:, :n] = poly.T
+
+        evaluation = np.empty((gx.size, n + 3))
+        evaluation[:, :n] = self._kernel(np.hypot(gx[:, None] - px, gy[:, None] - py))
+        evaluation[:, n:] = np.column_stack([np.ones(gx.size), gx, gy])
+        return lu_factor(system), evaluation
+
+    def _evaluate(self, prepared, z, xi):
+        factor, evaluation = prepared
+        rhs = np.concatenate([z, np.zeros(3)])
+        coefficients = lu_solve(factor, rhs)
+        return (evaluation @ coefficients).reshape(xi.shape)
+
+
+class KrigingInterpolator(Interpolator):
+    """
+    Kriging ordinario con variograma exponencial de alcance y pepita fijos.
+    Con el variograma fijo el sistema depende solo de la geometría: se
+    factoriza una vez por layout y cada ciclo es un lu_solve y un producto
+    matriz-vector (la meseta no cambia la predicción).
+    """
+
+    name = "kriging"
+
+    def __init__(self, variogram_range: float = 30.0, nugget: float = 0.05):
+        super().__init__()
+        self.variogram_range = variogram_range
+        self.nugget = nugget
+
+    def _variogram(self, h: np.ndarray) -> np.ndarray:
+        gamma = self.nugget + (1.0 - self.nugget) * (
+            1.0 - np.exp(-3.0 * h / self.variogram_range)
+        )
+        return np.where(h > 0, gamma, 0.0)
+
+    def _prepare(self, x, y, xi, yi):
+        n = len(x)
+        system = np.ones((n + 1, n + 1))
+        system[:n, :n] = self._variogram(np.hypot(x[:, None] - x, y[:, None] - y))
+        system[n, n] = 0.0
+
+        gx, gy = xi.ravel(), yi.ravel()
+        evaluation = np.ones((gx.size, n + 1))
+        evaluation[:, :n] = self._variogram(np.hypot(gx[:, None] - x, gy[:, None] - y))
+        return lu_factor(system), evaluation
+
+    def _evaluate(self, prepared, z, xi):
+        factor, evaluation = prepared
+        coefficients = lu_solve(factor, np.concatenate([z, [0.0]]))
+        return (evaluation @ coefficients).reshape(xi.shape)
+
+
+def _build(method: str) -> Interpolator:
+    if method == "idw":
+        return IDWInterpolator(power=float(os.getenv("INTERPOLATION_POWER", "2")))
+    if method == "knn":
+        return NearestIDWInterpolator(
+            k=int(os.getenv("INTERPOLATION_KNN_K", "8")),
+            power=float(os.getenv("INTERPOLATION_POWER", "2")),
+        )
+    if method == "rbf":
+        return RBFInterpolator(
+            smoothing=float(os.getenv("INTERPOLATION_RBF_SMOOTHING", "0"))
+        )
+    if method == "kriging":
+        return KrigingInterpolator(
+            variogram_range=float(os.getenv("KRIGING_RANGE", "30")),
+            nugget=float(os.getenv("KRIGING_NUGGET", "0.05")),
+        )
+    raise ValueError(f"Método de interpolación desconocido: {method}")
+
+
+METHODS = ("idw", "knn", "rbf", "kriging")
+
+# Instancias por método (cada una guarda su cache de geometría)
+_interpolators: Dict[str, Interpolator] = {}
+
+
+def get_interpolator(method: Optional[str] = None) -> Interpolator:
+    """Interpolador del método pedido (INTERPOLATION_METHOD por defecto)"""
+    method = (method or INTERPOLATION_METHOD).lower()
+    interpolator = _interpolators.get(method)
+    if interpolator is None:
+        interpolator = _build(method)
+        _interpolators[method] = interpolator
+        plan = get_floor_plan()
+        if method != "idw" and plan is not None and plan.has_barriers:
+            # Solo la IDW global usa distancias geodésicas
+            logger.warning(
+                f"El método {method} ignora muros y obstáculos de floor_plan; "
+                f"usar INTERPOLATION_METHOD=idw para respetarlos"
+            )
+    return interpolator
+
+
+def _on_config_reloaded(snapshot):
+    """Descartar la geometría cacheada (pesos, árboles y factorizaciones)"""
+    _interpolators.clear()
+    reset_geodesic_weights()
+
+
+sensor_registry.subscribe(_on_config_reloaded)
@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import numpy as np
+
+from app.utils.sensor_registry import sensor_registry
+
+logger = logging.getLogger(__name__)
+
+
+class QuantizedMemo:
+    """
+    Memoización de cálculos por lectura de sensores (IDW, epicentro).
+
+    La clave combina la versión del layout de sensores con el vector de
+    niveles cuantizado a `resolution` dB: lecturas que no cambiaron o que
+    cambiaron menos que la resolución reutilizan el resultado anterior. Las
+    entradas se desalojan por LRU con un tope de memoria.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.resolution = float(os.getenv("MEMO_RESOLUTION_DB", "0.1"))
+        self.max_bytes = int(os.getenv("MEMO_MAX_BYTES", str(32 * 1024 * 1024)))
+
+        # clave -> (tamaño_bytes, valor)
+        self._entries: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def make_key(self, layout_version: int, z: np.ndarray, *extra: Hashable) -> Hashable:
+        """Clave a partir del layout y de los niveles cuantizados"""
+        quantized = np.round(np.asarray(z, dtype=np.float64) / self.resolution)
+        return (layout_version, quantized.astype(np.int32).tobytes(), *extra)
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        size_of: Callable[[Any], int],
+    ) -> Tuple[Any, bool]:
+        """
+        Devolver el valor memoizado o calcularlo.
+
+        Returns:
+            Tupla (valor, hit)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.metrics["hits"] += 1
+                return entry[1], True
+            self.metrics["misses"] += 1
+
+        value = compute()
+        if value is not None:
+            self._store(key, value, size_of(value))
+        return value, False
+
+    def _store(self, key: Hashable, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._entries[key] = (size, value)
+            self._bytes += size
+            while self._entries and self._bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.metrics["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "resolution_db": self.resolution,
+        }
+
+
+# Memo de interpolación IDW + epicentro por estado de sensores
+interpolation_memo = QuantizedMemo("interpolacion")
+# Los resultados de otra configuración no se vuelven a usar: liberarlos
+sensor_registry.subscribe(lambda snapshot: interpolation_memo.clear())
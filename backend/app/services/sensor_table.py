@@ -0,0 +1,214 @@
+import heapq
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.ring_buffer import RingBuffer
+
+# Capacidad inicial de las columnas (crece al doble cuando se llena)
+_INITIAL_CAPACITY = 16
+
+# Bits de la columna flags
+FLAG_STALE = 1  # sin lecturas dentro del TTL
+
+
+class SensorTable:
+    """
+    Tabla de sensores en formato estructura-de-arreglos.
+
+    Cada micro recibe un índice estable (micro_id -> índice) y sus datos viven
+    en columnas NumPy contiguas: longitud, latitud, último valor, instante de
+    la última actualización (ns) y flags. Los cálculos de IDW y epicentro leen
+    vistas de estas columnas sin reconstruir listas en cada ciclo.
+
+    `layout_version` cambia cuando se agrega un sensor o se mueven sus
+    coordenadas, para que los caches que dependen de la geometría sepan
+    cuándo invalidarse.
+
+    La frescura se controla con un heap de vencimientos con una sola entrada
+    por sensor vigente: al vencer se compara con su última lectura y, si hubo
+    lecturas nuevas, se reprograma. Revisar vencimientos cuesta O(vencidos)
+    y las lecturas no tocan el heap.
+    """
+
+    def __init__(self, history_capacity: int = 60, ttl_seconds: float = 60):
+        self.history_capacity = history_capacity
+        self.ttl_ns = int(ttl_seconds * 1_000_000_000)
+        # (vencimiento_ns, índice) de los sensores vigentes
+        self._expiry: List[Tuple[int, int]] = []
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        # Datos estáticos por índice (sensor_key, micro_id, sample, location_name)
+        self.info: List[Dict[str, Any]] = []
+        self.history: List[RingBuffer] = []
+        self.layout_version = 0
+
+        self._lon = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        self._lat = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        self._last_value = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        self._last_update_ns = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)
+        self._flags = np.zeros(_INITIAL_CAPACITY, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, micro_id: str) -> bool:
+        return micro_id in self.index
+
+    # Vistas de las columnas ocupadas (sin copia)
+
+    @property
+    def lon(self) -> np.ndarray:
+        return self._lon[: len(self.ids)]
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self._lat[: len(self.ids)]
+
+    @property
+    def last_value(self) -> np.ndarray:
+        return self._last_value[: len(self.ids)]
+
+    @property
+    def last_update_ns(self) -> np.ndarray:
+        return self._last_update_ns[: len(self.ids)]
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self._flags[: len(self.ids)]
+
+    def _grow(self):
+        capacity = len(self._lon) * 2
+        for name in ("_lon", "_lat", "_last_value", "_last_update_ns", "_flags"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[: len(column)] = column
+            setattr(self, name, grown)
+
+    def _add(
+        self, micro_id: str, latitude: float, longitude: float, location_name: str
+    ) -> int:
+        if len(self.ids) == len(self._lon):
+            self._grow()
+        index = len(self.ids)
+        self.ids.append(micro_id)
+        self.index[micro_id] = index
+        self.info.append(
+            {
+                "sensor_key": micro_id,
+                "micro_id": micro_id,
+                "sample": 0,  # Sample fijo 0
+                "location_name": location_name,
+            }
+        )
+        self.history.append(RingBuffer(self.history_capacity))
+        self._lon[index] = longitude
+        self._lat[index] = latitude
+        self.layout_version += 1
+        return index
+
+    def update(
+        self,
+        micro_id: str,
+        value: float,
+        latitude: float,
+        longitude: float,
+        location_name: str,
+        timestamp: Optional[int] = None,
+        now_ns: Optional[int] = None,
+    ) -> Tuple[int, bool]:
+        """
+        Registrar una lectura (crea el sensor si es nuevo).
+
+        Returns:
+            Tupla (índice, pasó a online): True si el sensor es nuevo o
+            estaba vencido
+        """
+        now_ns = now_ns if now_ns is not None else time.time_ns()
+        index = self.index.get(micro_id)
+        came_online = False
+        if index is None:
+            index = self._add(micro_id, latitude, longitude, location_name)
+            came_online = True
+        elif self._lon[index] != longitude or self._lat[index] != latitude:
+            # La configuración movió el sensor: cambia la geometría
+            self._lon[index] = longitude
+            self._lat[index] = latitude
+            self.layout_version += 1
+        self.info[index]["location_name"] = location_name
+
+        self._last_value[index] = value
+        self._last_update_ns[index] = now_ns
+        self.history[index].append(
+            value, timestamp or now_ns // 1_000_000_000, now_ns // 1_000_000
+        )
+
+        if came_online or self._flags[index] & FLAG_STALE:
+            came_online = True
+            self._flags[index] &= ~np.uint8(FLAG_STALE)
+            heapq.heappush(self._expiry, (now_ns + self.ttl_ns, index))
+        return index, came_online
+
+    def relocate(self, coordinates: Dict[str, Tuple[float, float, str]]) -> int:
+        """
+        Aplicar coordenadas nuevas {micro_id: (latitud, longitud, ubicación)}
+        a los sensores conocidos, con un solo cambio de layout_version.
+
+        Returns:
+            Cantidad de sensores que se movieron
+        """
+        moved = 0
+        for micro_id, (latitude, longitude, location_name) in coordinates.items():
+            index = self.index.get(micro_id)
+            if index is None:
+                continue
+            self.info[index]["location_name"] = location_name
+            if self._lon[index] != longitude or self._lat[index] != latitude:
+                self._lon[index] = longitude
+                self._lat[index] = latitude
+                moved += 1
+        if moved:
+            self.layout_version += 1
+        return moved
+
+    def expire(self, now_ns: Optional[int] = None) -> List[int]:
+        """Marcar como vencidos los sensores sin lecturas dentro del TTL"""
+        now_ns = now_ns if now_ns is not None else time.time_ns()
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now_ns:
+            _, index = heapq.heappop(self._expiry)
+            deadline = int(self._last_update_ns[index]) + self.ttl_ns
+            if deadline > now_ns:
+                # Hubo lecturas después de programarlo: reprogramar
+                heapq.heappush(self._expiry, (deadline, index))
+            else:
+                self._flags[index] |= FLAG_STALE
+                expired.append(index)
+        return expired
+
+    def fresh_mask(self) -> np.ndarray:
+        """Máscara booleana de sensores vigentes"""
+        return (self.flags & FLAG_STALE) == 0
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Sensores como diccionarios (formato de SensorValue en el API)"""
+        return [
+            {
+                **info,
+                "latitude": lat,
+                "longitude": lon,
+                "value": value,
+                "last_update": datetime.fromtimestamp(update_ns / 1e9).isoformat(),
+                "stale": bool(flags & FLAG_STALE),
+            }
+            for info, lat, lon, value, update_ns, flags in zip(
+                self.info,
+                self.lat.tolist(),
+                self.lon.tolist(),
+                self.last_value.tolist(),
+                self.last_update_ns.tolist(),
+                self.flags.tolist(),
+            )
+        ]
@@ -0,0 +1,122 @@
+import gzip
+import threading
+from typing import Any, Dict, Optional
+
+import orjson
+
+from app.api.schemas import (
+    CurrentState,
+    EpicenterData,
+    IDWData,
+    SensorValue,
+    SoundSource,
+)
+
+
+def _fields(data: Dict[str, Any], model) -> Dict[str, Any]:
+    return {name: data[name] for name in model.model_fields if name in data}
+
+
+def public_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Recortar el estado a los campos del esquema CurrentState. Los bytes de la
+    instantánea se sirven sin pasar por response_model, así que el filtrado
+    se hace aquí, una vez por versión.
+    """
+    public = _fields(state, CurrentState)
+    public["sensors"] = [_fields(row, SensorValue) for row in state["sensors"]]
+    if public.get("idw"):
+        public["idw"] = _fields(public["idw"], IDWData)
+    epicenter = public.get("epicenter")
+    if epicenter:
+        epicenter = _fields(epicenter, EpicenterData)
+        if epicenter.get("sources"):
+            epicenter["sources"] = [
+                _fields(source, SoundSource) for source in epicenter["sources"]
+            ]
+        public["epicenter"] = epicenter
+    return public
+
+
+class StateSnapshot:
+    """
+    Estado en tiempo real congelado en una versión.
+
+    Se construye una sola vez por versión del DataService y se comparte entre
+    /ultimos, WebSocket y Socket.IO. Las representaciones serializadas (JSON,
+    JSON gzip y mensajes de broadcast) se calculan la primera vez que se piden
+    y quedan guardadas en la instantánea, así que servirla a N clientes no
+    vuelve a recorrer la grilla IDW. El diccionario `state` no debe mutarse.
+    """
+
+    def __init__(self, version: int, state: Dict[str, Any]):
+        self.version = version
+        self.state = state
+        self.timestamp: str = state["timestamp"]
+        self.etag = f'W/"ultimos-{version}"'
+        self._json: Optional[bytes] = None
+        self._gzip: Optional[bytes] = None
+        self._messages: Dict[str, str] = {}
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_gzip(cls, version: int, body: bytes) -> "StateSnapshot":
+        """
+        Reconstruir una instantánea publicada por otra réplica a partir de su
+        cuerpo gzip, conservando los bytes recibidos como serializaciones ya
+        calculadas.
+        """
+        json_bytes = gzip.decompress(body)
+        snapshot = cls(version, orjson.loads(json_bytes))
+        snapshot._json = json_bytes
+        snapshot._gzip = body
+        return snapshot
+
+    @property
+    def json_bytes(self) -> bytes:
+        """Estado serializado (cuerpo de /ultimos)"""
+        if self._json is None:
+            with self._lock:
+                if self._json is None:
+                    self._json = orjson.dumps(
+                        self.state, option=orjson.OPT_SERIALIZE_NUMPY
+                    )
+        return self._json
+
+    @property
+    def gzip_bytes(self) -> bytes:
+        """Estado serializado y comprimido con gzip una sola vez"""
+        if self._gzip is None:
+            body = self.json_bytes
+            with self._lock:
+                if self._gzip is None:
+                    self._gzip = gzip.compress(body, compresslevel=6, mtime=0)
+        return self._gzip
+
+    def message_text(self, message_type: str) -> str:
+        """Mensaje WebSocket {"type", "data", "timestamp"} ya serializado"""
+        message = self._messages.get(message_type)
+        if message is None:
+            envelope = (
+                b'{"type":' + orjson.dumps(message_type)
+                + b',"version":' + str(self.version).encode("ascii")
+                + b',"data":' + self.json_bytes
+                + b',"timestamp":' + orjson.dumps(self.timestamp) + b"}"
+            )
+            message = envelope.decode("utf-8")
+            self._messages[message_type] = message
+        return message
+
+    def socketio_payload(self, message_type: str) -> Dict[str, Any]:
+        """Payload para Socket.IO (python-socketio serializa el diccionario)"""
+        payload = self._payloads.get(message_type)
+        if payload is None:
+            payload = {
+                "type": message_type,
+                "version": self.version,
+                "data": self.state,
+                "timestamp": self.timestamp,
+            }
+            self._payloads[message_type] = payload
+        return payload
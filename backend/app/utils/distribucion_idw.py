@@ -1,10 +1,10 @@
 import numpy as np
-from functools import lru_cache
+from scipy.sparse.csgraph import dijkstra
 
-def generar_distribucion_idw(x, y, z, x_min, x_max, y_min, y_max, power=2):
+def generar_distribucion_idw(x, y, z, x_min, x_max, y_min, y_max, power=2, grid_size=50):
     """Generar distribución usando Inverse Distance Weighting - Mismo código"""
-    xi = np.linspace(x_min, x_max, 50)
-    yi = np.linspace(y_min, y_max, 50)
+    xi = np.linspace(x_min, x_max, grid_size)
+    yi = np.linspace(y_min, y_max, grid_size)
     xi, yi = np.meshgrid(xi, yi)
 
     zi = np.zeros_like(xi)
@@ -20,14 +20,99 @@ def generar_distribucion_idw(x, y, z, x_min, x_max, y_min, y_max, power=2):
     zi = zi / weight_sum
     return xi, yi, zi
 
-@lru_cache(maxsize=10)  # ← Cache para 10 resultados diferentes
-def generar_distribucion_idw_cached(x_tuple, y_tuple, z_tuple, x_min, x_max, y_min, y_max, power=2):
+
+class _GeodesicWeights:
     """
-    Versión cacheada - Convierte arrays a tuples para poder cachear
+    Pesos IDW normalizados (sensores x celdas) con distancias geodésicas:
+    el camino más corto por la grilla sin atravesar muros ni obstáculos
+    (Dijkstra desde cada sensor). Las filas de distancias se guardan por
+    posición de sensor para el plano y la grilla actuales, así que cuando un
+    sensor entra o sale del subconjunto vigente solo se eligen las filas y se
+    renormaliza; Dijkstra corre únicamente para posiciones nuevas.
     """
-    # Convertir tuples back a arrays numpy
-    x = np.array(x_tuple)
-    y = np.array(y_tuple) 
-    z = np.array(z_tuple)
-    
-    return generar_distribucion_idw(x, y, z, x_min, x_max, y_min, y_max, power)
+
+    def __init__(self):
+        self._grid_key = None
+        self._plan = None
+        # (x, y) del sensor -> distancias geodésicas a cada celda
+        self._rows = {}
+        self._weights_key = None
+
+    def _distances(self, points):
+        """Distancias desde cada punto (entrando por el nodo libre más cercano)"""
+        px = np.array([p[0] for p in points])
+        py = np.array([p[1] for p in points])
+        offset = np.hypot(
+            self._node_x[self._free_nodes][None, :] - px[:, None],
+            self._node_y[self._free_nodes][None, :] - py[:, None],
+        )
+        nearest = offset.argmin(axis=1)
+        entry = self._free_nodes[nearest]
+        dist = dijkstra(self._graph, directed=False, indices=entry)
+        return dist + offset[np.arange(len(points)), nearest][:, None]
+
+    def get(self, plan, x, y, xi, yi, power):
+        grid_key = (xi.shape, xi[0, 0], xi[0, -1], yi[0, 0], yi[-1, 0])
+        if grid_key != self._grid_key or plan is not self._plan:
+            graph, passable = plan.graph(xi, yi)
+            self._graph = graph
+            self._node_x = xi.ravel()
+            self._node_y = yi.ravel()
+            self._free_nodes = np.flatnonzero(passable.ravel())
+            self._rows = {}
+            self._weights_key = None
+            self._grid_key = grid_key
+            self._plan = plan
+
+        weights_key = (x.tobytes(), y.tobytes(), power)
+        if weights_key == self._weights_key:
+            return self
+
+        points = list(zip(x.tolist(), y.tolist()))
+        missing = [p for p in dict.fromkeys(points) if p not in self._rows]
+        if missing:
+            self._rows.update(zip(missing, self._distances(missing)))
+
+        dist = np.vstack([self._rows[p] for p in points])
+        # Sin camino (celdas bloqueadas o aisladas): peso nulo
+        reachable = np.isfinite(dist)
+        weights = np.where(reachable, 1.0 / np.maximum(dist, 0.01) ** power, 0.0)
+        weight_sum = weights.sum(axis=0)
+        self.covered = weight_sum > 0
+        self.weights = weights / np.where(self.covered, weight_sum, 1.0)
+        self._weights_key = weights_key
+        return self
+
+
+_geodesic = _GeodesicWeights()
+
+
+def reset_geodesic_weights():
+    """Descartar la matriz de pesos geodésicos (p. ej. al recargar el plano)"""
+    _geodesic.__init__()
+
+
+def generar_distribucion_idw_geodesica(
+    x, y, z, plan, x_min, x_max, y_min, y_max, power=2, grid_size=50
+):
+    """
+    IDW con distancias geodésicas sobre el plano (el sonido no atraviesa
+    muros). Las celdas sin camino a ningún sensor, como el interior de un
+    obstáculo, toman el valor del IDW euclidiano para que la grilla no tenga
+    huecos; el mapa de calor las recorta con la máscara del plano.
+    """
+    xi, yi = np.meshgrid(
+        np.linspace(x_min, x_max, grid_size), np.linspace(y_min, y_max, grid_size)
+    )
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    geodesic = _geodesic.get(plan, x, y, xi, yi, power)
+
+    zi = (np.asarray(z, dtype=np.float64) @ geodesic.weights).reshape(xi.shape)
+    if not geodesic.covered.all():
+        _, _, euclidean = generar_distribucion_idw(
+            x, y, z, x_min, x_max, y_min, y_max, power, grid_size
+        )
+        uncovered = ~geodesic.covered.reshape(xi.shape)
+        zi[uncovered] = euclidean[uncovered]
+    return xi, yi, zi
@@ -0,0 +1,30 @@
+from typing import Optional
+
+# Unidades de duración Flux soportadas (en segundos)
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """
+    Convertir una duración Flux simple (ej. "10s", "15m", "1h", "1d") a segundos.
+
+    Returns:
+        Segundos, o None si el formato no es soportado (ej. "1mo" o compuestos)
+    """
+    if not value:
+        return None
+    value = value.strip()
+    unit = value[-1:]
+    number = value[:-1]
+    if unit not in _DURATION_UNITS or not number.isdigit():
+        return None
+    return int(number) * _DURATION_UNITS[unit]
+
+
+def format_duration(seconds: int) -> str:
+    """Convertir segundos a la duración Flux más compacta (ej. 3600 -> "1h")"""
+    for unit in ("w", "d", "h", "m"):
+        size = _DURATION_UNITS[unit]
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
@@ -1,37 +1,317 @@
 import numpy as np
-from scipy.optimize import minimize
-from functools import lru_cache
-
-
-
-def calcular_epicentro(x, y, z):
-    """Calcular epicentro usando optimización - Mismo código"""
-
-    def error_function(point):
-        px, py = point
-        error = 0
-        for i in range(len(x)):
-            dist = np.sqrt((px - x[i]) ** 2 + (py - y[i]) ** 2)
-            expected_value = z[i] * np.exp(-dist / 10.0)
-            error += (z[i] - expected_value) ** 2
-        return error
-
-    initial_guess = [np.mean(x), np.mean(y)]
-    # Limitar bounds al tamaño del plano para coordenadas relativas
-    bounds = [(max(min(x), -1.0), min(max(x), 6.0)), 
-              (max(min(y), -2.0), min(max(y), 16.0))]
-    result = minimize(error_function, initial_guess, bounds=bounds, method="L-BFGS-B")
-    return result.x[0], result.x[1] if result.success else (
-        x[np.argmax(z)],
-        y[np.argmax(z)],
+from scipy.ndimage import maximum_filter
+from scipy.optimize import least_squares, minimize
+
+from app.utils.floor_plan import (
+    FLOOR_X_MAX,
+    FLOOR_X_MIN,
+    FLOOR_Y_MAX,
+    FLOOR_Y_MIN,
+    GRID_SIZE,
+)
+
+# Modelo de propagación: L_i = L0 - 20 log10(d_i) - alpha * d_i (d en baldosas)
+DEFAULT_ALPHA = 0.02  # dB por baldosa de absorción adicional del recinto
+MIN_DISTANCE = 1.0  # baldosas; evita log(0) junto a un sensor
+NOISE_FLOOR_DB = 1.0  # desviación mínima asumida de las mediciones
+_CHI2_2DOF_95 = 5.991  # región de confianza del 95% para (x, y)
+
+_FLOOR_BOUNDS = [(FLOOR_X_MIN, FLOOR_X_MAX), (FLOOR_Y_MIN, FLOOR_Y_MAX)]
+
+
+def _path_loss(dist, alpha):
+    """Atenuación por divergencia esférica más absorción lineal"""
+    dist = np.maximum(dist, MIN_DISTANCE)
+    return 20.0 * np.log10(dist) + alpha * dist
+
+
+def _floor_grid():
+    xi, yi = np.meshgrid(
+        np.linspace(FLOOR_X_MIN, FLOOR_X_MAX, GRID_SIZE),
+        np.linspace(FLOOR_Y_MIN, FLOOR_Y_MAX, GRID_SIZE),
+    )
+    return xi, yi
+
+
+class _GridGeometry:
+    """
+    Atenuación de cada celda de la grilla a cada sensor y sus sumas por
+    celda. Depende solo de la geometría, así que se recalcula únicamente
+    cuando cambian los sensores o la grilla.
+    """
+
+    def __init__(self):
+        self._key = None
+
+    def get(self, x, y, grid_x, grid_y, alpha):
+        key = (x.tobytes(), y.tobytes(), grid_x.shape, grid_x[0], grid_x[-1],
+               grid_y[0], grid_y[-1], alpha)
+        if key != self._key:
+            dist = np.hypot(grid_x[:, None] - x[None, :], grid_y[:, None] - y[None, :])
+            self.loss = _path_loss(dist, alpha)
+            self.loss_sum = self.loss.sum(axis=1)
+            self.loss_sq_sum = np.einsum("ij,ij->i", self.loss, self.loss)
+            self._key = key
+        return self
+
+
+_geometry = _GridGeometry()
+
+
+def _misfit(point, x, y, z, alpha):
+    """
+    Suma de residuos al cuadrado del modelo con L0 óptimo (forma cerrada) y
+    su gradiente analítico respecto a la posición de la fuente.
+    """
+    dx = point[0] - x
+    dy = point[1] - y
+    dist = np.sqrt(dx * dx + dy * dy)
+    clamped = np.maximum(dist, MIN_DISTANCE)
+    target = z + 20.0 * np.log10(clamped) + alpha * clamped
+    residual = target - target.mean()
+    error = np.dot(residual, residual)
+
+    # L0 es óptimo, así que su derivada no aporta al gradiente
+    slope = np.where(dist > MIN_DISTANCE, 20.0 / (np.log(10.0) * clamped) + alpha, 0.0)
+    weight = 2.0 * residual * slope / np.maximum(dist, 1e-12)
+    return error, np.array([np.dot(weight, dx), np.dot(weight, dy)])
+
+
+def localizar_fuente(x, y, z, grid=None, alpha=DEFAULT_ALPHA, initial_guess=None):
+    """
+    Localizar una fuente sonora con el modelo de atenuación
+    L_i = L0 - 20 log10(d_i) - alpha * d_i.
+
+    Primero evalúa el ajuste en toda la grilla del plano (vectorizado, con el
+    nivel L0 en forma cerrada por celda) y luego refina el mejor punto con
+    L-BFGS-B dentro de los límites del plano.
+
+    Args:
+        x, y, z: Coordenadas (baldosas) y niveles (dB) de los sensores
+        grid: Tupla (xi, yi) de la grilla IDW; por defecto la grilla del plano
+        alpha: Absorción adicional en dB por baldosa
+        initial_guess: Estimación anterior (x, y) para arrancar en caliente
+
+    Returns:
+        Diccionario con x, y, level (L0 en dB a 1 baldosa), confidence_radius
+        (baldosas, región del 95%) y residual_db (error RMS del ajuste)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    count = len(z)
+    if count < 2:
+        return {
+            "x": float(x[0]),
+            "y": float(y[0]),
+            "level": float(z[0]),
+            "confidence_radius": None,
+            "residual_db": 0.0,
+        }
+
+    grid_x, grid_y = grid if grid is not None else _floor_grid()
+    grid_x = np.asarray(grid_x, dtype=np.float64).ravel()
+    grid_y = np.asarray(grid_y, dtype=np.float64).ravel()
+
+    # Búsqueda en grilla: SSE(celda) = sum t^2 - (sum t)^2 / n con t = z + pérdida
+    geometry = _geometry.get(x, y, grid_x, grid_y, alpha)
+    z_sum = z.sum()
+    sse = (
+        geometry.loss_sq_sum
+        + 2.0 * (geometry.loss @ z)
+        + np.dot(z, z)
+        - (geometry.loss_sum + z_sum) ** 2 / count
+    )
+    best = int(np.argmin(sse))
+    start = np.array([grid_x[best], grid_y[best]])
+
+    # Arranque en caliente si la estimación anterior ajusta mejor que la celda
+    if initial_guess is not None:
+        guess = np.clip(
+            np.asarray(initial_guess, dtype=np.float64),
+            [FLOOR_X_MIN, FLOOR_Y_MIN],
+            [FLOOR_X_MAX, FLOOR_Y_MAX],
+        )
+        if _misfit(guess, x, y, z, alpha)[0] < sse[best]:
+            start = guess
+
+    result = minimize(
+        _misfit, start, args=(x, y, z, alpha), jac=True,
+        bounds=_FLOOR_BOUNDS, method="L-BFGS-B",
+    )
+    # Si el refinamiento no mejora (p. ej. termina en "ABNORMAL"), se
+    # conserva el punto de partida
+    start_error = _misfit(start, x, y, z, alpha)[0]
+    point, error = (result.x, result.fun) if result.fun <= start_error else (start, start_error)
+
+    dist = np.hypot(point[0] - x, point[1] - y)
+    level = float(np.mean(z + _path_loss(dist, alpha)))
+
+    # Región de confianza: celdas cuyo ajuste no es significativamente peor
+    variance = max(error / max(count - 3, 1), NOISE_FLOOR_DB ** 2)
+    region = sse <= error + _CHI2_2DOF_95 * variance
+    cell = np.hypot(
+        (grid_x.max() - grid_x.min()) / max(np.sqrt(len(grid_x)) - 1, 1),
+        (grid_y.max() - grid_y.min()) / max(np.sqrt(len(grid_y)) - 1, 1),
     )
-@lru_cache(maxsize=5)  # ← Cache para 5 resultados diferentes  
-def calcular_epicentro_cached(x_tuple, y_tuple, z_tuple):
+    radius = cell / 2
+    if region.any():
+        radius = max(
+            radius,
+            float(np.max(np.hypot(grid_x[region] - point[0], grid_y[region] - point[1]))),
+        )
+
+    return {
+        "x": float(point[0]),
+        "y": float(point[1]),
+        "level": level,
+        "confidence_radius": radius,
+        "residual_db": float(np.sqrt(error / count)),
+    }
+
+
+def buscar_maximos_locales(grid_x, grid_y, grid_z, max_peaks, neighborhood=5):
     """
-    Versión cacheada del cálculo de epicentro
+    Máximos locales de una grilla interpolada (semillas de fuentes), del más
+    alto al más bajo. Solo se consideran celdas sobre la mediana de la grilla.
+    """
+    grid_z = np.asarray(grid_z, dtype=np.float64)
+    peaks = (grid_z == maximum_filter(grid_z, size=neighborhood, mode="nearest")) & (
+        grid_z > np.median(grid_z)
+    )
+    rows, cols = np.nonzero(peaks)
+    order = np.argsort(grid_z[rows, cols])[::-1][:max_peaks]
+    return [
+        (float(grid_x[rows[i], cols[i]]), float(grid_y[rows[i], cols[i]]))
+        for i in order
+    ]
+
+
+def _mixture_terms(params, x, y, beta, k):
+    """Contribución energética de cada fuente en cada sensor (K x N)"""
+    dx = params[:k, None] - x[None, :]
+    dy = params[k : 2 * k, None] - y[None, :]
+    dist = np.sqrt(dx * dx + dy * dy)
+    clamped = np.maximum(dist, MIN_DISTANCE)
+    # 10^(-pérdida/10) = d^-2 * exp(-beta d), con beta = alpha ln(10) / 10
+    contrib = np.exp(params[2 * k :, None] - beta * clamped) / (clamped * clamped)
+    return dx, dy, dist, clamped, contrib
+
+
+def _mixture_residuals(params, x, y, z, beta, k):
+    contrib = _mixture_terms(params, x, y, beta, k)[-1]
+    return 10.0 * np.log10(contrib.sum(axis=0)) - z
+
+
+def _mixture_jacobian(params, x, y, z, beta, k):
+    dx, dy, dist, clamped, contrib = _mixture_terms(params, x, y, beta, k)
+    share = (10.0 / np.log(10.0)) * contrib / contrib.sum(axis=0)
+    slope = np.where(dist > MIN_DISTANCE, -2.0 / clamped - beta, 0.0)
+    radial = share * slope / np.maximum(dist, 1e-12)
+    return np.hstack([(radial * dx).T, (radial * dy).T, share.T])
+
+
+def localizar_fuentes(
+    x, y, z, seeds, max_sources=3, alpha=DEFAULT_ALPHA, previous=None, main=None
+):
+    """
+    Ajustar una mezcla de hasta `max_sources` fuentes puntuales: la energía en
+    cada sensor es la suma de las energías de las fuentes atenuadas con el
+    mismo modelo que localizar_fuente. Posiciones y potencias se ajustan por
+    mínimos cuadrados (en dB) y el número de fuentes se elige por BIC.
+
+    Args:
+        x, y, z: Coordenadas (baldosas) y niveles (dB) de los sensores
+        seeds: Posiciones candidatas (x, y), p. ej. máximos locales de la IDW
+        max_sources: Máximo de fuentes simultáneas
+        alpha: Absorción adicional en dB por baldosa
+        previous: Fuentes del ciclo anterior [{"x", "y", "level"}] que se
+            usan como arranque en caliente
+        main: Fuente única de localizar_fuente {"x", "y", "level"}; es la
+            primera semilla, así el ajuste con k=1 parte de ella
+
+    Returns:
+        Lista de fuentes {x, y, level, confidence_radius} de mayor a menor nivel
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    count = len(z)
+    beta = alpha * np.log(10.0) / 10.0
+
+    # Semillas: fuente principal, fuentes anteriores y luego máximos que no
+    # estén ya cubiertos
+    starts = []
+    candidates = ([main] if main is not None else []) + list(previous or [])
+    for s in candidates:
+        if all(np.hypot(s["x"] - px, s["y"] - py) > 4 * MIN_DISTANCE for px, py, _ in starts):
+            starts.append((s["x"], s["y"], s["level"]))
+    for sx, sy in seeds:
+        if all(np.hypot(sx - px, sy - py) > 4 * MIN_DISTANCE for px, py, _ in starts):
+            dist = np.hypot(sx - x, sy - y)
+            nearest = int(np.argmin(dist))
+            starts.append((sx, sy, float(z[nearest] + _path_loss(dist[nearest], alpha))))
+
+    # Cada fuente aporta 3 parámetros: se necesitan más sensores que parámetros
+    max_sources = min(max_sources, len(starts), (count - 1) // 3)
+    best = None
+    for k in range(1, max_sources + 1):
+        chosen = starts[:k]
+        initial = np.array(
+            [s[0] for s in chosen]
+            + [s[1] for s in chosen]
+            + [s[2] * np.log(10.0) / 10.0 for s in chosen]
+        )
+        lower = [FLOOR_X_MIN] * k + [FLOOR_Y_MIN] * k + [0.0] * k
+        upper = [FLOOR_X_MAX] * k + [FLOOR_Y_MAX] * k + [80.0] * k
+        initial = np.clip(initial, lower, upper)
+        fit = least_squares(
+            _mixture_residuals, initial, jac=_mixture_jacobian,
+            bounds=(lower, upper), args=(x, y, z, beta, k), max_nfev=50,
+        )
+        sse = float(np.dot(fit.fun, fit.fun))
+        bic = count * np.log(max(sse, 1e-9) / count) + 3 * k * np.log(count)
+        if best is None or bic < best[0]:
+            best = (bic, k, fit, sse)
+
+    if best is None:
+        return []
+
+    _, k, fit, sse = best
+    params = fit.x
+    variance = max(sse / max(count - 3 * k, 1), NOISE_FLOOR_DB ** 2)
+    try:
+        covariance = variance * np.linalg.pinv(fit.jac.T @ fit.jac)
+    except np.linalg.LinAlgError:
+        covariance = None
+
+    max_radius = float(np.hypot(FLOOR_X_MAX - FLOOR_X_MIN, FLOOR_Y_MAX - FLOOR_Y_MIN))
+    sources = []
+    for i in range(k):
+        radius = max_radius
+        if covariance is not None:
+            block = covariance[np.ix_([i, k + i], [i, k + i])]
+            largest = float(np.max(np.linalg.eigvalsh(block)))
+            radius = min(np.sqrt(_CHI2_2DOF_95 * max(largest, 0.0)), max_radius)
+        sources.append(
+            {
+                "x": float(params[i]),
+                "y": float(params[k + i]),
+                "level": float(params[2 * k + i] * 10.0 / np.log(10.0)),
+                "confidence_radius": float(radius),
+            }
+        )
+    sources.sort(key=lambda s: s["level"], reverse=True)
+    return sources
+
+
+def calcular_epicentro(x, y, z, initial_guess=None):
+    """
+    Calcular epicentro (x, y) con el motor de localización.
+
+    Args:
+        x, y, z: Coordenadas y niveles de los sensores
+        initial_guess: Punto de partida (x, y), por ejemplo el epicentro anterior
     """
-    x = np.array(x_tuple)
-    y = np.array(y_tuple)
-    z = np.array(z_tuple)
-    
-    return calcular_epicentro(x, y, z)
\ No newline at end of file
+    result = localizar_fuente(x, y, z, initial_guess=initial_guess)
+    return result["x"], result["y"]
@@ -0,0 +1,242 @@
+"""
+Plano del recinto (coordenadas relativas en baldosas): dimensiones y, si
+sensores.yaml lo define, muros, obstáculos y contorno transitable.
+"""
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+# 57 x 66 baldosas de 0.3 m (ver location/sensores.yaml)
+FLOOR_X_MIN = 0.0
+FLOOR_X_MAX = 57.0
+FLOOR_Y_MIN = 0.0
+FLOOR_Y_MAX = 66.0
+
+# Metros por baldosa
+TILE_METERS = 0.3
+
+# Puntos por eje de la grilla de interpolación
+GRID_SIZE = 50
+
+
+def _points_in_polygon(x: np.ndarray, y: np.ndarray, polygon: np.ndarray):
+    """Regla par-impar vectorizada sobre los puntos"""
+    inside = np.zeros(np.shape(x), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        if y1 == y2:
+            continue
+        crosses = (y1 > y) != (y2 > y)
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def _distance_to_segment(x: np.ndarray, y: np.ndarray, a, b) -> np.ndarray:
+    ax, ay = a
+    bx, by = b
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return np.hypot(x - ax, y - ay)
+    t = np.clip(((x - ax) * dx + (y - ay) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(x - (ax + t * dx), y - (ay + t * dy))
+
+
+class FloorPlan:
+    """
+    Geometría transitable del recinto definida en la sección `floor_plan` de
+    sensores.yaml:
+
+        floor_plan:
+          outline: [[0, 0], [57, 0], [57, 66], [0, 66]]  # contorno (opcional)
+          walls:                                         # polilíneas de muros
+            - [[28, 0], [28, 30]]
+          wall_thickness: 0.5                            # baldosas
+          obstacles:                                     # polígonos macizos
+            - [[10, 40], [15, 40], [15, 45], [10, 45]]
+          raster: "plano.npy"  # o lista de filas de texto ('#' = bloqueado)
+
+    El raster (archivo .npy/.txt relativo al YAML, o filas inline) cubre todo
+    el plano con la primera fila arriba (y máxima). Se combina con los
+    polígonos si ambos están presentes.
+    """
+
+    def __init__(self, config: Dict[str, Any], base_dir: Optional[str] = None):
+        self.outline = (
+            np.asarray(config["outline"], dtype=np.float64)
+            if config.get("outline")
+            else None
+        )
+        self.walls = [
+            np.asarray(wall, dtype=np.float64) for wall in config.get("walls") or []
+        ]
+        self.wall_thickness = float(config.get("wall_thickness", 0.5))
+        self.obstacles = [
+            np.asarray(obstacle, dtype=np.float64)
+            for obstacle in config.get("obstacles") or []
+        ]
+        self.raster = self._load_raster(config.get("raster"), base_dir)
+        self._graphs: Dict[Any, Any] = {}
+
+        for name, shapes in (("walls", self.walls), ("obstacles", self.obstacles)):
+            for shape in shapes:
+                if shape.ndim != 2 or shape.shape[1] != 2 or len(shape) < 2:
+                    raise ValueError(
+                        f"floor_plan.{name}: se esperan listas de puntos [x, y]"
+                    )
+
+    @staticmethod
+    def _load_raster(raster, base_dir: Optional[str]) -> Optional[np.ndarray]:
+        """Raster de celdas bloqueadas (True) con la fila 0 arriba"""
+        if raster is None:
+            return None
+        if isinstance(raster, str):
+            path = raster
+            if not os.path.isabs(path):
+                path = os.path.join(base_dir or ".", path)
+            if path.endswith(".npy"):
+                return np.load(path).astype(bool)
+            with open(path, "r") as file:
+                raster = [line.rstrip("\n") for line in file if line.strip()]
+        rows = [list(row) for row in raster]
+        width = max(len(row) for row in rows)
+        blocked = np.zeros((len(rows), width), dtype=bool)
+        for i, row in enumerate(rows):
+            blocked[i, : len(row)] = [char == "#" for char in row]
+        return blocked
+
+    @property
+    def has_barriers(self) -> bool:
+        """
+        True si hay algo que bloquee el paso del sonido dentro del recinto.
+        El contorno solo no cuenta: recorta la grilla, pero no justifica el
+        IDW geodésico.
+        """
+        return bool(self.walls or self.obstacles) or self.raster is not None
+
+    def _raster_blocked(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        rows, cols = self.raster.shape
+        col = ((x - FLOOR_X_MIN) / (FLOOR_X_MAX - FLOOR_X_MIN) * cols).astype(int)
+        row = ((FLOOR_Y_MAX - y) / (FLOOR_Y_MAX - FLOOR_Y_MIN) * rows).astype(int)
+        return self.raster[np.clip(row, 0, rows - 1), np.clip(col, 0, cols - 1)]
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Puntos transitables: dentro del contorno, fuera de obstáculos y muros"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        free = np.ones(x.shape, dtype=bool)
+        if self.outline is not None:
+            free &= _points_in_polygon(x, y, self.outline)
+        for obstacle in self.obstacles:
+            free &= ~_points_in_polygon(x, y, obstacle)
+        half = self.wall_thickness / 2
+        for wall in self.walls:
+            for a, b in zip(wall[:-1], wall[1:]):
+                free &= _distance_to_segment(x, y, a, b) > half
+        if self.raster is not None:
+            free &= ~self._raster_blocked(x, y)
+        return free
+
+    def passable_grid(self, grid_x: np.ndarray, grid_y: np.ndarray) -> np.ndarray:
+        """
+        Nodos transitables de una grilla regular (filas = y). Los muros se
+        rasterizan sobre la grilla para que ninguno quede entre dos nodos sin
+        cortar la conexión, aunque sean más finos que una celda.
+        """
+        passable = self.contains(grid_x, grid_y)
+        rows, cols = grid_x.shape
+        x0, dx = grid_x[0, 0], grid_x[0, 1] - grid_x[0, 0]
+        y0, dy = grid_y[0, 0], grid_y[1, 0] - grid_y[0, 0]
+        step = min(abs(dx), abs(dy)) / 3
+        for wall in self.walls:
+            for a, b in zip(wall[:-1], wall[1:]):
+                samples = max(int(np.hypot(*(b - a)) / step), 1) + 1
+                t = np.linspace(0.0, 1.0, samples)
+                col = np.rint((a[0] + t * (b[0] - a[0]) - x0) / dx).astype(int)
+                row = np.rint((a[1] + t * (b[1] - a[1]) - y0) / dy).astype(int)
+                keep = (row >= 0) & (row < rows) & (col >= 0) & (col < cols)
+                passable[row[keep], col[keep]] = False
+        return passable
+
+    def graph(self, grid_x: np.ndarray, grid_y: np.ndarray):
+        """
+        Grafo de vecindad 8 entre nodos transitables con pesos en baldosas
+        (cacheado por grilla). Las diagonales solo se permiten si los dos
+        vecinos ortogonales también son transitables, para no cruzar muros
+        rasterizados en escalera.
+
+        Returns:
+            Tupla (matriz CSR dispersa, máscara de nodos transitables)
+        """
+        key = (grid_x.shape, grid_x[0, 0], grid_x[0, -1], grid_y[0, 0], grid_y[-1, 0])
+        cached = self._graphs.get(key)
+        if cached is not None:
+            return cached
+
+        passable = self.passable_grid(grid_x, grid_y)
+        rows, cols = passable.shape
+        dx = abs(grid_x[0, 1] - grid_x[0, 0])
+        dy = abs(grid_y[1, 0] - grid_y[0, 0])
+        node = np.arange(rows * cols).reshape(rows, cols)
+
+        sources, targets, weights = [], [], []
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            r0, r1 = slice(0, rows - dr), slice(dr, rows)
+            c0 = slice(max(-dc, 0), cols - max(dc, 0))
+            c1 = slice(max(dc, 0), cols + min(dc, 0) or None)
+            valid = passable[r0, c0] & passable[r1, c1]
+            if dr and dc:
+                # Diagonal: los dos nodos ortogonales intermedios libres
+                valid &= passable[r0, c1] & passable[r1, c0]
+            sources.append(node[r0, c0][valid])
+            targets.append(node[r1, c1][valid])
+            weights.append(np.full(int(valid.sum()), np.hypot(dr * dy, dc * dx)))
+
+        edges = (np.concatenate(sources), np.concatenate(targets))
+        graph = csr_matrix(
+            (np.concatenate(weights), edges), shape=(rows * cols, rows * cols)
+        )
+        self._graphs[key] = (graph, passable)
+        return graph, passable
+
+
+# Plano vigente y la versión del registro de sensores de la que salió
+_floor_plan: Optional[FloorPlan] = None
+_floor_plan_version: Optional[int] = None
+
+
+def get_floor_plan() -> Optional[FloorPlan]:
+    """Plano definido en sensores.yaml, o None si no hay sección floor_plan"""
+    global _floor_plan, _floor_plan_version
+    from app.utils.sensor_registry import sensor_registry
+
+    snapshot = sensor_registry.snapshot
+    if snapshot.version != _floor_plan_version:
+        _floor_plan_version = snapshot.version
+        _floor_plan = None
+        if snapshot.floor_plan:
+            try:
+                _floor_plan = FloorPlan(snapshot.floor_plan, snapshot.base_dir)
+                logger.info("Plano del recinto cargado desde sensores.yaml")
+            except Exception as e:
+                logger.error(f"floor_plan inválido en sensores.yaml, se ignora: {e}")
+    return _floor_plan
+
+
+def floor_mask(x, y):
+    """
+    Máscara booleana de los puntos (x, y) que caen dentro del plano y, si hay
+    floor_plan, en zonas transitables (fuera de muros y obstáculos)
+    """
+    mask = (x >= FLOOR_X_MIN) & (x <= FLOOR_X_MAX)
+    mask &= (y >= FLOOR_Y_MIN) & (y <= FLOOR_Y_MAX)
+    plan = get_floor_plan()
+    if plan is not None:
+        mask &= plan.contains(x, y)
+    return mask
@@ -0,0 +1,207 @@
+"""Renderizado de la grilla IDW a imagen (paletas, remuestreo y PNG)"""
+
+import struct
+import zlib
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+# Paletas del mapa de calor (mismas paradas que el frontend, FloorPlanMap.jsx)
+PALETTES = {
+    "viridis": [
+        (0.267, 0.005, 0.329),
+        (0.283, 0.141, 0.458),
+        (0.263, 0.244, 0.533),
+        (0.227, 0.343, 0.576),
+        (0.196, 0.43, 0.596),
+        (0.17, 0.515, 0.596),
+        (0.157, 0.592, 0.577),
+        (0.165, 0.664, 0.537),
+        (0.208, 0.732, 0.479),
+        (0.287, 0.791, 0.403),
+        (0.403, 0.837, 0.312),
+        (0.552, 0.868, 0.217),
+        (0.722, 0.879, 0.159),
+        (0.893, 0.865, 0.16),
+        (0.993, 0.906, 0.144),
+    ],
+    "plasma": [
+        (0.05, 0.03, 0.528),
+        (0.316, 0.016, 0.565),
+        (0.481, 0.015, 0.556),
+        (0.621, 0.085, 0.508),
+        (0.735, 0.17, 0.434),
+        (0.827, 0.271, 0.35),
+        (0.895, 0.38, 0.271),
+        (0.938, 0.5, 0.203),
+        (0.962, 0.625, 0.153),
+        (0.969, 0.752, 0.126),
+        (0.957, 0.877, 0.137),
+        (0.94, 0.976, 0.131),
+    ],
+    "inferno": [
+        (0.001, 0.0, 0.014),
+        (0.112, 0.027, 0.215),
+        (0.219, 0.062, 0.334),
+        (0.329, 0.1, 0.37),
+        (0.44, 0.139, 0.385),
+        (0.552, 0.178, 0.381),
+        (0.657, 0.222, 0.358),
+        (0.761, 0.278, 0.32),
+        (0.856, 0.351, 0.268),
+        (0.926, 0.444, 0.204),
+        (0.969, 0.556, 0.136),
+        (0.988, 0.682, 0.092),
+        (0.988, 0.816, 0.109),
+        (0.961, 0.951, 0.242),
+    ],
+    "magma": [
+        (0.001, 0.0, 0.014),
+        (0.135, 0.027, 0.235),
+        (0.245, 0.072, 0.354),
+        (0.355, 0.115, 0.39),
+        (0.466, 0.159, 0.405),
+        (0.578, 0.198, 0.401),
+        (0.683, 0.242, 0.378),
+        (0.787, 0.298, 0.34),
+        (0.882, 0.371, 0.288),
+        (0.952, 0.464, 0.224),
+        (0.995, 0.576, 0.156),
+        (1.0, 0.702, 0.112),
+        (1.0, 0.836, 0.129),
+        (0.981, 0.971, 0.262),
+    ],
+    "bluered": [
+        (0.0, 0.0, 1.0),
+        (0.25, 0.0, 0.75),
+        (0.5, 0.0, 0.5),
+        (0.75, 0.0, 0.25),
+        (1.0, 0.0, 0.0),
+    ],
+    "redyellowgreen": [
+        (0.8, 1.0, 0.8),
+        (0.6, 1.0, 0.6),
+        (0.0, 0.9, 0.0),
+        (0.5, 1.0, 0.0),
+        (1.0, 1.0, 0.0),
+        (1.0, 0.7, 0.0),
+        (1.0, 0.4, 0.0),
+        (1.0, 0.0, 0.0),
+    ],
+}
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(name: str) -> np.ndarray:
+    """Tabla de 256 colores RGB (uint8) interpolando las paradas de la paleta"""
+    stops = np.asarray(PALETTES[name], dtype=np.float64)
+    positions = np.linspace(0.0, 1.0, len(stops))
+    levels = np.linspace(0.0, 1.0, 256)
+    lut = np.empty((256, 3), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.round(
+            np.interp(levels, positions, stops[:, channel]) * 255
+        )
+    lut.flags.writeable = False
+    return lut
+
+
+def sample_grid(
+    zi: np.ndarray,
+    bounds: Tuple[float, float, float, float],
+    view: Tuple[float, float, float, float],
+    width: int,
+    height: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Remuestrear la grilla (filas = y ascendente) en los centros de píxel de
+    `view` (x0, x1, y0, y1) con interpolación bilineal. La fila 0 de la imagen
+    corresponde a y1 (arriba del plano).
+
+    Returns:
+        Tupla (valores, x, y) de forma (height, width); fuera de `bounds`
+        los valores son NaN
+    """
+    x_min, x_max, y_min, y_max = bounds
+    x0, x1, y0, y1 = view
+    px = x0 + (np.arange(width) + 0.5) * (x1 - x0) / width
+    py = y1 - (np.arange(height) + 0.5) * (y1 - y0) / height
+    gx, gy = np.meshgrid(px, py)
+
+    rows, cols = zi.shape
+    row_idx = (gy - y_min) / (y_max - y_min) * (rows - 1)
+    col_idx = (gx - x_min) / (x_max - x_min) * (cols - 1)
+    values = map_coordinates(
+        zi, [row_idx, col_idx], order=1, mode="nearest", prefilter=False
+    )
+    outside = (gx < x_min) | (gx > x_max) | (gy < y_min) | (gy > y_max)
+    values[outside] = np.nan
+    return values, gx, gy
+
+
+def colorize(
+    values: np.ndarray,
+    vmin: float,
+    vmax: float,
+    palette: str = "viridis",
+    opacity: float = 1.0,
+    mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Valores en dB -> imagen RGBA (uint8) con la escala [vmin, vmax]"""
+    span = max(vmax - vmin, 1e-9)
+    normalized = np.clip((values - vmin) / span, 0.0, 1.0)
+    indices = np.nan_to_num(normalized * 255, nan=0.0).astype(np.uint8)
+
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = colormap_lut(palette)[indices]
+    visible = ~np.isnan(values)
+    if mask is not None:
+        visible &= mask
+    rgba[..., 3] = np.where(visible, np.uint8(round(opacity * 255)), np.uint8(0))
+    return rgba
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def encode_png(rgba: np.ndarray, level: int = 6) -> bytes:
+    """Codificar una imagen RGBA (alto, ancho, 4) como PNG de 8 bits"""
+    height, width, _ = rgba.shape
+    # Cada fila lleva el byte de filtro 0 (sin filtro) adelante
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def encode_webp(rgba: np.ndarray, quality: int = 80) -> bytes:
+    """Codificar como WebP (requiere el paquete opcional Pillow)"""
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, format="WEBP", quality=quality)
+    return buffer.getvalue()
+
+
+def webp_available() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
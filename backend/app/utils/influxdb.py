@@ -1,16 +1,67 @@
+import heapq
 import logging
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import influxdb_client as influxdb_module
-import numpy as np
 from influxdb_client.client.write_api import SYNCHRONOUS
 
 from app.utils.config_loader import get_sensor_coordinates
+from app.utils.durations import format_duration, parse_duration
+from app.utils.query_cache import query_cache
 
 logger = logging.getLogger(__name__)
 
+# Máximo de puntos devueltos como vista previa en las estadísticas
+STATISTICS_PREVIEW_POINTS = 500
+
+# Niveles de rollup por defecto: "ventana:retención" (retención 0 = infinita)
+_DEFAULT_ROLLUP_TIERS = "1m:30d,15m:180d,1h:730d,1d:0"
+
+
+class RollupTier:
+    """Nivel de datos pre-agregados (mean/min/max/count por micro_id)"""
+
+    def __init__(self, every: str, retention_seconds: int, bucket: str):
+        self.every = every
+        self.every_seconds = parse_duration(every)
+        self.retention_seconds = retention_seconds
+        self.bucket = bucket
+        self.task_name = f"sonido_rollup_{every}"
+        # Primer instante disponible en el bucket (None = desconocido/vacío)
+        self.available_since: Optional[datetime] = None
+
+    def __repr__(self):
+        return f"RollupTier(every={self.every}, bucket={self.bucket})"
+
+
+def _parse_rollup_tiers(spec: str, base_bucket: str) -> List[RollupTier]:
+    """Parsear INFLUXDB_ROLLUP_TIERS ("1m:30d,1h:0") en niveles ordenados de fino a grueso"""
+    tiers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        every, _, retention = item.partition(":")
+        every_seconds = parse_duration(every)
+        if every_seconds is None:
+            logger.warning(f"Nivel de rollup inválido ignorado: {item}")
+            continue
+        retention_seconds = parse_duration(retention) if retention not in ("", "0") else 0
+        tiers.append(
+            RollupTier(
+                every=every,
+                retention_seconds=retention_seconds or 0,
+                bucket=f"{base_bucket}_{every}",
+            )
+        )
+    return sorted(tiers, key=lambda t: t.every_seconds)
+
 
 class InfluxDBService:
     """Cliente para consultas a InfluxDB"""
@@ -29,6 +80,29 @@ class InfluxDBService:
         self.client = None
         self.query_api = None
 
+        # Rollups continuos (tareas InfluxDB que pre-agregan "sonido" por niveles)
+        self.rollups_enabled = os.getenv("INFLUXDB_ROLLUPS_ENABLED", "false").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        self.rollup_tiers = _parse_rollup_tiers(
+            os.getenv("INFLUXDB_ROLLUP_TIERS", _DEFAULT_ROLLUP_TIERS), self.bucket
+        )
+        # Retraso con el que corren las tareas (para datos que llegan tarde)
+        self.rollup_offset_seconds = int(os.getenv("INFLUXDB_ROLLUP_OFFSET", "30"))
+        # Puntos máximos por serie: rangos largos ensanchan la ventana pedida
+        # hasta una que sirva un nivel de rollup (0 = respetar la ventana)
+        self.max_points = int(os.getenv("INFLUXDB_MAX_POINTS", "0"))
+
+        # Fan-out paralelo de consultas grandes (grupos de micros x tramos de tiempo)
+        self.max_concurrency = int(os.getenv("INFLUXDB_MAX_CONCURRENCY", "4"))
+        self.fanout_micros_per_group = int(os.getenv("INFLUXDB_FANOUT_MICROS", "4"))
+        self.fanout_slice_seconds = int(
+            float(os.getenv("INFLUXDB_FANOUT_SLICE_HOURS", "168")) * 3600
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+
     def _ensure_client(self):
         """Asegurar que el cliente esté inicializado"""
         if not self.client and all([self.url, self.token, self.org]):
@@ -42,6 +116,354 @@ class InfluxDBService:
                 logger.error(f"Error inicializando cliente InfluxDB: {e}")
                 raise
 
+    # ------------------------------------------------------------------
+    # Rollups y planificador de consultas
+    # ------------------------------------------------------------------
+
+    def _rollup_task_flux(self, tier: RollupTier) -> str:
+        """Generar el script Flux de la tarea que materializa un nivel de rollup"""
+        lookback = format_duration(tier.every_seconds * 2)
+        stats = [
+            ("mean", "mean", ""),
+            ("min", "min", ""),
+            ("max", "max", ""),
+            ("count", "count", "\n  |> toFloat()"),
+        ]
+        outputs = "\n".join(
+            f"""
+data
+  |> aggregateWindow(every: {tier.every}, fn: {fn}, timeSrc: "_start", createEmpty: false){convert}
+  |> set(key: "_field", value: "{field}")
+  |> to(bucket: "{tier.bucket}", org: "{self.org}")"""
+            for field, fn, convert in stats
+        )
+        return f'''option task = {{name: "{tier.task_name}", every: {tier.every}, offset: {self.rollup_offset_seconds}s}}
+
+data = from(bucket: "{self.bucket}")
+  |> range(start: -{lookback})
+  |> filter(fn: (r) => r["_measurement"] == "sonido" and r["_field"] == "valor")
+  |> group(columns: ["_measurement", "micro_id"])
+{outputs}
+'''
+
+    def ensure_rollups(self):
+        """
+        Crear (si no existen) los buckets y tareas de rollup y detectar desde
+        cuándo hay datos disponibles en cada nivel.
+
+        Las tareas agregan los puntos crudos de "sonido" por micro_id en ventanas
+        fijas (mean/min/max/count) con la marca de tiempo al inicio de la ventana.
+        """
+        if not self.rollups_enabled:
+            return
+        self._ensure_client()
+        if not self.client:
+            return
+
+        from influxdb_client import BucketRetentionRules, TaskCreateRequest
+
+        buckets_api = self.client.buckets_api()
+        tasks_api = self.client.tasks_api()
+
+        for tier in self.rollup_tiers:
+            try:
+                if buckets_api.find_bucket_by_name(tier.bucket) is None:
+                    retention = [
+                        BucketRetentionRules(
+                            type="expire", every_seconds=tier.retention_seconds
+                        )
+                    ]
+                    buckets_api.create_bucket(
+                        bucket_name=tier.bucket,
+                        retention_rules=retention if tier.retention_seconds else None,
+                        org=self.org,
+                    )
+                    logger.info(f"Bucket de rollup creado: {tier.bucket}")
+
+                if not tasks_api.find_tasks(name=tier.task_name):
+                    tasks_api.create_task(
+                        task_create_request=TaskCreateRequest(
+                            org=self.org,
+                            flux=self._rollup_task_flux(tier),
+                            status="active",
+                            description=f"Rollup de sonido cada {tier.every}",
+                        )
+                    )
+                    logger.info(f"Tarea de rollup creada: {tier.task_name}")
+
+                tier.available_since = self._query_first_time(tier.bucket)
+            except Exception as e:
+                logger.error(f"Error preparando rollup {tier.every}: {e}")
+
+        backfill_days = int(os.getenv("INFLUXDB_ROLLUP_BACKFILL_DAYS", "0"))
+        if backfill_days > 0:
+            end_time = datetime.now(timezone.utc)
+            start_time = end_time - timedelta(days=backfill_days)
+            for tier in self.rollup_tiers:
+                if tier.available_since is None or tier.available_since > start_time:
+                    self.backfill_rollup(tier, start_time, end_time)
+
+    def backfill_rollup(self, tier: RollupTier, start_time: datetime, end_time: datetime):
+        """Materializar un nivel de rollup para un rango histórico (ejecución única)"""
+        self._ensure_client()
+        if not self.query_api:
+            return
+
+        step = tier.every_seconds
+        start_ts = int(start_time.timestamp()) // step * step
+        end_ts = int(end_time.timestamp()) // step * step
+        start_str = datetime.fromtimestamp(start_ts, timezone.utc).isoformat()
+        end_str = datetime.fromtimestamp(end_ts, timezone.utc).isoformat()
+
+        script = self._rollup_task_flux(tier)
+        # Reemplazar la cabecera de tarea y el rango relativo por el rango absoluto
+        body = script.split("\n", 1)[1]
+        lookback = format_duration(tier.every_seconds * 2)
+        body = body.replace(
+            f"range(start: -{lookback})", f"range(start: {start_str}, stop: {end_str})"
+        )
+
+        try:
+            self.query_api.query(body)
+            since = datetime.fromtimestamp(start_ts, timezone.utc)
+            if tier.available_since is None or since < tier.available_since:
+                tier.available_since = since
+            logger.info(f"Backfill de rollup {tier.every}: {start_str} -> {end_str}")
+        except Exception as e:
+            logger.error(f"Error en backfill de rollup {tier.every}: {e}")
+
+    def _query_first_time(self, bucket: str) -> Optional[datetime]:
+        """Obtener el primer instante con datos en un bucket (None si está vacío)"""
+        query = f'''
+        from(bucket: "{bucket}")
+          |> range(start: 0)
+          |> filter(fn: (r) => r["_measurement"] == "sonido" and r["_field"] == "count")
+          |> group()
+          |> first()
+        '''
+        try:
+            tables = self.query_api.query(query)
+            for table in tables:
+                for record in table.records:
+                    return record.get_time()
+        except Exception as e:
+            logger.warning(f"No se pudo determinar el inicio de {bucket}: {e}")
+        return None
+
+    def plan_aggregation(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        aggregation_window: str,
+        max_points: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Elegir la fuente de datos más gruesa que satisface la ventana y el rango.
+
+        Un nivel sirve si su ventana divide exactamente la ventana pedida, si el
+        rango completo está dentro de su retención y si ya tiene datos desde
+        start_time. El último tramo (aún no materializado por la tarea) se
+        consulta sobre los datos crudos a partir de `cutoff`.
+
+        Args:
+            start_time: Inicio del rango (UTC)
+            end_time: Fin del rango (UTC)
+            aggregation_window: Ventana pedida (ej. "1m", "1h")
+            max_points: Si se indica, ensancha la ventana para no superar este
+                número de puntos por serie
+
+        Returns:
+            Diccionario con window, tier (o None para datos crudos) y cutoff
+        """
+        window = aggregation_window
+        window_seconds = parse_duration(window)
+        range_seconds = max((end_time - start_time).total_seconds(), 0)
+
+        if window_seconds and max_points and range_seconds / window_seconds > max_points:
+            needed = range_seconds / max_points
+            candidates = [t.every_seconds for t in self.rollup_tiers] + [
+                60,
+                300,
+                900,
+                3600,
+                21600,
+                86400,
+                604800,
+            ]
+            wider = sorted(
+                {s for s in candidates if s >= needed and s % window_seconds == 0}
+            )
+            # La ventana más fina que sirve algún nivel de rollup; si ninguno
+            # cubre el rango, la más fina que respeta el límite
+            widened = wider[0] if wider else int(needed)
+            for seconds in wider:
+                if self._select_tier(start_time, end_time, seconds) is not None:
+                    widened = seconds
+                    break
+            window_seconds = widened
+            window = format_duration(window_seconds)
+
+        plan = {"window": window, "tier": None, "cutoff": None}
+        if not window_seconds:
+            return plan
+        selected = self._select_tier(start_time, end_time, window_seconds)
+        if selected is not None:
+            plan["tier"], plan["cutoff"] = selected
+        return plan
+
+    def _select_tier(
+        self, start_time: datetime, end_time: datetime, window_seconds: int
+    ) -> Optional[Tuple[RollupTier, datetime]]:
+        """Nivel más grueso que sirve la ventana y el rango, con su cutoff"""
+        if not self.rollups_enabled:
+            return None
+
+        now = datetime.now(timezone.utc)
+        for tier in reversed(self.rollup_tiers):
+            if window_seconds % tier.every_seconds != 0:
+                continue
+            if tier.available_since is None or start_time < tier.available_since:
+                continue
+            if tier.retention_seconds and start_time < now - timedelta(
+                seconds=tier.retention_seconds
+            ):
+                continue
+
+            # Último instante seguro ya escrito por la tarea, alineado a la ventana
+            written_ts = (
+                int(now.timestamp()) - self.rollup_offset_seconds
+            ) // tier.every_seconds * tier.every_seconds - tier.every_seconds
+            cutoff_ts = written_ts // window_seconds * window_seconds
+            cutoff = datetime.fromtimestamp(cutoff_ts, timezone.utc)
+            if cutoff <= start_time:
+                continue
+            return tier, min(cutoff, end_time)
+        return None
+
+    def effective_window(
+        self, start_time: datetime, end_time: datetime, aggregation_window: str
+    ) -> str:
+        """
+        Ventana efectiva de una consulta histórica. Con INFLUXDB_MAX_POINTS
+        (opt-in, 0 = desactivado) los rangos largos se ensanchan, pero solo
+        si la ventana más ancha la sirve un nivel de rollup; si no, se
+        respeta la ventana pedida. Los endpoints informan la ventana usada.
+        """
+        if not self.max_points:
+            return aggregation_window
+        if start_time.tzinfo is None:
+            start_time = start_time.replace(tzinfo=timezone.utc)
+        if end_time.tzinfo is None:
+            end_time = end_time.replace(tzinfo=timezone.utc)
+        plan = self.plan_aggregation(
+            start_time, end_time, aggregation_window, max_points=self.max_points
+        )
+        if plan["tier"] is None:
+            return aggregation_window
+        return plan["window"]
+
+    def _aggregated_stream(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_filter: str,
+        aggregation_window: str,
+        merge_samples: bool = False,
+    ) -> Tuple[str, str]:
+        """
+        Construir el stream Flux agregado usando el plan de rollups.
+
+        Args:
+            merge_samples: Agrupar por micro_id antes de agregar, para obtener
+                una sola serie por micro en lugar de una por sensor_id
+
+        Returns:
+            Tupla (definiciones, expresión) para componer en una consulta
+        """
+        plan = self.plan_aggregation(start_time, end_time, aggregation_window)
+        window = plan["window"]
+        tier = plan["tier"]
+        regroup = '|> group(columns: ["micro_id"])' if merge_samples else ""
+
+        def raw_source(start: datetime, stop: datetime) -> str:
+            return f'''from(bucket: "{self.bucket}")
+          |> range(start: {start.isoformat()}, stop: {stop.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "sonido")
+          |> filter(fn: (r) => r["_field"] == "valor")
+          {micro_filter}
+          {regroup}
+          |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)'''
+
+        if tier is None:
+            return "", raw_source(start_time, end_time)
+
+        cutoff = plan["cutoff"]
+        logger.info(
+            f"Plan de consulta: rollup {tier.every} hasta {cutoff.isoformat()}, ventana={window}"
+        )
+
+        # La primera ventana puede empezar antes de start_time: ese tramo parcial
+        # se toma de los datos crudos para no incluir puntos fuera del rango
+        window_seconds = parse_duration(window)
+        head_ts = -(-int(start_time.timestamp()) // window_seconds) * window_seconds
+        head_end = min(datetime.fromtimestamp(head_ts, timezone.utc), cutoff)
+
+        sources = []
+        if head_end > start_time:
+            sources.append(("head", raw_source(start_time, head_end)))
+        if cutoff > head_end:
+            # Media ponderada por count: sum(mean*count)/sum(count) por ventana,
+            # igual a la media de los puntos crudos (no una media de medias)
+            sources.append(("rollup", f'''from(bucket: "{tier.bucket}")
+          |> range(start: {head_end.isoformat()}, stop: {cutoff.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "sonido")
+          |> filter(fn: (r) => r["_field"] == "mean" or r["_field"] == "count")
+          {micro_filter}
+          |> group(columns: ["micro_id"])
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> window(every: {window})
+          |> reduce(
+              identity: {{weighted: 0.0, n: 0.0}},
+              fn: (r, accumulator) => ({{
+                  weighted: accumulator.weighted + r.mean * r.count,
+                  n: accumulator.n + r.count,
+              }}),
+          )
+          |> filter(fn: (r) => r.n > 0.0)
+          |> map(fn: (r) => ({{
+              _time: r._stop,
+              _value: r.weighted / r.n,
+              micro_id: r.micro_id,
+          }}))
+          |> group(columns: ["micro_id"])'''))
+        if end_time > cutoff:
+            sources.append(("tail", raw_source(cutoff, end_time)))
+
+        if len(sources) == 1:
+            return "", sources[0][1]
+
+        # union() requiere al menos dos streams
+        definitions = "\n        ".join(f"{name} = {flux}" for name, flux in sources)
+        names = ", ".join(name for name, _ in sources)
+        return definitions, f"union(tables: [{names}])"
+
+    def _aggregated_flux(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_filter: str,
+        aggregation_window: str,
+    ) -> str:
+        """Construir la consulta Flux agregada usando el plan de rollups"""
+        definitions, stream = self._aggregated_stream(
+            start_time, end_time, micro_filter, aggregation_window
+        )
+        return f'''
+        {definitions}
+        {stream}
+          |> yield(name: "mean")
+        '''
+
     def query_historical_data(
         self,
         start_time: datetime,
@@ -49,6 +471,7 @@ class InfluxDBService:
         micro_ids: Optional[List[str]] = None,
         aggregation_window: str = "1m",
         limit: Optional[int] = None,
+        raise_errors: bool = False,
     ) -> List[Dict[str, Any]]:
         """
         Consultar datos históricos de InfluxDB.
@@ -60,14 +483,12 @@ class InfluxDBService:
             micro_ids: Lista de micro IDs a filtrar (default: todos)
             aggregation_window: Ventana de agregación (ej. "1m", "5m", "1h")
             limit: Límite máximo de registros a devolver (None = sin límite)
+            raise_errors: Propagar los errores de InfluxDB en lugar de
+                devolver una lista vacía (para distinguir "sin datos" de "falló")
 
         Returns:
             Lista de diccionarios con datos de sensores (sample=0 para todos)
         """
-        self._ensure_client()
-        if not self.query_api:
-            return []
-
         if end_time is None:
             end_time = datetime.now()
 
@@ -77,6 +498,229 @@ class InfluxDBService:
             start_time = start_time.replace(tzinfo=timezone.utc)
         if end_time.tzinfo is None:
             end_time = end_time.replace(tzinfo=timezone.utc)
+        aggregation_window = self.effective_window(start_time, end_time, aggregation_window)
+
+        # Alinear el rango a la ventana para que peticiones equivalentes
+        # compartan la misma entrada del cache
+        requested_end = end_time
+        start_time, end_time = query_cache.normalize_range(
+            start_time, end_time, aggregation_window
+        )
+        key = query_cache.make_key(
+            "historicos", start_time, end_time, micro_ids, aggregation_window, limit
+        )
+        ttl = query_cache.ttl_for(end_time)
+        # La clave usa el fin alineado; la consulta no pasa de ahora
+        end_time = query_cache.clamp_end(end_time, requested_end)
+
+        def compute():
+            if limit is None and self._should_fan_out(
+                start_time, end_time, micro_ids, aggregation_window
+            ):
+                # Un tramo fallido propaga su error: el resultado parcial no
+                # se devuelve ni se cachea
+                try:
+                    return list(
+                        self.iter_historical_data(
+                            start_time, end_time, micro_ids, aggregation_window
+                        )
+                    )
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    logger.error(f"Error en consulta histórica paralela: {e}")
+                    return []
+            return self._query_historical_data(
+                start_time, end_time, micro_ids, aggregation_window, limit,
+                raise_errors=raise_errors,
+            )
+
+        return query_cache.get_or_compute(key, ttl, compute)
+
+    # ------------------------------------------------------------------
+    # Fan-out paralelo
+    # ------------------------------------------------------------------
+
+    def _should_fan_out(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_ids: Optional[List[str]],
+        aggregation_window: str,
+    ) -> bool:
+        """Indicar si la consulta se divide en más de una sub-consulta"""
+        if self.max_concurrency <= 1:
+            return False
+        slices, groups = self._plan_fan_out(
+            start_time, end_time, micro_ids, aggregation_window
+        )
+        return len(slices) * len(groups) > 1
+
+    def _plan_fan_out(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_ids: Optional[List[str]],
+        aggregation_window: str,
+    ) -> Tuple[List[Tuple[datetime, datetime]], List[Optional[List[str]]]]:
+        """
+        Dividir la consulta en tramos de tiempo alineados a la ventana y en
+        grupos de micros.
+
+        Returns:
+            Tupla (tramos, grupos); un grupo None significa "todos los micros"
+        """
+        window_seconds = parse_duration(aggregation_window) or 60
+        slice_seconds = max(
+            window_seconds,
+            self.fanout_slice_seconds // window_seconds * window_seconds,
+        )
+
+        slices = []
+        slice_start = start_time
+        while slice_start < end_time:
+            boundary_ts = (
+                int(slice_start.timestamp()) // slice_seconds + 1
+            ) * slice_seconds
+            slice_end = min(datetime.fromtimestamp(boundary_ts, timezone.utc), end_time)
+            slices.append((slice_start, slice_end))
+            slice_start = slice_end
+
+        if micro_ids:
+            size = max(1, self.fanout_micros_per_group)
+            groups = [micro_ids[i : i + size] for i in range(0, len(micro_ids), size)]
+        else:
+            groups = [None]
+        return slices, groups
+
+    def _timed_slice(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_ids: Optional[List[str]],
+        aggregation_window: str,
+    ) -> List[Dict[str, Any]]:
+        """Ejecutar una sub-consulta (propagando errores) y registrar su duración"""
+        started = time.perf_counter()
+        rows = self._query_historical_data(
+            start_time, end_time, micro_ids, aggregation_window, None,
+            raise_errors=True,
+        )
+        rows.sort(key=lambda r: (r["time"], r["micro_id"]))
+        logger.info(
+            f"Tramo {start_time.isoformat()} -> {end_time.isoformat()} "
+            f"micros={micro_ids or 'todos'}: {len(rows)} registros en "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return rows
+
+    def iter_historical_data(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_ids: Optional[List[str]] = None,
+        aggregation_window: str = "1m",
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Consultar datos históricos dividiendo la petición en sub-consultas
+        concurrentes (pool acotado por INFLUXDB_MAX_CONCURRENCY) y devolverlos
+        en orden temporal a medida que se completan los tramos. Solo hay una
+        ventana acotada de tramos en vuelo (unas 2 x INFLUXDB_MAX_CONCURRENCY
+        sub-consultas), así la memoria no crece con la longitud del rango.
+        Si un tramo falla, el error se propaga al consumidor.
+
+        Args:
+            start_time: Tiempo de inicio (UTC)
+            end_time: Tiempo de fin (UTC)
+            micro_ids: Lista de micro IDs a filtrar (default: todos)
+            aggregation_window: Ventana de agregación
+
+        Yields:
+            Filas con el mismo formato que query_historical_data
+        """
+        if start_time.tzinfo is None:
+            start_time = start_time.replace(tzinfo=timezone.utc)
+        if end_time.tzinfo is None:
+            end_time = end_time.replace(tzinfo=timezone.utc)
+        aggregation_window = self.effective_window(start_time, end_time, aggregation_window)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, self.max_concurrency),
+                thread_name_prefix="influxdb-fanout",
+            )
+
+        slices, groups = self._plan_fan_out(
+            start_time, end_time, micro_ids, aggregation_window
+        )
+        logger.info(
+            f"Fan-out de consulta histórica: {len(slices)} tramos x {len(groups)} grupos"
+        )
+
+        # Mantener una ventana de tramos en el pool; consumir tramo a tramo
+        # para preservar el orden
+        started = time.perf_counter()
+        window = max(1, 2 * self.max_concurrency // len(groups))
+        remaining = iter(slices)
+        pending = deque()
+
+        def submit_next():
+            next_slice = next(remaining, None)
+            if next_slice is None:
+                return
+            slice_start, slice_end = next_slice
+            pending.append(
+                [
+                    self._executor.submit(
+                        self._timed_slice,
+                        slice_start,
+                        slice_end,
+                        group,
+                        aggregation_window,
+                    )
+                    for group in groups
+                ]
+            )
+
+        for _ in range(window):
+            submit_next()
+
+        total = 0
+        try:
+            while pending:
+                futures = pending.popleft()
+                submit_next()
+                parts = [future.result() for future in futures]
+                for row in heapq.merge(
+                    *parts, key=lambda r: (r["time"], r["micro_id"])
+                ):
+                    total += 1
+                    yield row
+        finally:
+            for futures in pending:
+                for future in futures:
+                    future.cancel()
+
+        logger.info(
+            f"Fan-out completado: {total} registros en "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def _query_historical_data(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_ids: Optional[List[str]],
+        aggregation_window: str,
+        limit: Optional[int],
+        raise_errors: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Ejecutar la consulta histórica agregada (sin cache)"""
+        self._ensure_client()
+        if not self.query_api:
+            if raise_errors:
+                raise ConnectionError("Cliente InfluxDB no disponible")
+            return []
 
         start_str = start_time.isoformat()
         end_str = end_time.isoformat()
@@ -94,15 +738,9 @@ class InfluxDBService:
             micro_filter = f"|> filter(fn: (r) => {micro_conditions})"
 
         # Consulta Flux (sin agrupar por sensor_id a nivel de Flux, lo haremos en Python)
-        query = f'''
-        from(bucket: "{self.bucket}")
-          |> range(start: {start_str}, stop: {end_str})
-          |> filter(fn: (r) => r["_measurement"] == "sonido")
-          |> filter(fn: (r) => r["_field"] == "valor")
-          {micro_filter}
-          |> aggregateWindow(every: {aggregation_window}, fn: mean, createEmpty: false)
-          |> yield(name: "mean")
-        '''
+        query = self._aggregated_flux(
+            start_time, end_time, micro_filter, aggregation_window
+        )
 
         logger.debug(f"Ejecutando consulta InfluxDB: {query[:200]}...")
 
@@ -157,6 +795,8 @@ class InfluxDBService:
 
         except Exception as e:
             logger.error(f"Error consultando InfluxDB: {e}")
+            if raise_errors:
+                raise
             return []
 
     def get_recent_data(self, hours: int = 5) -> List[Dict[str, Any]]:
@@ -175,12 +815,16 @@ class InfluxDBService:
         """
         Obtener estadísticas de un micro específico.
 
+        count/mean/min/max/std se calculan en InfluxDB sobre la serie agregada
+        (una sola pasada en el servidor); data_points es una vista previa
+        re-muestreada a como máximo STATISTICS_PREVIEW_POINTS puntos.
+
         Args:
             micro_id: ID del micro
             hours: Horas hacia atrás (usado si no se especifican start/end_time)
             start_time: Tiempo de inicio (None = ahora - hours)
             end_time: Tiempo de fin (None = ahora)
-            aggregation_window: Ventana de agregación para data_points
+            aggregation_window: Ventana de agregación para las estadísticas
         """
         if start_time is None:
             start_time = datetime.now() - timedelta(hours=hours)
@@ -192,36 +836,114 @@ class InfluxDBService:
             start_time = start_time.replace(tzinfo=timezone.utc)
         if end_time.tzinfo is None:
             end_time = end_time.replace(tzinfo=timezone.utc)
+        # Rangos largos (ej. 8760h a 1m) usan una ventana que sirve un rollup
+        aggregation_window = self.effective_window(start_time, end_time, aggregation_window)
+
+        requested_end = end_time
+        start_time, end_time = query_cache.normalize_range(
+            start_time, end_time, aggregation_window
+        )
+        key = query_cache.make_key(
+            "estadisticas", micro_id, start_time, end_time, aggregation_window
+        )
+        ttl = query_cache.ttl_for(end_time)
+        end_time = query_cache.clamp_end(end_time, requested_end)
+        return query_cache.get_or_compute(
+            key,
+            ttl,
+            lambda: self._get_sensor_statistics(
+                micro_id, start_time, end_time, aggregation_window
+            ),
+        )
 
+    def _get_sensor_statistics(
+        self,
+        micro_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        aggregation_window: str,
+    ) -> Dict[str, Any]:
+        """Calcular estadísticas y vista previa de un micro (sin cache)"""
+        stats = self._query_series_statistics(
+            micro_id, start_time, end_time, aggregation_window
+        )
+        if not stats or not stats.get("count"):
+            return {}
+
+        # Vista previa acotada: ensanchar la ventana para no superar el límite
+        preview_plan = self.plan_aggregation(
+            start_time,
+            end_time,
+            aggregation_window,
+            max_points=STATISTICS_PREVIEW_POINTS,
+        )
         data = self.query_historical_data(
             start_time=start_time,
             end_time=end_time,
             micro_ids=[micro_id],
-            aggregation_window=aggregation_window,
+            aggregation_window=preview_plan["window"],
         )
 
-        if not data:
-            return {}
-
-        values = [d["value"] for d in data if d.get("value") is not None]
-
-        if not values:
-            return {}
-
         return {
             "micro_id": micro_id,
             "sample": 0,
-            "count": len(values),
-            "mean": float(np.mean(values)),
-            "min": float(np.min(values)),
-            "max": float(np.max(values)),
-            "std": float(np.std(values)),
-            "data_points": data[:500],  # Limitar data_points
+            "count": int(stats["count"]),
+            "mean": float(stats["mean"]),
+            "min": float(stats["min"]),
+            "max": float(stats["max"]),
+            "std": float(stats["std"]),
+            "data_points": data[:STATISTICS_PREVIEW_POINTS],
             "start_time": start_time.isoformat(),
             "end_time": end_time.isoformat(),
             "aggregation_window": aggregation_window,
+            "preview_window": preview_plan["window"],
         }
 
+    def _query_series_statistics(
+        self,
+        micro_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        aggregation_window: str,
+    ) -> Dict[str, float]:
+        """
+        Calcular count/mean/min/max/std (poblacional) de la serie agregada de un
+        micro directamente en Flux, sin traer los puntos a Python.
+        """
+        self._ensure_client()
+        if not self.query_api:
+            return {}
+
+        micro_filter = f'|> filter(fn: (r) => r["micro_id"] == "{micro_id}")'
+        definitions, stream = self._aggregated_stream(
+            start_time, end_time, micro_filter, aggregation_window, merge_samples=True
+        )
+        query = f'''
+        {definitions}
+        series = {stream}
+          |> group()
+          |> keep(columns: ["_time", "_value"])
+
+        series |> count() |> yield(name: "count")
+        series |> mean() |> yield(name: "mean")
+        series |> min() |> yield(name: "min")
+        series |> max() |> yield(name: "max")
+        series |> stddev(mode: "population") |> yield(name: "std")
+        '''
+
+        try:
+            tables = self.query_api.query(query)
+            stats = {}
+            for table in tables:
+                for record in table.records:
+                    value = record.get_value()
+                    if value is not None:
+                        stats[record.values.get("result")] = float(value)
+            return stats
+        except Exception as e:
+            logger.error(f"Error calculando estadísticas en InfluxDB: {e}")
+            return {}
+
     def query_raw_data(
         self,
         start_time: datetime,
@@ -315,6 +1037,170 @@ class InfluxDBService:
             logger.error(f"Error consultando InfluxDB RAW: {e}")
             return []
 
+    def stream_records(
+        self,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        micro_ids: Optional[List[str]] = None,
+        aggregation_window: Optional[str] = None,
+        time_ordered: bool = False,
+        limit: Optional[int] = None,
+    ) -> Iterator[Tuple[datetime, str, int, float]]:
+        """
+        Recorrer registros directamente desde el cursor HTTP de InfluxDB, sin
+        materializar el resultado (memoria constante).
+
+        Con varios micros se reparten en como máximo INFLUXDB_MAX_CONCURRENCY
+        grupos, cada uno con un cursor ordenado por tiempo en el servidor, y se
+        combinan con heapq.merge: la salida queda en orden temporal global y
+        las conexiones abiertas no crecen con la cantidad de micros.
+
+        Args:
+            start_time: Tiempo de inicio
+            end_time: Tiempo de fin (default: ahora)
+            micro_ids: Lista de micro IDs a filtrar (default: todos)
+            aggregation_window: Si se indica, una serie por micro agregada con
+                esta ventana (sample=0); si no, datos crudos por sample
+            time_ordered: Ordenar globalmente por (_time, sensor_id) en el
+                servidor con una sola consulta (necesario para paginar con cursor)
+            limit: Máximo de registros (None = sin límite)
+
+        Yields:
+            Tuplas (time, micro_id, sample, value)
+        """
+        self._ensure_client()
+        if not self.query_api:
+            return
+
+        if end_time is None:
+            end_time = datetime.now()
+        if start_time.tzinfo is None:
+            start_time = start_time.replace(tzinfo=timezone.utc)
+        if end_time.tzinfo is None:
+            end_time = end_time.replace(tzinfo=timezone.utc)
+
+        logger.info(
+            f"Stream InfluxDB: {start_time.isoformat()} -> {end_time.isoformat()}, "
+            f"micro_ids={micro_ids}, window={aggregation_window}"
+        )
+
+        if time_ordered or (micro_ids and len(micro_ids) == 1):
+            yield from self._stream_query(
+                self._records_flux(
+                    start_time, end_time, micro_ids, aggregation_window, time_ordered, limit
+                ),
+                aggregation_window,
+            )
+            return
+
+        if micro_ids is None:
+            micro_ids = self._query_micro_ids(start_time, end_time)
+        if not micro_ids:
+            return
+        cursors = max(1, min(self.max_concurrency, len(micro_ids)))
+        size = -(-len(micro_ids) // cursors)
+        streams = [
+            self._stream_query(
+                self._records_flux(
+                    start_time,
+                    end_time,
+                    micro_ids[i : i + size],
+                    aggregation_window,
+                    True,
+                    limit,
+                ),
+                aggregation_window,
+            )
+            for i in range(0, len(micro_ids), size)
+        ]
+        merged = heapq.merge(*streams, key=lambda r: (r[0], r[1], r[2]))
+        if limit:
+            merged = islice(merged, limit)
+        yield from merged
+
+    def _records_flux(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        micro_ids: Optional[List[str]],
+        aggregation_window: Optional[str],
+        time_ordered: bool,
+        limit: Optional[int],
+    ) -> str:
+        """
+        Consulta Flux de stream_records: una tabla por micro ordenada por
+        tiempo, o con `time_ordered` una sola tabla ordenada por
+        (_time, micro_id, sensor_id)
+        """
+        micro_filter = ""
+        if micro_ids:
+            micro_conditions = " or ".join(
+                [f'r["micro_id"] == "{mid}"' for mid in micro_ids]
+            )
+            micro_filter = f"|> filter(fn: (r) => {micro_conditions})"
+
+        if aggregation_window:
+            shaping = f'''|> group(columns: ["micro_id"])
+          |> aggregateWindow(every: {aggregation_window}, fn: mean, createEmpty: false)'''
+            if time_ordered:
+                shaping += '''
+          |> group()
+          |> sort(columns: ["_time", "micro_id"], desc: false)'''
+        elif time_ordered:
+            shaping = '''|> group()
+          |> sort(columns: ["_time", "micro_id", "sensor_id"], desc: false)'''
+        else:
+            shaping = '''|> group(columns: ["micro_id"])
+          |> sort(columns: ["_time", "sensor_id"], desc: false)'''
+        if limit:
+            shaping += f"\n          |> limit(n: {limit})"
+
+        return f'''
+        from(bucket: "{self.bucket}")
+          |> range(start: {start_time.isoformat()}, stop: {end_time.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "sonido")
+          |> filter(fn: (r) => r["_field"] == "valor")
+          {micro_filter}
+          {shaping}
+        '''
+
+    def _stream_query(
+        self, query: str, aggregation_window: Optional[str]
+    ) -> Iterator[Tuple[datetime, str, int, float]]:
+        """Recorrer una consulta de stream_records como tuplas"""
+        for record in self.query_api.query_stream(query):
+            values = record.values
+            sample = 0
+            if not aggregation_window:
+                try:
+                    sample = int(values.get("sensor_id", 0))
+                except (TypeError, ValueError):
+                    pass
+            yield (
+                record.get_time(),
+                values.get("micro_id"),
+                sample,
+                float(record.get_value()),
+            )
+
+    def _query_micro_ids(self, start_time: datetime, end_time: datetime) -> List[str]:
+        """Micros con datos en el rango (valores del tag micro_id)"""
+        query = f'''
+        import "influxdata/influxdb/schema"
+        schema.tagValues(
+          bucket: "{self.bucket}",
+          tag: "micro_id",
+          predicate: (r) => r["_measurement"] == "sonido",
+          start: {start_time.isoformat()},
+          stop: {end_time.isoformat()}
+        )
+        '''
+        return sorted(
+            str(record.get_value())
+            for table in self.query_api.query(query)
+            for record in table.records
+        )
+
     def query_raw_data_paged(
         self,
         start_time: datetime,
@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+
+from app.utils.durations import parse_duration
+from app.utils.sensor_registry import sensor_registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """
+    Cache de resultados de consultas históricas/estadísticas.
+
+    Dos niveles: un LRU en proceso acotado por número de entradas y bytes, y
+    opcionalmente Redis (compartido entre réplicas). Las claves normalizan el
+    rango de tiempo a los límites de la ventana de agregación, de modo que
+    peticiones equivalentes de distintos dashboards comparten la misma entrada.
+    Las ventanas ya cerradas reciben un TTL largo y el tramo abierto ("ahora")
+    un TTL corto.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("QUERY_CACHE_ENABLED", "true").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        self.max_entries = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "256"))
+        self.max_bytes = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.closed_ttl = int(os.getenv("QUERY_CACHE_CLOSED_TTL", "86400"))
+        self.open_ttl = int(os.getenv("QUERY_CACHE_OPEN_TTL", "15"))
+
+        self.redis_url = os.getenv("QUERY_CACHE_REDIS_URL", os.getenv("REDIS_URL"))
+        self.redis_enabled = bool(self.redis_url) and os.getenv(
+            "QUERY_CACHE_REDIS", "true"
+        ).lower() in ("1", "true", "yes")
+        self._redis = None
+        self._redis_retry_at = 0.0
+
+        # clave -> (expira_en, tamaño_bytes, valor serializado)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "redis_hits": 0,
+            "redis_errors": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Claves y TTL
+    # ------------------------------------------------------------------
+
+    def normalize_range(
+        self, start_time: datetime, end_time: datetime, aggregation_window: str
+    ) -> Tuple[datetime, datetime]:
+        """
+        Alinear el rango a los límites de la ventana de agregación para la
+        clave del cache: el inicio se redondea hacia abajo y el fin hacia
+        arriba. Sin cache el rango no se modifica. Para consultar, el fin se
+        limita con clamp_end() para no pedir datos del futuro.
+        """
+        window_seconds = parse_duration(aggregation_window)
+        if not self.enabled or not window_seconds:
+            return start_time, end_time
+
+        start_ts = int(start_time.timestamp()) // window_seconds * window_seconds
+        end_ts = -(-int(end_time.timestamp()) // window_seconds) * window_seconds
+        return (
+            datetime.fromtimestamp(start_ts, timezone.utc),
+            datetime.fromtimestamp(end_ts, timezone.utc),
+        )
+
+    @staticmethod
+    def clamp_end(normalized_end: datetime, requested_end: datetime) -> datetime:
+        """Fin alineado sin pasar de ahora (salvo que se haya pedido un fin futuro)"""
+        limit = max(requested_end, datetime.now(timezone.utc))
+        return min(normalized_end, limit)
+
+    @staticmethod
+    def make_key(namespace: str, *parts: Any) -> str:
+        """Construir una clave estable a partir de los parámetros de la consulta"""
+        normalized = []
+        for part in parts:
+            if isinstance(part, datetime):
+                part = int(part.timestamp())
+            elif isinstance(part, (list, tuple, set)):
+                part = ",".join(sorted(str(p) for p in part))
+            normalized.append("" if part is None else str(part))
+        return f"{namespace}:" + "|".join(normalized)
+
+    def ttl_for(self, end_time: datetime) -> int:
+        """TTL largo si el rango ya está cerrado, corto si incluye el presente"""
+        if end_time.timestamp() <= time.time():
+            return self.closed_ttl
+        return self.open_ttl
+
+    # ------------------------------------------------------------------
+    # Acceso
+    # ------------------------------------------------------------------
+
+    def get_or_compute(self, key: str, ttl: int, compute: Callable[[], Any]) -> Any:
+        """
+        Devolver el valor cacheado para `key` o calcularlo con `compute`.
+        Los resultados vacíos no se cachean (pueden ser errores transitorios).
+        Cada acierto devuelve una copia nueva: el cache guarda el valor
+        serializado, así que un llamador que modifica las filas no lo altera.
+        """
+        if not self.enabled:
+            return compute()
+
+        found, payload = self._get_local(key)
+        if found:
+            self.metrics["hits"] += 1
+            return orjson.loads(payload)
+
+        found, value = self._get_redis(key)
+        if found:
+            self.metrics["redis_hits"] += 1
+            return value
+
+        self.metrics["misses"] += 1
+        value = compute()
+        if value:
+            self.set(key, value, ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: int):
+        """Guardar un valor en ambos niveles"""
+        payload = json.dumps(value, separators=(",", ":"), default=str)
+        expires_at = time.time() + ttl
+        self._set_local(key, payload, expires_at)
+        self._set_redis(key, payload, ttl)
+
+    def clear(self):
+        """
+        Vaciar el nivel local (Redis expira por TTL; al cambiar la
+        configuración de sensores sus claves cambian de prefijo)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de uso del cache"""
+        lookups = self.metrics["hits"] + self.metrics["redis_hits"] + self.metrics["misses"]
+        hit_rate = (
+            (self.metrics["hits"] + self.metrics["redis_hits"]) / lookups
+            if lookups
+            else 0.0
+        )
+        return {
+            **self.metrics,
+            "hit_rate": round(hit_rate, 4),
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "redis_enabled": self.redis_enabled,
+        }
+
+    # ------------------------------------------------------------------
+    # Nivel local (LRU)
+    # ------------------------------------------------------------------
+
+    def _get_local(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, size, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._bytes -= size
+                self.metrics["expired"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def _set_local(self, key: str, payload: str, expires_at: float):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (expires_at, size, payload)
+            self._bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.metrics["evictions"] += 1
+
+    # ------------------------------------------------------------------
+    # Nivel Redis (opcional)
+    # ------------------------------------------------------------------
+
+    def _get_client(self):
+        """Obtener cliente Redis, con reintento diferido si falló la conexión"""
+        if not self.redis_enabled or time.time() < self._redis_retry_at:
+            return None
+        if self._redis is None:
+            try:
+                import redis
+
+                self._redis = redis.Redis.from_url(
+                    self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5
+                )
+            except Exception as e:
+                logger.warning(f"Cache Redis no disponible: {e}")
+                self._redis_retry_at = time.time() + 30
+                return None
+        return self._redis
+
+    @staticmethod
+    def _redis_key(key: str) -> str:
+        # Los resultados incluyen coordenadas y nombres de la configuración de
+        # sensores: las claves en Redis llevan su huella para no servir
+        # entradas de otra configuración
+        return f"qc:{sensor_registry.snapshot.fingerprint}:{key}"
+
+    def _get_redis(self, key: str) -> Tuple[bool, Any]:
+        client = self._get_client()
+        if client is None:
+            return False, None
+        redis_key = self._redis_key(key)
+        try:
+            payload = client.get(redis_key)
+            ttl = client.ttl(redis_key)
+        except Exception as e:
+            self._redis_failure(e)
+            return False, None
+        if payload is None:
+            return False, None
+
+        value = json.loads(payload)
+        if ttl and ttl > 0:
+            self._set_local(key, payload, time.time() + ttl)
+        return True, value
+
+    def _set_redis(self, key: str, payload: str, ttl: int):
+        client = self._get_client()
+        if client is None:
+            return
+        try:
+            client.setex(self._redis_key(key), ttl, payload)
+        except Exception as e:
+            self._redis_failure(e)
+
+    def _redis_failure(self, error: Exception):
+        self.metrics["redis_errors"] += 1
+        self._redis_retry_at = time.time() + 30
+        logger.warning(f"Error en cache Redis, se reintentará en 30s: {error}")
+
+
+# Instancia global del cache de consultas
+query_cache = QueryCache()
+sensor_registry.subscribe(lambda snapshot: query_cache.clear())
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Historial de capacidad fija de un sensor respaldado por arreglos NumPy.
+
+    Guarda el valor (float32), el timestamp de la lectura (int64, segundos) y
+    el instante de recepción (int64, milisegundos). Agregar es O(1) sin copiar
+    y las ventanas recientes se obtienen como vistas sobre los arreglos.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("La capacidad debe ser al menos 1")
+        self.capacity = capacity
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.received_ms = np.zeros(capacity, dtype=np.int64)
+        self._next = 0  # posición de la próxima escritura
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, value: float, timestamp: int, received_ms: int):
+        index = self._next
+        self.values[index] = value
+        self.timestamps[index] = timestamp
+        self.received_ms[index] = received_ms
+        self._next = (index + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def _segments(self, limit: int) -> List[slice]:
+        """Tramos (a lo sumo dos) con los últimos `limit` registros en orden"""
+        count = min(max(limit, 0), self._size)
+        if count == 0:
+            return []
+        start = self._next - count
+        if start >= 0:
+            return [slice(start, self._next)]
+        return [slice(self.capacity + start, self.capacity), slice(0, self._next)]
+
+    def window(self, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Últimos `limit` (timestamps, valores) en orden cronológico. Son vistas
+        sin copia salvo cuando la ventana cruza el final del buffer.
+        """
+        segments = self._segments(limit)
+        if not segments:
+            return self.timestamps[:0], self.values[:0]
+        if len(segments) == 1:
+            return self.timestamps[segments[0]], self.values[segments[0]]
+        return (
+            np.concatenate([self.timestamps[s] for s in segments]),
+            np.concatenate([self.values[s] for s in segments]),
+        )
+
+    def to_records(self, limit: int) -> List[Dict[str, Any]]:
+        """Últimos registros como diccionarios (formato histórico del API)"""
+        records = []
+        for segment in self._segments(limit):
+            for value, timestamp, received in zip(
+                self.values[segment].tolist(),
+                self.timestamps[segment].tolist(),
+                self.received_ms[segment].tolist(),
+            ):
+                records.append(
+                    {
+                        # float32 -> float: redondear el ruido de precisión
+                        "value": round(value, 4),
+                        "timestamp": timestamp,
+                        "received_at": datetime.fromtimestamp(
+                            received / 1000
+                        ).isoformat(),
+                    }
+                )
+        return records
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Ubicaciones posibles de sensores.yaml (prioridad: Docker -> desarrollo local)
+CONFIG_PATHS = [
+    "/app/location/sensores.yaml",  # Docker (montado como volumen)
+    "./location/sensores.yaml",  # Desarrollo local
+    "../location/sensores.yaml",  # Desarrollo desde subdirectorio
+    "location/sensores.yaml",  # Desarrollo desde raíz
+]
+
+_SLOT_PATTERN = re.compile(r"(\d+)$")
+
+
+def micro_id_to_key(micro_id: str) -> str:
+    """Convertir micro_id del payload (ej. 'E1') a clave del YAML (ej. 'micro_E1')"""
+    if micro_id.startswith("micro_"):
+        return micro_id
+    return f"micro_{micro_id}"
+
+
+def normalize_config(config: Any, source: str = "sensores.yaml") -> Dict[str, Any]:
+    """
+    Validar y normalizar la configuración al formato 'microcontrollers'
+    (acepta también el formato 'sensores'). Lanza ValueError si no es válida.
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"{source}: se esperaba un diccionario en la raíz")
+
+    if "microcontrollers" in config:
+        normalized = dict(config)
+    elif "sensores" in config:
+        logger.info(
+            f"Convirtiendo formato 'sensores' a 'microcontrollers' desde {source}"
+        )
+        normalized = {"microcontrollers": {}}
+        for micro_key, micro_data in (config["sensores"] or {}).items():
+            normalized["microcontrollers"][micro_key] = {
+                "location": micro_data["ubicacion_base"],
+                "room": micro_data.get(
+                    "nombre_zona", f"Zona - {micro_key.replace('micro_', '')}"
+                ),
+                "coordinates_type": micro_data.get("coordinates_type", "relative"),
+            }
+        if "floor_plan" in config:
+            normalized["floor_plan"] = config["floor_plan"]
+    else:
+        raise ValueError(f"{source}: formato desconocido (falta 'microcontrollers')")
+
+    micros = normalized.get("microcontrollers") or {}
+    if not isinstance(micros, dict):
+        raise ValueError(f"{source}: 'microcontrollers' debe ser un diccionario")
+    for micro_key, micro_config in micros.items():
+        location = (micro_config or {}).get("location")
+        if (
+            not isinstance(location, (list, tuple))
+            or len(location) != 2
+            or not all(isinstance(v, (int, float)) for v in location)
+        ):
+            raise ValueError(
+                f"{source}: {micro_key}.location debe ser [x, y] numérico"
+            )
+    normalized["microcontrollers"] = micros
+    return normalized
+
+
+def _build_entry(micro_key: str, micro_config: Dict[str, Any]) -> Mapping[str, Any]:
+    micro_id = micro_key.replace("micro_", "")
+    location_name = micro_config.get("room", f"Zona - {micro_id}")
+    if micro_config.get("coordinates_type", "relative") == "relative":
+        # location = [x, y] en baldosas; el frontend espera latitude = y,
+        # longitude = x con (0,0) en la esquina inferior derecha
+        x, y = micro_config["location"]
+        latitude, longitude = float(y), float(x)
+    else:
+        # Coordenadas GPS tradicionales
+        latitude, longitude = (float(v) for v in micro_config["location"])
+    return MappingProxyType(
+        {
+            "micro_id": micro_id,
+            "micro_name": micro_key,
+            "sensor_id": micro_id,
+            "sample": 0,
+            "latitude": latitude,
+            "longitude": longitude,
+            "location_name": location_name,
+            "base_latitude": latitude,
+            "base_longitude": longitude,
+        }
+    )
+
+
+class RegistrySnapshot:
+    """
+    Configuración de sensores inmutable en una versión: índices por micro_id
+    ('E1'), por clave del YAML ('micro_E1') y por slot numérico (1), más la
+    sección floor_plan. Se reemplaza entera al recargar; nunca se modifica.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        config: Dict[str, Any],
+        path: Optional[str] = None,
+        mtime_ns: int = 0,
+    ):
+        self.version = version
+        self.config = config
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.base_dir = os.path.dirname(os.path.abspath(path)) if path else None
+        self.floor_plan: Optional[Dict[str, Any]] = config.get("floor_plan")
+        # Huella del contenido: igual en todas las réplicas con el mismo archivo
+        self.fingerprint = hashlib.blake2b(
+            json.dumps(config, sort_keys=True, default=str).encode("utf-8"),
+            digest_size=6,
+        ).hexdigest()
+
+        by_micro_id: Dict[str, Mapping[str, Any]] = {}
+        by_slot: Dict[int, Mapping[str, Any]] = {}
+        for micro_key, micro_config in config["microcontrollers"].items():
+            entry = _build_entry(micro_key, micro_config)
+            by_micro_id[entry["micro_id"]] = entry
+            match = _SLOT_PATTERN.search(entry["micro_id"])
+            if match:
+                slot = int(match.group(1))
+                if slot in by_slot:
+                    logger.warning(
+                        f"Slot {slot} repetido ({by_slot[slot]['micro_id']} y "
+                        f"{entry['micro_id']}), se conserva el primero"
+                    )
+                else:
+                    by_slot[slot] = entry
+        self.by_micro_id: Mapping[str, Mapping[str, Any]] = MappingProxyType(
+            by_micro_id
+        )
+        self.by_slot: Mapping[int, Mapping[str, Any]] = MappingProxyType(by_slot)
+
+    def __len__(self) -> int:
+        return len(self.by_micro_id)
+
+    def get(self, micro_id: str) -> Optional[Mapping[str, Any]]:
+        """Entrada de un micro por 'E1' o 'micro_E1'"""
+        if micro_id.startswith("micro_"):
+            micro_id = micro_id[len("micro_"):]
+        return self.by_micro_id.get(micro_id)
+
+
+class SensorRegistry:
+    """
+    Registro de la configuración de sensores (location/sensores.yaml).
+
+    El archivo se busca y se lee una sola vez; después solo se vuelve a leer
+    si cambia su mtime (revisado por una tarea asyncio cada
+    SENSORS_CONFIG_POLL_SECONDS). Cada carga válida publica una instantánea
+    inmutable con una versión nueva, que los caches e interpoladores usan
+    como parte de sus claves. Una carga inválida se descarta y se conserva
+    la anterior.
+    """
+
+    def __init__(self):
+        self.configured_path = os.getenv("SENSORS_CONFIG_PATH")
+        self.poll_interval = float(os.getenv("SENSORS_CONFIG_POLL_SECONDS", "2"))
+        self._snapshot: Optional[RegistrySnapshot] = None
+        self._listeners: List[Callable[[RegistrySnapshot], None]] = []
+        self._lock = threading.Lock()
+        # (ruta, mtime) de la última versión rechazada: no se relee hasta
+        # que el archivo vuelva a cambiar
+        self._rejected: Optional[Tuple[str, int]] = None
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        """Instantánea vigente (se carga la primera vez que se pide)"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load_initial()
+                snapshot = self._snapshot
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    def _candidate_paths(self) -> List[str]:
+        if self.configured_path:
+            return [self.configured_path]
+        return CONFIG_PATHS
+
+    def _find_path(self) -> Optional[str]:
+        for path in self._candidate_paths():
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _read(self, path: str) -> Tuple[Dict[str, Any], int]:
+        """Leer, parsear y validar el archivo (lanza excepción si no es válido)"""
+        mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, "r") as file:
+            config = yaml.safe_load(file)
+        config = normalize_config(config, path)
+        if config.get("floor_plan"):
+            from app.utils.floor_plan import FloorPlan
+
+            try:
+                FloorPlan(config["floor_plan"], os.path.dirname(os.path.abspath(path)))
+            except Exception as e:
+                raise ValueError(f"{path}: floor_plan inválido: {e}")
+        return config, mtime_ns
+
+    def _load_initial(self) -> RegistrySnapshot:
+        path = self._find_path()
+        if path is None:
+            logger.error(
+                "No se pudo cargar configuración de sensores desde ninguna ubicación"
+            )
+            return RegistrySnapshot(1, {"microcontrollers": {}})
+        try:
+            config, mtime_ns = self._read(path)
+        except Exception as e:
+            logger.error(f"Error cargando configuración desde {path}: {e}")
+            return RegistrySnapshot(1, {"microcontrollers": {}}, path)
+        logger.info(f"Configuración de sensores cargada desde {path}")
+        return RegistrySnapshot(1, config, path, mtime_ns)
+
+    def _changed_path(self) -> Optional[str]:
+        """Ruta a releer si el archivo cambió (o apareció) desde la última carga"""
+        current = self.snapshot
+        path = current.path if current.path and os.path.isfile(current.path) else None
+        path = path or self._find_path()
+        if path is None:
+            return None
+        mtime_ns = os.stat(path).st_mtime_ns
+        if (path, mtime_ns) == self._rejected:
+            return None
+        if path != current.path or mtime_ns != current.mtime_ns:
+            return path
+        return None
+
+    def read_candidate(self, force: bool = False) -> Optional[RegistrySnapshot]:
+        """
+        Leer y validar el archivo si cambió (o siempre con force) sin
+        instalarlo. Pensado para correr en un thread: la instalación se hace
+        después en el event loop con install(). Devuelve None si no hay nada
+        que recargar y lanza la excepción de validación si no es válido.
+        """
+        if force:
+            path = self.snapshot.path
+            if not path or not os.path.isfile(path):
+                path = self._find_path()
+        else:
+            path = self._changed_path()
+        if path is None:
+            return None
+
+        try:
+            config, mtime_ns = self._read(path)
+        except Exception:
+            self._rejected = (path, os.stat(path).st_mtime_ns)
+            raise
+        # La versión se asigna al instalarla
+        return RegistrySnapshot(0, config, path, mtime_ns)
+
+    def install(self, candidate: RegistrySnapshot) -> RegistrySnapshot:
+        """
+        Publicar una configuración validada con una versión nueva (cambio
+        atómico de la instantánea) y notificar a los suscriptores en el mismo
+        paso, para que invaliden sus caches antes de que se calcule nada con
+        la configuración nueva.
+        """
+        with self._lock:
+            candidate.version = self.snapshot.version + 1
+            self._snapshot = candidate
+        logger.info(
+            f"Configuración de sensores recargada desde {candidate.path} "
+            f"(versión {candidate.version}, {len(candidate)} micros)"
+        )
+        for listener in list(self._listeners):
+            try:
+                listener(candidate)
+            except Exception as e:
+                logger.error(f"Error notificando recarga de configuración: {e}")
+        return candidate
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Releer el archivo si cambió (o siempre con force) e instalarlo.
+        Devuelve True si se instaló una configuración nueva.
+        """
+        candidate = self.read_candidate(force)
+        if candidate is None:
+            return False
+        self.install(candidate)
+        return True
+
+    def subscribe(self, listener: Callable[[RegistrySnapshot], None]):
+        """
+        Registrar un callback (síncrono) que recibe cada instantánea nueva.
+        Se llama en el hilo que instala la configuración, normalmente el
+        event loop.
+        """
+        self._listeners.append(listener)
+
+    async def watch(self):
+        """Revisar el mtime periódicamente y recargar solo si cambió"""
+        while True:
+            try:
+                await asyncio.sleep(self.poll_interval)
+                if self._changed_path() is None:
+                    continue
+                # Leer y validar fuera del loop; instalar dentro de él
+                candidate = await asyncio.to_thread(self.read_candidate)
+                if candidate is not None:
+                    self.install(candidate)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(
+                    f"Configuración de sensores inválida, se conserva la anterior: {e}"
+                )
+
+
+# Instancia global del registro de sensores
+sensor_registry = SensorRegistry()
@@ -2,7 +2,7 @@ import asyncio
 import json
 import logging
 from datetime import datetime
-from typing import List, Set
+from typing import Any, Dict, List, Set
 
 from fastapi import WebSocket
 
@@ -38,14 +38,8 @@ class WebSocketManager:
     async def send_current_state(self, websocket: WebSocket):
         """Enviar estado actual a un cliente específico"""
         try:
-            state = data_service.get_current_state()
-            await websocket.send_json(
-                {
-                    "type": "full_update",
-                    "data": state,
-                    "timestamp": datetime.now().isoformat(),
-                }
-            )
+            snapshot = data_service.get_snapshot()
+            await websocket.send_text(snapshot.message_text("full_update"))
         except Exception as e:
             logger.error(f"Error enviando estado a WebSocket: {e}")
 
@@ -55,14 +49,8 @@ class WebSocketManager:
             return
 
         try:
-            state = data_service.get_current_state()
-            message = json.dumps(
-                {
-                    "type": "update",
-                    "data": state,
-                    "timestamp": datetime.now().isoformat(),
-                }
-            )
+            # El mensaje se serializa una vez por versión del estado
+            message = data_service.get_snapshot().message_text("update")
 
             # Enviar a todas las conexiones
             tasks = []
@@ -79,6 +67,22 @@ class WebSocketManager:
         except Exception as e:
             logger.error(f"Error en broadcast: {e}")
 
+    async def broadcast_sensor_status(self, event: Dict[str, Any]):
+        """Transmitir un cambio de estado online/offline de un sensor"""
+        if not self.active_connections:
+            return
+        message = json.dumps(
+            {
+                "type": "sensor_status",
+                "data": event,
+                "timestamp": datetime.now().isoformat(),
+            }
+        )
+        await asyncio.gather(
+            *(connection.send_text(message) for connection in self.active_connections),
+            return_exceptions=True,
+        )
+
     async def start_periodic_broadcast(self, interval: int = 2):
         """Iniciar broadcast periódico (para mantener actualizaciones regulares)"""
         while True:
@@ -94,3 +98,4 @@ class WebSocketManager:
 
 # Instancia global del gestor WebSocket
 websocket_manager = WebSocketManager()
+data_service.on_sensor_status(websocket_manager.broadcast_sensor_status)
@@ -1,5 +1,4 @@
 import asyncio
-import json
 import logging
 from datetime import datetime
 import socketio
@@ -42,12 +41,8 @@ class SocketIOManager:
             return
         
         try:
-            state = data_service.get_current_state()
-            message = {
-                "type": "update",
-                "data": state,
-                "timestamp": datetime.now().isoformat()
-            }
+            # Payload compartido de la instantánea actual
+            message = data_service.get_snapshot().socketio_payload("update")
             
             # Enviar a todos los clientes
             await sio.emit('update', message)
@@ -67,11 +62,8 @@ async def connect(sid, environ):
     
     # Enviar estado inicial
     try:
-        state = data_service.get_current_state()
-        await sio.emit('full_update', {
-            "data": state,
-            "timestamp": datetime.now().isoformat()
-        }, room=sid)
+        snapshot = data_service.get_snapshot()
+        await sio.emit('full_update', snapshot.socketio_payload("full_update"), room=sid)
     except Exception as e:
         logger.error(f"Error enviando estado inicial a {sid}: {e}")
 
@@ -0,0 +1,75 @@
+"""
+Benchmark: parseo de mensajes MQTT (parse_mqtt_payload, la parte de la
+ingesta que hacen los workers de `python -m app.ingest`) con 1..N procesos,
+para ver cómo escala el throughput con los núcleos.
+
+Cada mensaje imita un gateway con varios micros y samples. No hace falta
+broker: se mide solo el trabajo de CPU que cada proceso hace por mensaje.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_ingest --messages 20000 --processes 1 2 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import time
+
+from app.mqtt.handler import parse_mqtt_payload
+
+
+def make_payloads(count, micros, samples):
+    payloads = []
+    for n in range(count):
+        sensors = [
+            {"micro_id": f"E{m}", "value": 40.0 + (n + m + s) % 30, "sample": s}
+            for m in range(micros)
+            for s in range(1, samples + 1)
+        ]
+        payloads.append(
+            json.dumps({"message_id": f"gw_{n}", "timestamp": n, "sensors": sensors})
+        )
+    return payloads
+
+
+def _parse_all(payloads):
+    # Sin el log INFO por mensaje, que dominaría la medición
+    logging.disable(logging.INFO)
+    for payload in payloads:
+        parse_mqtt_payload(payload)
+    return len(payloads)
+
+
+def bench(payloads, processes):
+    chunks = [payloads[i::processes] for i in range(processes)]
+    started = time.perf_counter()
+    if processes == 1:
+        _parse_all(payloads)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(_parse_all, chunks)
+    elapsed = time.perf_counter() - started
+    print(
+        f"  {processes:2d} procesos  {elapsed * 1e3:9.1f} ms  "
+        f"{len(payloads) / elapsed:10.0f} mensajes/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--micros", type=int, default=8)
+    parser.add_argument("--samples", type=int, default=4)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.messages, args.micros, args.samples)
+    print(
+        f"{args.messages} mensajes, {args.micros} micros x {args.samples} samples"
+    )
+    for processes in args.processes:
+        bench(payloads, processes)
+
+
+if __name__ == "__main__":
+    main()
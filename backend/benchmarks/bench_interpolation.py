@@ -0,0 +1,82 @@
+"""
+Benchmark: interpoladores de app/services/interpolation.py (IDW global, IDW
+con k vecinos, RBF y kriging ordinario) con distintas cantidades de sensores
+y tamaños de grilla.
+
+El campo real es la suma de energía de dos fuentes con el modelo de
+atenuación, así que además del tiempo se mide el error (RMSE en dB) contra
+el campo verdadero en la grilla. "primer ciclo" incluye lo que se cachea por
+layout (árbol KD, factorizaciones); "ciclo" es el costo con el layout ya
+preparado y lecturas nuevas.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_interpolation --sensors 9 100 1000 --grids 50 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.interpolation import METHODS, _build
+from app.utils.epicentro import DEFAULT_ALPHA, _path_loss
+from app.utils.floor_plan import FLOOR_X_MAX, FLOOR_X_MIN, FLOOR_Y_MAX, FLOOR_Y_MIN
+
+SOURCES = np.array([[15.0, 20.0, 92.0], [42.0, 50.0, 85.0]])
+
+
+def true_field(x, y):
+    """Nivel (dB) de las dos fuentes sumadas en energía"""
+    energy = np.zeros(np.shape(x))
+    for sx, sy, level in SOURCES:
+        dist = np.hypot(x - sx, y - sy)
+        energy += 10 ** ((level - _path_loss(dist, DEFAULT_ALPHA)) / 10)
+    return 10 * np.log10(energy)
+
+
+def bench(method, x, y, readings, xi, yi, truth):
+    interpolator = _build(method)
+    started = time.perf_counter()
+    zi = interpolator.interpolate(x, y, readings[0], xi, yi)
+    first = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for z in readings[1:]:
+        zi = interpolator.interpolate(x, y, z, xi, yi)
+    per_tick = (time.perf_counter() - started) / (len(readings) - 1)
+
+    rmse = float(np.sqrt(np.mean((zi - truth) ** 2)))
+    print(
+        f"  {method:8s} primer ciclo {first * 1e3:9.2f} ms  "
+        f"ciclo {per_tick * 1e3:8.2f} ms  RMSE {rmse:6.2f} dB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensors", type=int, nargs="+", default=[9, 100, 1000])
+    parser.add_argument("--grids", type=int, nargs="+", default=[50, 100])
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--methods", nargs="+", default=list(METHODS))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    for count in args.sensors:
+        x = rng.uniform(FLOOR_X_MIN, FLOOR_X_MAX, count)
+        y = rng.uniform(FLOOR_Y_MIN, FLOOR_Y_MAX, count)
+        base = true_field(x, y)
+        # Lecturas sucesivas: mismo layout, ruido de medición de ~1 dB
+        readings = [base + rng.normal(0.0, 1.0, count) for _ in range(args.ticks + 1)]
+
+        for size in args.grids:
+            xi, yi = np.meshgrid(
+                np.linspace(FLOOR_X_MIN, FLOOR_X_MAX, size),
+                np.linspace(FLOOR_Y_MIN, FLOOR_Y_MAX, size),
+            )
+            truth = true_field(xi, yi)
+            print(f"{count} sensores, grilla {size}x{size}")
+            for method in args.methods:
+                bench(method, x, y, readings, xi, yi, truth)
+
+
+if __name__ == "__main__":
+    main()
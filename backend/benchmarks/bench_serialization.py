@@ -0,0 +1,78 @@
+"""
+Benchmark: serialización de filas históricas con Pydantic vs orjson directo.
+
+Compara el camino anterior de /historicos (un HistoricalData por fila más la
+validación/serialización del response_model por FastAPI) con json_response.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_serialization --rows 100000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.responses import json_response
+from app.api.schemas import HistoricalData
+
+
+def make_rows(count: int):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "time": (start + timedelta(minutes=i)).isoformat(),
+            "micro_id": f"E{i % 9 + 1}",
+            "sensor_id": f"E{i % 9 + 1}",
+            "sample": 0,
+            "measurement": "sonido",
+            "value": 40.0 + (i % 300) / 10,
+            "location_name": "Centro",
+            "latitude": 40.0,
+            "longitude": 23.0,
+        }
+        for i in range(count)
+    ]
+
+
+async def pydantic_path(rows, field):
+    models = [HistoricalData(**item) for item in rows]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+
+def orjson_path(rows):
+    return json_response(rows).body
+
+
+def main():
+    import asyncio
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    field = create_response_field(name="response", type_=List[HistoricalData])
+
+    for name, run in (
+        ("pydantic + response_model", lambda: asyncio.run(pydantic_path(rows, field))),
+        ("orjson directo", lambda: orjson_path(rows)),
+    ):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            body = run()
+            timings.append(time.perf_counter() - started)
+        print(
+            f"{name:28s} {min(timings) * 1000:9.1f} ms  "
+            f"({len(body) / 1e6:.1f} MB, {args.rows} filas)"
+        )
+
+
+if __name__ == "__main__":
+    main()